@@ -0,0 +1,454 @@
+import pandas as pd
+import numpy as np
+
+# Vectorised primitives of the TM alert scenarios defined in alert_scenarios.json.
+#
+# The transactions are sorted once by customer/card and time, and the scenarios are
+# answered with grouped counts, window lookups and location comparisons on those sorted
+# arrays instead of re-filtering the whole DataFrame for each transaction; alert_rules
+# compiles the scenarios into a plan of these primitives. The output matches the
+# row-by-row loop in alert_generator.generate_alerts alert for alert.
+
+ALERT_TYPES = {
+    1: "High Transaction Volume",
+    2: "High Transaction Amount",
+    3: "Unusual Transaction Patterns",
+    4: "Frequent International Transactions",
+    5: "Rapid Consecutive Transactions",
+    6: "Location Mismatch",
+}
+
+SCENARIO_KEYS = {
+    1: "high_transaction_volume",
+    2: "high_transaction_amount",
+    3: "unusual_transaction_patterns",
+    4: "frequent_international_transactions",
+    5: "rapid_consecutive_transactions",
+    6: "location_mismatch",
+}
+
+# Scenarios that report the card of the offending transaction
+CARD_SCENARIOS = {1, 2, 5, 6}
+
+# Entity levels of entity_aggregates and the prepare_transactions arrays they are keyed by;
+# day levels only cover rows with a timestamp
+AGGREGATE_LEVELS = {
+    "customer": ("customer_codes",),
+    "card_day": ("card_codes", "date_ns"),
+    "customer_day": ("customer_codes", "date_ns"),
+}
+
+# Columns of an alerts frame before the extra columns of build_alerts_frame
+ALERT_COLUMNS = ["alert_id", "customer_id", "card_id", "alert_type", "crime_type", "details"]
+
+# Transactions counted by time windows: all of them, or only the international or domestic ones
+WINDOW_EVENTS = ("all", "international", "domestic")
+
+# Upper bound on the number of pairwise distances evaluated at once for location_mismatch
+PAIR_BLOCK_SIZE = 1_000_000
+
+# Number of candidate transactions compared in the first location_mismatch pass; later passes,
+# for the transactions without a match yet, double it
+FIRST_CANDIDATE_BLOCK = 32
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Haversine distance in kilometers, element-wise over scalars or broadcastable arrays."""
+    R = 6371  # Earth radius in kilometers
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
+
+
+def _grouped_searchsorted(codes, times, query_codes, query_times, side="left"):
+    """
+    Vectorised ``np.searchsorted`` over an array sorted by (group code, time).
+
+    Returns, for each query, the insertion position of (query_code, query_time) into the
+    sorted (codes, times) arrays, so positions can be compared against group boundaries.
+    """
+    n = len(codes)
+    all_codes = np.concatenate([codes, query_codes])
+    all_times = np.concatenate([times, query_times])
+    is_query = np.zeros(n + len(query_codes), dtype=bool)
+    is_query[n:] = True
+
+    # On equal times, 'left' places queries before events and 'right' after them
+    tie_break = is_query if side == "right" else ~is_query
+    order = np.lexsort((tie_break, all_times, all_codes))
+    events_before = np.cumsum(~is_query[order])
+
+    query_mask = is_query[order]
+    positions = np.empty(len(query_codes), dtype=np.int64)
+    positions[order[query_mask] - n] = events_before[query_mask]
+    return positions
+
+
+def _to_ns(values):
+    """Convert a datetime64 array to int64 nanoseconds since the epoch."""
+    return np.asarray(values).astype("datetime64[ns]").view("int64")
+
+
+def transaction_times(times):
+    """
+    Timestamps of a transaction_date_time column as int64 nanoseconds (UTC for timezone-aware
+    ones), the calendar date of each in the timestamps' own timezone, as used by ``.dt.date``,
+    and the mask of missing timestamps.
+
+    Returns:
+        tuple: (time_ns, date_ns, time_missing) arrays.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = pd.to_datetime(times)
+    time_missing = times.isna().to_numpy()
+    dates = times.dt.normalize()
+    if isinstance(times.dtype, pd.DatetimeTZDtype):
+        times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+        dates = dates.dt.tz_convert("UTC").dt.tz_localize(None)
+    return _to_ns(times.to_numpy()), _to_ns(dates.to_numpy()), time_missing
+
+
+def prepare_transactions(transactions):
+    """
+    Sort the transactions once by customer and time and collect the arrays shared by all scenarios.
+
+    Args:
+        transactions (pd.DataFrame): Transactions with the columns used by alert_generator.
+
+    Returns:
+        dict: Per-row arrays in the original row order plus the (customer, time) sort order.
+    """
+    time_ns, date_ns, time_missing = transaction_times(transactions['transaction_date_time'])
+
+    customer_codes, _ = pd.factorize(transactions['customer_id'])
+    card_codes, _ = pd.factorize(transactions['card_id'])
+
+    # Columns only read by disabled scenarios may have been left out when loading (see
+    # ingestion.required_columns); they are treated as missing values
+    for name in ("transaction_amount", "currency", "merchant_country"):
+        if name not in transactions:
+            transactions = transactions.assign(**{name: pd.Series(np.nan, index=transactions.index)})
+
+    latitude = pd.to_numeric(transactions['latitude']).to_numpy(dtype=float)
+    longitude = pd.to_numeric(transactions['longitude']).to_numpy(dtype=float)
+    domestic = (transactions['merchant_country'] == 'UK').fillna(False).to_numpy(dtype=bool)
+
+    # Rows that can take part in time windows: known customer and timestamp
+    in_windows = (customer_codes >= 0) & ~time_missing
+    window_rows = np.flatnonzero(in_windows)
+    window_rows = window_rows[np.lexsort((time_ns[window_rows], customer_codes[window_rows]))]
+
+    n = len(transactions)
+    return {
+        "index": transactions.index,
+        "customer_id": transactions['customer_id'],
+        "card_id": transactions['card_id'],
+        "transaction_date_time": transactions['transaction_date_time'],
+        "transaction_amount": transactions['transaction_amount'],
+        "currency": transactions['currency'],
+        "merchant_country": transactions['merchant_country'],
+        "customer_codes": customer_codes,
+        "card_codes": card_codes,
+        "time_ns": time_ns,
+        "date_ns": date_ns,
+        "time_missing": time_missing,
+        "latitude": latitude,
+        "longitude": longitude,
+        "domestic": domestic,
+        "has_location": ~(np.isnan(latitude) | np.isnan(longitude)),
+        "window_rows": window_rows,
+        # Incremental mode (see alert_state): rows carried over from earlier batches, which are
+        # only used as window context, and the daily card and per-customer counts of the rows
+        # of earlier batches that are no longer in the frame
+        "history": np.zeros(n, dtype=bool),
+        "card_day_base": np.zeros(n, dtype=np.int64),
+        "customer_total_base": np.zeros(n, dtype=np.int64),
+        "customer_domestic_base": np.zeros(n, dtype=np.int64),
+    }
+
+
+def entity_aggregates(prepared, level):
+    """
+    Transaction counts of every customer, card-day or customer-day of the frame, shared by the
+    scenarios and the narratives.
+
+    The table of a level is built with one groupby the first time it is asked for and cached in
+    ``prepared``, together with the position of each row's entity in it (-1 for rows without
+    the entity's keys). Rows carried over from earlier batches are not counted; their counts
+    are in the ``*_base`` arrays.
+
+    Args:
+        prepared (dict): Output of prepare_transactions.
+        level (str): One of AGGREGATE_LEVELS.
+
+    Returns:
+        tuple: (pd.DataFrame indexed by the level's key codes with transaction_count,
+            domestic_count and international_count columns, per-row positions in it).
+    """
+    cache = prepared.setdefault("aggregates", {})
+    if level not in cache:
+        keys = AGGREGATE_LEVELS[level]
+        counted = ~prepared["history"]
+        for key in keys:
+            counted &= prepared[key] >= 0 if key.endswith("_codes") else ~prepared["time_missing"]
+        grouped = pd.DataFrame(
+            {key: prepared[key][counted] for key in keys} | {"domestic_count": prepared["domestic"][counted]}
+        ).groupby(list(keys), sort=True)
+        table = grouped.agg(
+            transaction_count=("domestic_count", "size"), domestic_count=("domestic_count", "sum")
+        ).astype(np.int64)
+        table["international_count"] = table["transaction_count"] - table["domestic_count"]
+        positions = np.full(len(counted), -1, dtype=np.int64)
+        positions[counted] = grouped.ngroup().to_numpy()
+        cache[level] = table, positions
+    return cache[level]
+
+
+def join_aggregate(prepared, level, column, rows):
+    """Value of an entity_aggregates column for each of rows, 0 for rows without the entity's keys."""
+    table, positions = entity_aggregates(prepared, level)
+    values = np.zeros(len(rows), dtype=np.int64)
+    row_positions = positions[rows]
+    keyed = row_positions >= 0
+    values[keyed] = table[column].to_numpy()[row_positions[keyed]]
+    return values
+
+
+def window_events(prepared, events="all"):
+    """
+    The transactions a time window of the given WINDOW_EVENTS kind counts, sorted by customer and
+    time, as (rows, customer codes, times); built once per kind and cached in ``prepared``.
+    """
+    cache = prepared.setdefault("window_events", {})
+    if events not in cache:
+        if events not in WINDOW_EVENTS:
+            raise ValueError(f"window events must be one of {WINDOW_EVENTS}, not {events!r}")
+        rows = prepared["window_rows"]
+        if events != "all":
+            domestic = prepared["domestic"][rows]
+            rows = rows[domestic if events == "domestic" else ~domestic]
+        cache[events] = rows, prepared["customer_codes"][rows], prepared["time_ns"][rows]
+    return cache[events]
+
+
+def window_queries(prepared, rows):
+    """The rows that can be placed in a time window: known customer and timestamp."""
+    return rows[(prepared["customer_codes"][rows] >= 0) & ~prepared["time_missing"][rows]]
+
+
+def window_positions(prepared, queries, offset_ns, side="left", events="all"):
+    """
+    Position of each query's time + offset_ns among the same-customer window_events.
+
+    With side="left" an event at exactly that time comes after the position, with "right"
+    before it; offset_ns=None gives the end of the customer's events (an open-ended window).
+    The difference of two positions is the number of the customer's events between them.
+    """
+    _, event_codes, event_times = window_events(prepared, events)
+    codes = prepared["customer_codes"][queries]
+    if offset_ns is None:
+        return np.searchsorted(event_codes, codes, side="right")
+    return _grouped_searchsorted(event_codes, event_times, codes, prepared["time_ns"][queries] + offset_ns, side=side)
+
+
+def _first_mismatches(queries, candidates, prepared, window_ns, threshold):
+    """
+    First candidate of each query, in frame order, within the time window and further than threshold.
+
+    Candidates are compared in blocks of growing size and a query stops at its first match, so
+    most queries only ever see the first block.
+
+    Returns:
+        np.ndarray: Matching candidate row for each query, -1 where there is none.
+    """
+    time_ns = prepared["time_ns"]
+    latitude = prepared["latitude"]
+    longitude = prepared["longitude"]
+    matches = np.full(len(queries), -1, dtype=np.int64)
+    pending = np.arange(len(queries))
+
+    start = 0
+    block = FIRST_CANDIDATE_BLOCK
+    while start < len(candidates) and len(pending):
+        columns = candidates[start:start + block]
+        rows_per_pass = max(1, PAIR_BLOCK_SIZE // len(columns))
+        for offset in range(0, len(pending), rows_per_pass):
+            chunk = pending[offset:offset + rows_per_pass]
+            query_rows = queries[chunk]
+            distances = haversine(
+                latitude[query_rows, None], longitude[query_rows, None],
+                latitude[None, columns], longitude[None, columns]
+            )
+            in_window = time_ns[None, columns] >= (time_ns[query_rows] - window_ns)[:, None]
+            offending = in_window & (distances > threshold)
+            found = offending.any(axis=1)
+            matches[chunk[found]] = columns[offending[found].argmax(axis=1)]
+        pending = pending[matches[pending] < 0]
+        start += block
+        block *= 2
+    return matches
+
+
+def location_mismatches(prepared, rows, window_ns, threshold):
+    """
+    Rows with an earlier-or-later transaction of the same customer, within window_ns before the
+    row's time, more than threshold km away; the first such transaction in frame order is the
+    match, like the ``break`` in the row-by-row loop.
+
+    Returns:
+        tuple: (alerting rows in ascending order, matching row of each).
+    """
+    codes = prepared["customer_codes"]
+    time_ns = prepared["time_ns"]
+    latitude = prepared["latitude"]
+    longitude = prepared["longitude"]
+
+    is_query = np.zeros(len(codes), dtype=bool)
+    is_query[rows] = True
+
+    # Per-customer time index: the customer's timed rows, sorted by time
+    indexed = prepared["window_rows"]
+    boundaries = np.flatnonzero(np.diff(codes[indexed])) + 1
+    starts = np.concatenate([[0], boundaries]).astype(np.int64)
+    ends = np.concatenate([boundaries, [len(indexed)]]).astype(np.int64)
+    sizes = ends - starts
+    small = sizes <= FIRST_CANDIDATE_BLOCK
+
+    hit_rows, matches = [], []
+
+    # Customers with few rows are compared all at once, one padded row of candidates per
+    # customer in the original row order, so the first offending row matches the ``break``
+    # in the row-by-row loop
+    if small.any():
+        group_of = np.repeat(np.arange(len(sizes)), sizes)
+        in_small = small[group_of]
+        small_rows = indexed[in_small]
+        small_groups = group_of[in_small]
+        order = np.lexsort((small_rows, small_groups))
+        small_rows, small_groups = small_rows[order], small_groups[order]
+        slot = np.flatnonzero(small)
+        padded_index = np.full(len(sizes), -1, dtype=np.int64)
+        padded_index[slot] = np.arange(len(slot))
+        padded = np.full((len(slot), FIRST_CANDIDATE_BLOCK), -1, dtype=np.int64)
+        rank = np.arange(len(small_rows)) - np.repeat(np.cumsum(sizes[slot]) - sizes[slot], sizes[slot])
+        padded[padded_index[small_groups], rank] = small_rows
+
+        queries = small_rows[is_query[small_rows]]
+        query_groups = padded_index[small_groups[is_query[small_rows]]]
+        rows_per_pass = max(1, PAIR_BLOCK_SIZE // FIRST_CANDIDATE_BLOCK)
+        for offset in range(0, len(queries), rows_per_pass):
+            query_rows = queries[offset:offset + rows_per_pass]
+            columns = padded[query_groups[offset:offset + rows_per_pass]]
+            present = columns >= 0
+            columns = np.where(present, columns, 0)
+            distances = haversine(
+                latitude[query_rows, None], longitude[query_rows, None], latitude[columns], longitude[columns]
+            )
+            in_window = time_ns[columns] >= (time_ns[query_rows] - window_ns)[:, None]
+            offending = present & in_window & (distances > threshold)
+            found = offending.any(axis=1)
+            hit_rows.append(query_rows[found])
+            matches.append(columns[found, offending[found].argmax(axis=1)])
+
+    for start, end in zip(starts[~small].tolist(), ends[~small].tolist()):
+        group = indexed[start:end]
+        queries = group[is_query[group]]
+        if len(queries) == 0:
+            continue
+        # Rows before the window of the customer's earliest query can never match; the rest
+        # are compared in the original row order
+        first = np.searchsorted(time_ns[group], time_ns[queries[0]] - window_ns, side="left")
+        candidates = np.sort(group[first:])
+        found = _first_mismatches(queries, candidates, prepared, window_ns, threshold)
+        hit_rows.append(queries[found >= 0])
+        matches.append(found[found >= 0])
+
+    if not hit_rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    hit_rows = np.concatenate(hit_rows)
+    matches = np.concatenate(matches)
+    order = np.argsort(hit_rows, kind="stable")
+    return hit_rows[order], matches[order]
+
+
+def scenario_keys(config):
+    """Scenario number -> config key of the built-in scenarios and of the custom rules of config (see alert_rules)."""
+    keys = dict(SCENARIO_KEYS)
+    for key, scenario in config.items():
+        if isinstance(scenario, dict) and "rule" in scenario:
+            keys[scenario["number"]] = key
+    return keys
+
+
+def alert_type(config, number):
+    """Alert type of a built-in scenario, or of a custom rule of config."""
+    return ALERT_TYPES.get(number) or config[scenario_keys(config)[number]]['alert_type']
+
+
+def card_scenarios(config, numbers):
+    """The scenario numbers among numbers whose alerts report the card."""
+    keys = scenario_keys(config)
+    return [number for number in numbers if number in CARD_SCENARIOS or config[keys[number]].get('card')]
+
+
+def alert_columns(with_card, extras):
+    """
+    Columns of an alerts frame whose alerts report the card where with_card is set, matching
+    the column order pandas derives from a list of alert dicts.
+    """
+    order = [*ALERT_COLUMNS, *extras]
+    if not with_card[0]:
+        order.remove("card_id")
+        if with_card.any():
+            order.append("card_id")
+    return order
+
+
+def build_alerts_frame(prepared, results, config, extra_columns=None):
+    """
+    Assemble the per-scenario results into the alerts DataFrame in row-loop order.
+
+    ``extra_columns`` maps a column name to per-scenario lists aligned with the scenario's
+    rows, e.g. the narratives of narrative_generator; these columns follow ``details``.
+    """
+    extra_columns = extra_columns or {}
+    positions = []
+    numbers = []
+    details = []
+    extras = {name: [] for name in extra_columns}
+    for number, (hit_rows, scenario_details, _) in results.items():
+        positions.append(np.asarray(hit_rows, dtype=np.int64))
+        numbers.append(np.full(len(hit_rows), number, dtype=np.int64))
+        details.extend(scenario_details)
+        for name, values in extra_columns.items():
+            extras[name].extend(values[number])
+    if not positions or sum(len(p) for p in positions) == 0:
+        return pd.DataFrame([])
+
+    positions = np.concatenate(positions)
+    numbers = np.concatenate(numbers)
+    order = np.lexsort((numbers, positions))
+    positions, numbers = positions[order], numbers[order]
+    details = np.asarray(details, dtype=object)[order]
+    extras = {name: np.asarray(values, dtype=object)[order].tolist() for name, values in extras.items()}
+
+    labels = prepared["index"][positions].tolist()
+    keys = scenario_keys(config)
+    with_card = np.isin(numbers, card_scenarios(config, results))
+    card_ids = prepared["card_id"].iloc[positions].tolist()
+    crime_types = {number: config[keys[number]]['crime_type'] for number in results}
+    alert_types = {number: alert_type(config, number) for number in results}
+
+    columns = {
+        "alert_id": [f"A{number}-{label}" for number, label in zip(numbers.tolist(), labels)],
+        "customer_id": prepared["customer_id"].iloc[positions].tolist(),
+        "card_id": [card if has_card else np.nan for card, has_card in zip(card_ids, with_card.tolist())],
+        "alert_type": [alert_types[number] for number in numbers.tolist()],
+        "crime_type": [crime_types[number] for number in numbers.tolist()],
+        "details": details.tolist(),
+        **extras,
+    }
+    return pd.DataFrame({column: columns[column] for column in alert_columns(with_card, extras)})
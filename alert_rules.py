@@ -0,0 +1,360 @@
+import string
+import numpy as np
+import pandas as pd
+import alert_engine
+
+# Declarative TM rules compiled into one evaluation plan.
+#
+# A rule names a measure of each transaction, built from the primitives of alert_engine, and
+# raises an alert where the measure exceeds a threshold:
+#     {"aggregate": level, "column": column}   count of the row's customer or card-day
+#                                              (see alert_engine.AGGREGATE_LEVELS)
+#     {"column": name}                         a transaction column, e.g. transaction_amount
+#     {"window": {"before": duration, "after": duration or None}, "events": kind}
+#                                              same-customer transactions of a kind (all,
+#                                              international, domestic) in a time window;
+#                                              "after": None runs to the customer's last one
+#     {"ratio": [measure, measure]}            quotient of two measures, where the second is > 0
+#     {"distance": {"within": duration, "km": threshold}}
+#                                              first same-customer transaction in the window
+#                                              that is further away than the threshold
+# Durations are {"days" | "hours" | "minutes": value}; a string value (also for thresholds)
+# names a parameter of the scenario's config, so the rules below are set by alert_scenarios.json.
+#
+# compile_rules turns the enabled scenarios into a RulePlan. Every measure is a node keyed by
+# what it computes, so rules that share a grouping, a window bound or a whole measure share
+# the node, and evaluating the plan computes each node once, in one pass over the rules.
+#
+# Custom rules are added in alert_scenarios.json with a "rule" in the rule format below and
+# the "number" of their alert ids, their "alert_type" and "crime_type" (and "card": true to
+# report the card), e.g.
+#     "cross_border_burst": {"enabled": true, "number": 7, "alert_type": "Cross-Border Burst",
+#         "crime_type": "Money Laundering", "hours": 2,
+#         "rule": {"measure": {"window": {"before": {"hours": "hours"}, "after": {"hours": 0}},
+#                              "events": "international"},
+#                  "threshold": 3, "details": "{value} international transactions in {hours} hours"}}
+
+# The built-in scenarios. details is formatted per alert with the measure ("value"), the
+# scenario's config parameters and the alert's transaction columns; values are the per-alert
+# arrays handed on with the alerts, e.g. to narrative_generator.
+RULES = {
+    "high_transaction_volume": {
+        "number": 1,
+        "measure": {"aggregate": "card_day", "column": "transaction_count"},
+        "threshold": "transactions_per_day_threshold",
+        "details": "{value} transactions in a single day",
+        "values": {"transaction_count": "value"},
+    },
+    "high_transaction_amount": {
+        "number": 2,
+        "measure": {"column": "transaction_amount"},
+        "threshold": "amount_threshold",
+        "details": "Transaction amount of {value} {currency} exceeds threshold",
+    },
+    "unusual_transaction_patterns": {
+        "number": 3,
+        "measure": {"window": {"before": {"days": "days_threshold"}, "after": None}, "events": "international"},
+        "threshold": "international_transaction_threshold",
+        "details": "{value} international transactions within {days_threshold} days",
+        "values": {"international_count": "value"},
+    },
+    "frequent_international_transactions": {
+        "number": 4,
+        "measure": {"ratio": [
+            {"aggregate": "customer", "column": "international_count"},
+            {"aggregate": "customer", "column": "domestic_count"},
+        ]},
+        "threshold": "international_to_domestic_ratio",
+        "details": "International to domestic transaction ratio is {value:.2f}",
+        "values": {"international_count": "numerator"},
+    },
+    "rapid_consecutive_transactions": {
+        "number": 5,
+        "measure": {"window": {"before": {"minutes": "time_interval_minutes"}, "after": {"minutes": "time_interval_minutes"}}},
+        "threshold": "transaction_count_threshold",
+        "details": "{value} transactions within {time_interval_minutes} minutes",
+        "values": {"transaction_count": "value"},
+    },
+    "location_mismatch": {
+        "number": 6,
+        "measure": {"distance": {"within": {"hours": "time_interval_hours"}, "km": "distance_threshold_km"}},
+        "details": "Transaction locations {location_1} and {location_2} are more than "
+                   "{distance_threshold_km} km apart within {time_interval_hours} hours",
+        "values": {"match": "value"},
+    },
+}
+
+# Counts of the rows of earlier batches in incremental mode (see alert_state), added to the
+# aggregate of the same level and column
+AGGREGATE_BASES = {
+    ("card_day", "transaction_count"): (("card_day_base", 1),),
+    ("customer", "transaction_count"): (("customer_total_base", 1),),
+    ("customer", "domestic_count"): (("customer_domestic_base", 1),),
+    ("customer", "international_count"): (("customer_total_base", 1), ("customer_domestic_base", -1)),
+}
+
+
+def _param(value, config):
+    """A rule value: a literal, or the name of a parameter of the scenario's config."""
+    return config[value] if isinstance(value, str) else value
+
+
+def _duration_ns(duration, config):
+    (unit, value), = duration.items()
+    return pd.Timedelta(**{unit: _param(value, config)}).value
+
+
+class Rule:
+    """A compiled rule: the node of its measure and how its alerts are reported."""
+
+    def __init__(self, number, key, measure, threshold, details, values, numerator=None):
+        self.number = number
+        self.key = key
+        self.measure = measure
+        self.threshold = threshold
+        self.details = details
+        self.values = values
+        self.numerator = numerator
+
+
+class RulePlan:
+    """
+    The enabled rules of a scenario config and the measure nodes they use.
+
+    Attributes:
+        rules (list): Compiled rules, by scenario number.
+        nodes (list): Distinct measure nodes, in the order they are first needed.
+    """
+
+    def __init__(self, rules, nodes):
+        self.rules = rules
+        self.nodes = nodes
+
+    @property
+    def lookback_ns(self):
+        """How far before a transaction the rules look: the longest window or distance window, in ns."""
+        spans = [key[2] for key in self.nodes if key[0] == "window"] + \
+            [key[1] for key in self.nodes if key[0] == "distance"]
+        return max(spans, default=0)
+
+    def evaluate(self, prepared):
+        """
+        Run every rule on the output of alert_engine.prepare_transactions.
+
+        Returns:
+            dict: Scenario number -> (row positions, details strings, dict of per-alert values such
+                as counts or the matching row), rows in ascending order.
+        """
+        # Transactions with missing geolocation data never raise alerts, nor do rows carried
+        # over from earlier batches in incremental mode
+        rows = np.flatnonzero(prepared["has_location"] & ~prepared["history"])
+        memo = {}
+        return {rule.number: self._evaluate_rule(rule, prepared, rows, memo) for rule in self.rules}
+
+    def _node(self, key, prepared, rows, memo):
+        if key not in memo:
+            memo[key] = _NODES[key[0]](self, key, prepared, rows, memo)
+        return memo[key]
+
+    def _evaluate_rule(self, rule, prepared, rows, memo):
+        measure = self._node(rule.measure, prepared, rows, memo)
+        if rule.measure[0] == "distance":
+            hits = measure >= 0
+        elif isinstance(measure, pd.Series):
+            hits = (measure > rule.threshold).fillna(False).to_numpy(dtype=bool)
+        else:
+            hits = measure > rule.threshold
+        hit_rows = rows[hits]
+
+        sources = {"value": measure[hits]}
+        if rule.numerator is not None:
+            sources["numerator"] = self._node(rule.numerator, prepared, rows, memo)[hits]
+        values = {name: np.asarray(sources[source]) for name, source in rule.values.items()}
+        details = self._details(rule, prepared, hit_rows, sources)
+        return hit_rows, details, values
+
+    def _details(self, rule, prepared, hit_rows, sources):
+        template, config = rule.details
+        fields = {}
+        for _, name, _, _ in string.Formatter().parse(template):
+            if name is None or name in fields:
+                continue
+            if name in sources:
+                fields[name] = sources[name].tolist()
+            elif name in ("location_1", "location_2"):
+                located = hit_rows if name == "location_1" else sources["value"]
+                fields[name] = list(zip(prepared["latitude"][located].tolist(), prepared["longitude"][located].tolist()))
+            elif name in config:
+                fields[name] = [config[name]] * len(hit_rows)
+            else:
+                fields[name] = prepared[name].iloc[hit_rows].tolist()
+        names = list(fields)
+        return [template.format(**dict(zip(names, row))) for row in zip(*fields.values())] if names \
+            else [template] * len(hit_rows)
+
+
+def _aggregate_node(plan, key, prepared, rows, memo):
+    _, level, column = key
+    values = alert_engine.join_aggregate(prepared, level, column, rows)
+    for base, sign in AGGREGATE_BASES[level, column]:
+        values += sign * prepared[base][rows]
+    return values
+
+
+def _column_node(plan, key, prepared, rows, memo):
+    return prepared[key[1]].iloc[rows]
+
+
+def _queries_node(plan, key, prepared, rows, memo):
+    """Mask of the rows that can be placed in a time window."""
+    return (prepared["customer_codes"][rows] >= 0) & ~prepared["time_missing"][rows]
+
+
+def _position_node(plan, key, prepared, rows, memo):
+    _, events, offset_ns, side = key
+    queries = rows[plan._node(("queries",), prepared, rows, memo)]
+    return alert_engine.window_positions(prepared, queries, offset_ns, side=side, events=events)
+
+
+def _window_node(plan, key, prepared, rows, memo):
+    _, events, before_ns, after_ns = key
+    valid = plan._node(("queries",), prepared, rows, memo)
+    start = plan._node(("position", events, -before_ns, "left"), prepared, rows, memo)
+    end = plan._node(("position", events, after_ns, "right" if after_ns is not None else None), prepared, rows, memo)
+    counts = np.zeros(len(rows), dtype=np.int64)
+    counts[valid] = np.maximum(end - start, 0)
+    return counts
+
+
+def _ratio_node(plan, key, prepared, rows, memo):
+    numerator = plan._node(key[1], prepared, rows, memo)
+    denominator = plan._node(key[2], prepared, rows, memo)
+    ratios = np.full(len(rows), np.nan)
+    defined = denominator > 0
+    ratios[defined] = numerator[defined] / denominator[defined]
+    return ratios
+
+
+def _distance_node(plan, key, prepared, rows, memo):
+    """Matching row of each row, -1 where there is none."""
+    _, window_ns, threshold = key
+    hit_rows, matches = alert_engine.location_mismatches(prepared, rows, window_ns, threshold)
+    match = np.full(len(rows), -1, dtype=np.int64)
+    match[np.searchsorted(rows, hit_rows)] = matches
+    return match
+
+
+_NODES = {
+    "aggregate": _aggregate_node,
+    "column": _column_node,
+    "queries": _queries_node,
+    "position": _position_node,
+    "window": _window_node,
+    "ratio": _ratio_node,
+    "distance": _distance_node,
+}
+
+
+def _compile_measure(measure, config, nodes):
+    """Node key of a measure, registering it and the nodes it depends on in nodes."""
+    if "aggregate" in measure:
+        key = ("aggregate", measure["aggregate"], measure["column"])
+        if key[1:] not in AGGREGATE_BASES:
+            raise ValueError(f"Unsupported aggregate {key[1]!r}/{key[2]!r}")
+    elif "column" in measure:
+        key = ("column", measure["column"])
+    elif "window" in measure:
+        events = measure.get("events", "all")
+        if events not in alert_engine.WINDOW_EVENTS:
+            raise ValueError(f"window events must be one of {alert_engine.WINDOW_EVENTS}, not {events!r}")
+        window = measure["window"]
+        before_ns = _duration_ns(window["before"], config)
+        after_ns = None if window.get("after") is None else _duration_ns(window["after"], config)
+        nodes.setdefault(("queries",))
+        nodes.setdefault(("position", events, -before_ns, "left"))
+        nodes.setdefault(("position", events, after_ns, "right" if after_ns is not None else None))
+        key = ("window", events, before_ns, after_ns)
+    elif "ratio" in measure:
+        numerator, denominator = (_compile_measure(part, config, nodes) for part in measure["ratio"])
+        key = ("ratio", numerator, denominator)
+    elif "distance" in measure:
+        distance = measure["distance"]
+        key = ("distance", _duration_ns(distance["within"], config), _param(distance["km"], config))
+    else:
+        raise ValueError(f"Unknown measure {measure!r}")
+    nodes.setdefault(key)
+    return key
+
+
+def rule_definitions(config):
+    """The rule of every enabled scenario of config, built-in or custom, keyed by scenario key."""
+    definitions = {}
+    numbers = {}
+    for key, scenario in config.items():
+        if not isinstance(scenario, dict) or not scenario.get('enabled'):
+            continue
+        if "rule" in scenario:
+            definition = dict(scenario["rule"], number=scenario["number"])
+        elif key in RULES:
+            definition = RULES[key]
+        else:
+            raise ValueError(f"Scenario {key!r} is neither a built-in scenario nor has a rule")
+        number = definition["number"]
+        if number in numbers or ("rule" in scenario and number in alert_engine.SCENARIO_KEYS):
+            raise ValueError(f"Scenario number {number} of {key!r} is already used")
+        numbers[number] = key
+        definitions[key] = definition
+    return definitions
+
+
+def compile_rules(config):
+    """
+    Compile the enabled scenarios of an alert_scenarios.json config into a RulePlan.
+
+    Args:
+        config (dict): Scenario configuration, with built-in scenarios and custom rules.
+
+    Returns:
+        RulePlan: The rules and their shared measure nodes.
+    """
+    nodes = {}
+    rules = []
+    for key, definition in rule_definitions(config).items():
+        scenario_config = config[key]
+        measure = _compile_measure(definition["measure"], scenario_config, nodes)
+        numerator = measure[1] if measure[0] == "ratio" else None
+        threshold = _param(definition["threshold"], scenario_config) if "threshold" in definition else None
+        rules.append(Rule(
+            definition["number"], key, measure, threshold, (definition["details"], scenario_config),
+            definition.get("values", {}), numerator
+        ))
+    rules.sort(key=lambda rule: rule.number)
+    return RulePlan(rules, list(nodes))
+
+
+def evaluate_scenarios(prepared, config):
+    """
+    Run every enabled scenario and return the alerting rows per scenario.
+
+    Returns:
+        dict: Scenario number -> (row positions, details strings, dict of per-alert values such
+            as counts or the matching row), rows in ascending order.
+    """
+    return compile_rules(config).evaluate(prepared)
+
+
+def generate_alerts(transactions, config):
+    """
+    Vectorised equivalent of the row-by-row alert loop.
+
+    Args:
+        transactions (pd.DataFrame): Transactions with customer_id, card_id, transaction_date_time,
+            transaction_amount, currency, latitude, longitude and merchant_country columns.
+        config (dict): Scenario configuration loaded from alert_scenarios.json.
+
+    Returns:
+        pd.DataFrame: One row per alert, ordered by transaction and then by scenario.
+    """
+    prepared = alert_engine.prepare_transactions(transactions)
+    results = evaluate_scenarios(prepared, config)
+    return alert_engine.build_alerts_frame(prepared, results, config)
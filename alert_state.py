@@ -0,0 +1,166 @@
+import os
+from collections import Counter
+import numpy as np
+import pandas as pd
+import alert_engine
+import alert_rules
+import ingestion
+
+# Incremental alert evaluation for a transactions file that only ever gets rows appended.
+#
+# Instead of re-running every scenario over the whole history, the state of the previous runs
+# is kept on disk: the number of rows already evaluated, the daily transaction count of each
+# card, the total and domestic transaction counts of each customer, and the recent rows of
+# each customer (time, location, domestic flag) that time-window scenarios still need. Each
+# run evaluates only the new rows, against that state, and then folds them into it, so the
+# cost of a run is proportional to the new rows rather than to the history.
+#
+# New rows get alert ids from their position in the whole file, as in a full run. Alerts of
+# earlier batches are not revisited when later rows would change them (e.g. a daily count
+# that grows), and rows dated more than ``lateness`` before the latest transaction seen are
+# evaluated against a pruned history.
+
+DEFAULT_LATENESS = pd.Timedelta(days=1)
+
+# Columns of the recent rows kept as window context
+RECENT_COLUMNS = ["customer_id", "transaction_date_time", "latitude", "longitude", "merchant_country"]
+
+
+def retention(config, lateness=DEFAULT_LATENESS):
+    """How far back from the latest transaction the state must keep rows for the enabled scenarios."""
+    lookback = pd.Timedelta(alert_rules.compile_rules(config).lookback_ns)
+    return max(pd.Timedelta(days=1), lookback) + lateness
+
+
+class AlertState:
+    """
+    Per-card and per-customer state carried from one incremental alert run to the next.
+
+    Args:
+        config (dict): Scenario configuration loaded from alert_scenarios.json.
+        lateness (pd.Timedelta): How far before the latest transaction seen new rows may be dated.
+    """
+
+    def __init__(self, config, lateness=DEFAULT_LATENESS):
+        self.retention_ns = retention(config, lateness).value
+        self.rows_seen = 0
+        self.watermark_ns = None
+        self.card_days = Counter()
+        self.customer_totals = Counter()
+        self.customer_domestic = Counter()
+        self.recent = pd.DataFrame({column: pd.Series(dtype=object) for column in RECENT_COLUMNS})
+
+    @classmethod
+    def load(cls, path):
+        state = cls.__new__(cls)
+        state.__dict__.update(pd.read_pickle(path))
+        return state
+
+    @classmethod
+    def load_or_create(cls, path, config, lateness=DEFAULT_LATENESS):
+        """Load the state saved at path, or start from an empty history if there is none."""
+        return cls.load(path) if os.path.exists(path) else cls(config, lateness)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        pd.to_pickle(self.__dict__, tmp_path)
+        os.replace(tmp_path, path)
+
+    def evaluate(self, transactions, config, evaluate_scenarios=alert_rules.evaluate_scenarios,
+                 build_alerts_frame=alert_engine.build_alerts_frame):
+        """
+        Raise the alerts of newly appended transactions and fold them into the state.
+
+        Args:
+            transactions (pd.DataFrame): The rows appended since the last run, in file order.
+            config (dict): Scenario configuration loaded from alert_scenarios.json.
+            evaluate_scenarios, build_alerts_frame: Scenario evaluation and alert assembly steps,
+                alert_rules' and alert_engine's by default.
+
+        Returns:
+            pd.DataFrame: Alerts of the new rows, as generate_alerts would raise them for these
+                rows on the whole file.
+        """
+        if retention(config, pd.Timedelta(0)).value > self.retention_ns:
+            raise ValueError(
+                "The scenario windows are wider than the history kept in the alert state; "
+                "rebuild the state from the full transactions file"
+            )
+
+        transactions = transactions.set_axis(pd.RangeIndex(self.rows_seen, self.rows_seen + len(transactions)))
+        num_history = len(self.recent)
+        frame = pd.concat([self.recent, transactions]) if num_history else transactions
+        prepared = alert_engine.prepare_transactions(frame)
+        prepared["history"][:num_history] = True
+
+        new = slice(num_history, None)
+        card_days = self._card_day_keys(prepared, new)
+        prepared["card_day_base"][new] = [self.card_days.get(key, 0) for key in card_days]
+        customers = prepared["customer_id"].iloc[new].tolist()
+        prepared["customer_total_base"][new] = [self.customer_totals.get(c, 0) for c in customers]
+        prepared["customer_domestic_base"][new] = [self.customer_domestic.get(c, 0) for c in customers]
+
+        alerts = build_alerts_frame(prepared, evaluate_scenarios(prepared, config), config)
+        self._update(prepared, new, transactions, card_days, customers)
+        return alerts
+
+    def _card_day_keys(self, prepared, rows):
+        """(card, date) key of each row, None for rows without a card or timestamp."""
+        valid = (prepared["card_codes"][rows] >= 0) & ~prepared["time_missing"][rows]
+        return [
+            (card, date) if ok else None
+            for card, date, ok in zip(prepared["card_id"].iloc[rows].tolist(), prepared["date_ns"][rows].tolist(), valid)
+        ]
+
+    def _update(self, prepared, rows, transactions, card_days, customers):
+        """Fold the evaluated rows into the counts, the recent rows and the watermark."""
+        self.card_days.update(key for key in card_days if key is not None)
+        known = prepared["customer_codes"][rows] >= 0
+        domestic = prepared["domestic"][rows]
+        self.customer_totals.update(c for c, ok in zip(customers, known) if ok)
+        self.customer_domestic.update(c for c, ok in zip(customers, known & domestic) if ok)
+
+        time_ns = prepared["time_ns"][rows]
+        timed = known & ~prepared["time_missing"][rows]
+        if timed.any():
+            latest = int(time_ns[timed].max())
+            self.watermark_ns = latest if self.watermark_ns is None else max(self.watermark_ns, latest)
+        self.rows_seen += len(transactions)
+
+        # Keep only the rows and daily counts that windows of future rows can still reach
+        new_recent = transactions.loc[timed, [c for c in RECENT_COLUMNS if c in transactions]].assign(
+            transaction_date_time=pd.to_datetime(transactions['transaction_date_time'][timed])
+        )
+        recent = pd.concat([self.recent, new_recent]) if len(self.recent) else new_recent
+        if self.watermark_ns is not None:
+            cutoff_ns = self.watermark_ns - self.retention_ns
+            recent_ns = np.concatenate([prepared["time_ns"][:rows.start], time_ns[timed]])
+            recent = recent[recent_ns >= cutoff_ns]
+            cutoff_day = pd.Timestamp(cutoff_ns).normalize().value
+            self.card_days = Counter({key: count for key, count in self.card_days.items() if key[1] >= cutoff_day})
+        self.recent = recent
+
+
+def read_new_transactions(path, state, columns=None):
+    """Read only the rows appended to a transactions file since the state was last saved."""
+    return ingestion.read_transactions(path, columns=columns, skip_rows=state.rows_seen)
+
+
+def generate_alerts_incremental(path, config, state_path, **kwargs):
+    """
+    Evaluate the rows appended to a transactions CSV since the last run and save the updated state.
+
+    Args:
+        path (str): Transactions CSV, e.g. synthetic_transactions.csv.
+        config (dict): Scenario configuration loaded from alert_scenarios.json.
+        state_path (str): File holding the AlertState between runs; created on the first run.
+        **kwargs: Passed on to AlertState.evaluate.
+
+    Returns:
+        pd.DataFrame: Alerts of the new rows.
+    """
+    state = AlertState.load_or_create(state_path, config)
+    transactions = read_new_transactions(path, state, columns=ingestion.required_columns(config))
+    alerts = state.evaluate(transactions, config, **kwargs)
+    state.save(state_path)
+    return alerts
@@ -0,0 +1,236 @@
+import pandas as pd
+import numpy as np
+from datetime import timedelta
+import capacity_planner
+import columnar
+import identifiers
+import value_pools
+
+# Columnar batch engine for the card transaction schema of generate_transactions.py.
+#
+# Instead of building one dict per row with scalar random/uuid/Faker calls, every field is
+# drawn as a whole column from a seeded numpy Generator and the DataFrame is built straight
+# from those arrays. Faker values are drawn from the pre-sampled pools of value_pools.
+
+ACCOUNT_TYPES = np.array(["debit", "credit", "saving"], dtype=object)
+PAYMENT_CHANNELS = np.array(["POS", "online", "mobile_app"], dtype=object)
+POS_PAYMENT_METHODS = np.array(["swipe", "NFC", "chip"], dtype=object)
+CARD_TYPES = np.array(["Visa", "MasterCard"], dtype=object)
+THREE_D_SECURE_STATUSES = np.array(["Passed", "Failed"], dtype=object)
+FOREIGN_CURRENCIES = np.array(["USD", "EUR", "CAD", "JPY", "AUD"], dtype=object)
+MCCS = np.array(["5411", "5812", "5921", "5999", "5735"], dtype=object)
+DESCRIPTIONS = np.array(["Grocery", "Restaurant", "Electronics", "Clothing", "Gas"], dtype=object)
+AUTHENTICATION_METHODS = np.array(["PIN", "biometric", "password"], dtype=object)
+TRANSACTION_STATUSES = np.array(["approved", "pending", "failed"], dtype=object)
+FAILURE_REASONS = np.array(["insufficient funds", "fraud detected", "technical error", None], dtype=object)
+REFERRAL_SOURCES = np.array(["email", "social media", "direct", "referral"], dtype=object)
+
+
+def _choice(rng, values, n):
+    """Draw n values uniformly from a small object array."""
+    return values[rng.integers(0, len(values), n)]
+
+
+def _uuid_strings(rng, n, version=4, timestamps=None):
+    """Generate n random (version 4) or time-ordered (version 7) UUID strings from a single byte buffer."""
+    return columnar.uuid_strings(identifiers.random_uuids(rng, n, version, timestamps))
+
+
+def _ipv4_strings(rng, n):
+    """Generate n dotted-quad public-looking IPv4 addresses."""
+    octets = rng.integers(0, 256, size=(n, 4))
+    octets[:, 0] = rng.integers(1, 224, n)
+    octets = octets.astype(str)
+    return np.array(
+        [".".join(row) for row in octets.tolist()], dtype=object
+    )
+
+
+def _with_prefix(prefix, numbers):
+    """Prefix every number of an integer array with a fixed string."""
+    return (prefix + pd.Series(numbers).astype(str)).to_numpy(dtype=object)
+
+
+def _where(mask, values, default=None):
+    """Keep values where mask is set and use default elsewhere, as an object column."""
+    result = np.full(len(mask), default, dtype=object)
+    result[mask] = values[mask]
+    return result
+
+
+def population_arrays(population):
+    """
+    Flatten the customer/card/merchant dictionaries into index-aligned arrays.
+
+    Args:
+        population (dict): customers, customer_cards, customer_names, card_issuers and merchants
+            as built in generate_transactions.py.
+
+    Returns:
+        dict: Arrays keyed by field name, with cards grouped by customer.
+    """
+    customers = list(population["customers"])
+    customer_cards = population["customer_cards"]
+    card_counts = np.array([len(customer_cards[customer]) for customer in customers], dtype=np.int64)
+    cards = [card for customer in customers for card in customer_cards[customer]]
+    merchants = population["merchants"]
+    merchant_ids = list(merchants)
+
+    return {
+        "customer_ids": np.array(customers, dtype=object),
+        "customer_names": np.array([population["customer_names"][c] for c in customers], dtype=object),
+        "card_ids": np.array(cards, dtype=object),
+        "card_issuers": np.array([population["card_issuers"][card] for card in cards], dtype=object),
+        "card_offsets": np.cumsum(card_counts) - card_counts,
+        "card_counts": card_counts,
+        "merchant_ids": np.array(merchant_ids, dtype=object),
+        "merchant_names": np.array([merchants[m]["merchant_name"] for m in merchant_ids], dtype=object),
+        "merchant_cities": np.array([merchants[m]["merchant_location"]["city"] for m in merchant_ids], dtype=object),
+        "merchant_states": np.array([merchants[m]["merchant_location"]["state"] for m in merchant_ids], dtype=object),
+        "merchant_terminal_ids": np.array([merchants[m]["merchant_terminal_id"] for m in merchant_ids], dtype=object),
+    }
+
+
+def faker_pools(cache):
+    """Faker value pools used for foreign merchants and online sessions, from a value_pools.PoolCache."""
+    return {name: cache[name] for name in ["user_agent", "country_code", "city", "state_abbr"]}
+
+
+def build_batch(rng, arrays, pools, params, customer_idx, card_idx, transaction_dates, end_date):
+    """
+    Draw every field of the planned transactions as whole columns.
+
+    Args:
+        rng (np.random.Generator): Source of randomness.
+        arrays (dict): Population arrays from population_arrays.
+        pools (dict): Faker value pools from faker_pools.
+        params (dict): Transaction parameters loaded from transaction_parameters.json.
+        customer_idx, card_idx, transaction_dates: Planned rows from capacity_planner.
+        end_date (datetime): End of the transaction period, used for card expiry dates.
+
+    Returns:
+        pd.DataFrame: Transactions with the same columns as generate_transactions.generate_transactions.
+    """
+    n = len(card_idx)
+    merchant_idx = rng.integers(0, len(arrays["merchant_ids"]), n)
+
+    account_type = _choice(rng, ACCOUNT_TYPES, n)
+    card_type = np.where(account_type == "credit", _choice(rng, CARD_TYPES, n), "Visa").astype(object)
+
+    payment_channel = _choice(rng, PAYMENT_CHANNELS, n)
+    is_pos = payment_channel == "POS"
+    is_online = payment_channel == "online"
+    is_connected = ~is_pos
+    payment_method = np.where(is_pos, _choice(rng, POS_PAYMENT_METHODS, n), "CNP").astype(object)
+    three_d_secure_status = _where(is_online, _choice(rng, THREE_D_SECURE_STATUSES, n))
+    device_id = _where(is_connected, _uuid_strings(rng, n))
+    ip_address = _where(is_connected, _ipv4_strings(rng, n))
+    user_agent = _where(is_online, _choice(rng, pools["user_agent"], n))
+
+    # Domestic transactions use the merchant's own location, foreign ones a random one
+    is_domestic = rng.random(n) * 100 < params["domestic_percentage"]
+    country = np.where(is_domestic, "UK", _choice(rng, pools["country_code"], n)).astype(object)
+    currency = np.where(is_domestic, "GBP", _choice(rng, FOREIGN_CURRENCIES, n)).astype(object)
+    city = np.where(is_domestic, arrays["merchant_cities"][merchant_idx], _choice(rng, pools["city"], n))
+    state = np.where(is_domestic, arrays["merchant_states"][merchant_idx], _choice(rng, pools["state_abbr"], n))
+    exchange_rate = np.where(is_domestic, np.nan, np.round(rng.uniform(0.5, 1.5, n), 2))
+
+    # Card expiry dates between this month and ten years ahead, formatted as MM/YY
+    expiry_months = (end_date.year * 12 + end_date.month - 1) + rng.integers(0, 121, n)
+    card_expiration_date = [f"{month % 12 + 1:02d}/{month // 12 % 100:02d}" for month in expiry_months.tolist()]
+
+    latitude = np.round(rng.uniform(-90, 90, n), 6)
+    longitude = np.round(rng.uniform(-180, 180, n), 6)
+
+    return pd.DataFrame({
+        "transaction_id": _uuid_strings(rng, n, params.get("id_version", 4), transaction_dates),
+        "customer_id": arrays["customer_ids"][customer_idx],
+        "card_id": arrays["card_ids"][card_idx],
+        "transaction_type": payment_channel,
+        "transaction_date_time": transaction_dates,
+        "transaction_amount": np.round(rng.gamma(params["transaction_amount_distribution"]["alpha"],
+                                                 params["transaction_amount_distribution"]["beta"], n), 2),
+        "currency": currency,
+        "mcc": _choice(rng, MCCS, n),
+        "description": _choice(rng, DESCRIPTIONS, n),
+        "account_type": account_type,
+        "account_balance": np.round(rng.uniform(100.0, 10000.0, n), 2),
+        "card_type": card_type,
+        "card_number_masked": _with_prefix("**** **** **** ", rng.integers(1000, 10000, n)),
+        "card_expiration_date": card_expiration_date,
+        "card_issuer": arrays["card_issuers"][card_idx],
+        "cardholder_name": arrays["customer_names"][customer_idx],
+        "merchant_id": arrays["merchant_ids"][merchant_idx],
+        "merchant_name": arrays["merchant_names"][merchant_idx],
+        "merchant_location": [
+            {"city": c, "state": s, "country": k}
+            for c, s, k in zip(city.tolist(), state.tolist(), country.tolist())
+        ],
+        "merchant_terminal_id": arrays["merchant_terminal_ids"][merchant_idx],
+        "payment_method": payment_method,
+        "payment_channel": payment_channel,
+        "geolocation": [
+            {"latitude": lat, "longitude": lon}
+            for lat, lon in zip(latitude.tolist(), longitude.tolist())
+        ],
+        "authorization_code": rng.integers(100000, 1000000, n).astype(str).astype(object),
+        "authentication_method": _choice(rng, AUTHENTICATION_METHODS, n),
+        "3d_secure_status": three_d_secure_status,
+        "fraud_risk_score": rng.integers(0, 101, n),
+        "transaction_status": _choice(rng, TRANSACTION_STATUSES, n),
+        "failure_reason": _choice(rng, FAILURE_REASONS, n),
+        "exchange_rate": exchange_rate,
+        "rewards_earned": rng.integers(0, 11, n),
+        "ip_address": ip_address,
+        "device_id": device_id,
+        "user_agent": user_agent,
+        "session_id": _uuid_strings(rng, n),
+        "referral_source": _choice(rng, REFERRAL_SOURCES, n),
+    })
+
+
+def generate_transactions_batch(n, population, params, end_date, seed=None):
+    """
+    Draw n card transactions column by column.
+
+    Args:
+        n (int): Number of transactions to generate.
+        population (dict): Customers, cards and merchants as built in generate_transactions.py.
+        params (dict): Transaction parameters loaded from transaction_parameters.json.
+        end_date (datetime): End of the transaction period; with the seed it fixes the output.
+        seed (int, optional): Seed for the numpy Generator and the Faker value pools.
+
+    Returns:
+        pd.DataFrame: Transactions with the same columns as generate_transactions.generate_transactions.
+    """
+    return next(iter_transaction_batches(n, population, params, max(n, 1), end_date, seed=seed))
+
+
+def iter_transaction_batches(n, population, params, chunk_size, end_date, seed=None):
+    """
+    Draw n card transactions column by column, yielding DataFrames of about chunk_size rows,
+    over the transaction_period_days up to end_date.
+
+    The capacity plan is built one block of customers at a time, so memory stays bounded
+    by the chunk size rather than by n. At least one (possibly empty) chunk is yielded so
+    sinks always see the schema.
+    """
+    rng = np.random.default_rng(seed)
+    arrays = population_arrays(population)
+    pools = faker_pools(value_pools.PoolCache(seed=seed))
+
+    # Customer, card and date-time of every row from the capacity plan, which keeps
+    # within the daily and per-card limits
+    start_date = end_date - timedelta(days=params["transaction_period_days"])
+    plan = capacity_planner.iter_plan_chunks(
+        n, arrays["card_counts"], start_date, end_date, params["max_transactions_per_card"],
+        params["max_transactions_per_card_per_day"], params["max_transactions_per_customer_per_day"],
+        chunk_size, rng=rng
+    )
+    empty = True
+    for customer_idx, card_idx, transaction_dates in plan:
+        empty = False
+        yield build_batch(rng, arrays, pools, params, customer_idx, card_idx, transaction_dates, end_date)
+    if empty:
+        no_rows = np.zeros(0, dtype=np.int64)
+        yield build_batch(rng, arrays, pools, params, no_rows, no_rows, np.zeros(0, dtype="datetime64[us]"), end_date)
@@ -0,0 +1,397 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Unix only: peak RSS is reported as None elsewhere
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Throughput benchmarks of the generators and alert paths.
+#
+# Each (case, size) runs in a fresh Python process inside a scratch working directory holding
+# copies of the config files, because the scripts read their config from the current
+# directory. The child records the time of every phase, the rows
+# produced and its peak RSS, or that of its largest worker process if higher; the parent appends the results to a JSON history and compares
+# them with a stored baseline.
+#
+# Usage:
+#     python benchmark.py                              # every case at 1k, 100k and 1M rows
+#     python benchmark.py --cases alert_generator --sizes 1000 100000
+#     python benchmark.py --save-baseline              # store this run as the baseline
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_HISTORY = "benchmark_history.json"
+DEFAULT_BASELINE = "benchmark_baseline.json"
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_TIMEOUT = 3600  # seconds per case
+
+CONFIG_FILES = ["transaction_parameters.json", "config.json", "alert_scenarios.json"]
+
+# Phases that prepare a case rather than measure it; excluded from rows/sec
+SETUP_PHASES = {"setup", "import", "population"}
+
+
+@contextlib.contextmanager
+def _timed(phases, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def _import(phases, module_name, phase="import"):
+    """Import a script, timing the import and silencing anything it prints."""
+    with _timed(phases, phase), contextlib.redirect_stdout(io.StringIO()):
+        return importlib.import_module(module_name)
+
+
+def _take(chunks, size):
+    """Consume DataFrame chunks until at least size rows were produced."""
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        if rows >= size:
+            break
+    return rows
+
+
+def _chunk_size(size):
+    return min(size, 100_000)
+
+
+def _bench_generate(size, phases):
+    module = _import(phases, "generate")
+    with _timed(phases, "parties"):
+        # About 300 records per party: 1-5 accounts with 1-200 transactions each
+        parties = module.build_party_population(size // 100 + 1, seed=0)
+    with _timed(phases, "generate"):
+        return _take(module.iter_party_record_chunks(parties, chunk_size=_chunk_size(size)), size)
+
+
+def _population(phases, module):
+    """Build the customers, cards and merchants of a card transaction script's default generator."""
+    with _timed(phases, "population"):
+        return module.default_generator().population
+
+
+def _bench_card_transactions(module_name):
+    def bench(size, phases):
+        module = _import(phases, module_name)
+        _population(phases, module)
+        with _timed(phases, "plan"):
+            slots = module.plan_transaction_slots(size)
+        with _timed(phases, "build"):
+            return len(module.build_transactions(slots))
+    return bench
+
+
+def _bench_transactions_batch(size, phases):
+    module = _import(phases, "generate_transactions")
+    _population(phases, module)
+    with _timed(phases, "generate"):
+        return len(module.generate_transactions_batch(size, seed=0))
+
+
+def _bench_transactions_compact(size, phases):
+    module = _import(phases, "generate_transactions")
+    _population(phases, module)
+    with _timed(phases, "generate"):
+        return len(module.generate_compact_transactions(size, chunk_size=_chunk_size(size), batch=True, seed=0))
+
+
+def _bench_transactions_stream(size, phases):
+    module = _import(phases, "generate_transactions")
+    _population(phases, module)
+    with _timed(phases, "generate"):
+        return _take(module.iter_transaction_stream(size, process="hawkes", seed=0), size)
+
+
+def _bench_inbound_payments(size, phases):
+    module = _import(phases, "inbound_payment_generator")
+    with _timed(phases, "generate"):
+        return len(module.generate_inbound_payments(size))
+
+
+def _bench_payments_with_scenarios(size, phases):
+    module = _import(phases, "payments_matching_scenarios")
+    with _timed(phases, "generate"):
+        return _take(module.iter_payment_chunks_with_scenarios(size, chunk_size=_chunk_size(size)), size)
+
+
+def alert_input(size, phases):
+    """Flattened card transactions in the layout of synthetic_transactions.csv, from the batch generator."""
+    generator = _import(phases, "generate_transactions", phase="setup")
+    _population(phases, generator)
+    with _timed(phases, "setup"):
+        df = generator.generate_transactions_batch(size, seed=0)
+        transactions = df.drop(columns=["merchant_location", "geolocation"]).assign(
+            latitude=[location["latitude"] for location in df["geolocation"]],
+            longitude=[location["longitude"] for location in df["geolocation"]],
+            merchant_country=[location["country"] for location in df["merchant_location"]],
+        )
+    return transactions
+
+
+def _bench_alerts(module_name, engine_name):
+    def bench(size, phases):
+        transactions = alert_input(size, phases)
+        module = _import(phases, module_name)
+        alerts = getattr(module, engine_name)()
+        prepare = importlib.import_module("alert_engine").prepare_transactions
+        with _timed(phases, "prepare"):
+            prepared = prepare(transactions)
+        with _timed(phases, "evaluate"):
+            results = alerts.evaluate_scenarios(prepared, alerts.config)
+        with _timed(phases, "build"):
+            alerts.build_alerts_frame(prepared, results, alerts.config)
+        return len(transactions)
+    return bench
+
+
+def _bench_parallel_alerts(size, phases):
+    transactions = alert_input(size, phases)
+    alerts = _import(phases, "alert_generator").default_engine()
+    with _timed(phases, "evaluate"):
+        alerts.generate_alerts_parallel(transactions)
+    return len(transactions)
+
+
+def _bench_ingestion(size, phases):
+    transactions = alert_input(size, phases)
+    with _timed(phases, "setup"):
+        transactions.to_csv("transactions.csv", index=False)
+    module = _import(phases, "ingestion")
+    config = _import(phases, "alert_generator").default_engine().config
+    with _timed(phases, "read"):
+        return len(module.read_transactions("transactions.csv", columns=module.required_columns(config)))
+
+
+def _bench_scenario_injection(size, phases):
+    generator = _import(phases, "generate_transactions", phase="setup")
+    _population(phases, generator)
+    with _timed(phases, "setup"):
+        background = generator.generate_transactions_batch(size, seed=0)
+    module = _import(phases, "scenario_injection")
+    config = _import(phases, "alert_generator").default_engine().config
+    with _timed(phases, "inject"):
+        return len(module.inject_scenarios(background, config, seed=0))
+
+
+CASES = {
+    "generate": _bench_generate,
+    "generate_transactions": _bench_card_transactions("generate_transactions"),
+    "generate_transactions_batch": _bench_transactions_batch,
+    "generate_transactions_compact": _bench_transactions_compact,
+    "generate_transactions_stream": _bench_transactions_stream,
+    "In_out_generator": _bench_card_transactions("In_out_generator"),
+    "inbound_payment_generator": _bench_inbound_payments,
+    "payments_matching_scenarios": _bench_payments_with_scenarios,
+    "alert_generator": _bench_alerts("alert_generator", "AlertEngine"),
+    "narrative_generator": _bench_alerts("narrative_generator", "NarrativeAlertEngine"),
+    "parallel_alerts": _bench_parallel_alerts,
+    "scenario_injection": _bench_scenario_injection,
+    "ingestion": _bench_ingestion,
+}
+
+
+def _write_configs(config_dir, workdir, size):
+    """Copy the config files, sizing the card transaction population for the benchmark."""
+    for name in CONFIG_FILES:
+        shutil.copy(os.path.join(config_dir, name), os.path.join(workdir, name))
+
+    path = os.path.join(workdir, "transaction_parameters.json")
+    with open(path) as f:
+        params = json.load(f)
+    # Have enough customers for size transactions (about 25 per customer stays well within
+    # the per-card and daily limits)
+    params["num_customers"] = max(params["num_customers"], math.ceil(size / 25))
+    # Seeded so that runs are comparable, unless the config picks its own seed
+    params.setdefault("seed", 0)
+    with open(path, "w") as f:
+        json.dump(params, f)
+
+
+def run_case(case, size, config_dir, result_path):
+    """Run one benchmark in this process and write its measurements to result_path."""
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        _write_configs(config_dir, workdir, size)
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+
+        phases = {}
+        rows = CASES[case](size, phases)
+        seconds = sum(t for name, t in phases.items() if name not in SETUP_PHASES)
+
+        peak_rss_mb = children_peak_rss_mb = None
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            unit = 1024 ** 2 if sys.platform == "darwin" else 1024
+            # Worker processes (parallel_alerts) are counted in the children once they have exited
+            children_peak_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+            peak_rss_mb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, children_peak_rss_mb)
+
+        result = {
+            "case": case,
+            "size": size,
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_sec": rows / seconds if seconds > 0 else None,
+            "peak_rss_mb": peak_rss_mb,
+            "children_peak_rss_mb": children_peak_rss_mb,
+            "phases": phases,
+        }
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+
+def run_benchmark(case, size, config_dir=".", timeout=DEFAULT_TIMEOUT):
+    """
+    Run one case at one size in a fresh Python process.
+
+    Returns:
+        dict: case, size, rows, seconds, rows_per_sec, peak_rss_mb, children_peak_rss_mb and
+            per-phase seconds, or
+            case, size and an error message if the run failed or timed out.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = os.path.join(tmp, "result.json")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", case, str(size),
+            os.path.abspath(config_dir), result_path,
+        ]
+        try:
+            completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return {"case": case, "size": size, "error": f"timed out after {timeout}s"}
+        if completed.returncode != 0 or not os.path.exists(result_path):
+            last_line = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+            return {"case": case, "size": size, "error": last_line}
+        with open(result_path) as f:
+            return json.load(f)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results with a baseline run.
+
+    A case regresses when its throughput falls more than tolerance below the baseline's, or its
+    peak RSS grows more than tolerance above it.
+
+    Returns:
+        list: One message per regression.
+    """
+    base = {(r["case"], r["size"]): r for r in baseline.get("results", []) if "error" not in r}
+    regressions = []
+    for result in results:
+        reference = base.get((result["case"], result["size"]))
+        if reference is None or "error" in result:
+            continue
+        label = f"{result['case']} @ {result['size']}"
+        if reference["rows_per_sec"] and result["rows_per_sec"] is not None \
+                and result["rows_per_sec"] < reference["rows_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{label}: {result['rows_per_sec']:,.0f} rows/s vs {reference['rows_per_sec']:,.0f} in the baseline"
+            )
+        if reference["peak_rss_mb"] and result["peak_rss_mb"] is not None \
+                and result["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{label}: peak RSS {result['peak_rss_mb']:,.0f} MB vs {reference['peak_rss_mb']:,.0f} MB in the baseline"
+            )
+    return regressions
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _print_result(result):
+    if "error" in result:
+        print(f"{result['case']:<30} {result['size']:>10,}  ERROR: {result['error']}")
+        return
+    phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result["phases"].items())
+    rss = "n/a" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:,.0f} MB"
+    print(f"{result['case']:<30} {result['size']:>10,}  {result['rows_per_sec'] or 0:>12,.0f} rows/s  "
+          f"peak {rss:>9}  ({phases})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the generators and alert paths.")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--config-dir", default=".", help="Directory holding the config JSON files")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON file the run is appended to")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON file of the run to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative slowdown / memory growth before flagging a regression")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Seconds allowed per case and size")
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        case, size, config_dir, result_path = args.child
+        run_case(case, int(size), config_dir, result_path)
+        return 0
+
+    results = []
+    for case in args.cases:
+        for size in args.sizes:
+            result = run_benchmark(case, size, args.config_dir, args.timeout)
+            _print_result(result)
+            results.append(result)
+
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    history = _load_json(args.history, [])
+    history.append(run)
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent=2)
+
+    regressions = find_regressions(results, _load_json(args.baseline, {}), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+import numpy as np
+from collections import Counter
+from profiling import NULL_PROFILER
+
+# Up-front allocation of transactions to customers, cards and days.
+#
+# The generators used to draw a customer, card and date per row and skip the row with
+# ``continue`` when the card or customer was over one of its limits, rescanning every
+# generated row to count the card's transactions. The planner instead hands out each
+# card's quota before any row is built, so every draw is kept and exactly the requested
+# number of transactions comes back.
+
+# Number of vectorised redraw rounds before the remaining rows are placed one by one
+MAX_DATE_ROUNDS = 8
+
+
+def _fill(rng, num_rows, capacity, owners=None):
+    """
+    Spread rows uniformly over slots without exceeding each slot's capacity.
+
+    When ``owners`` is given, ``num_rows`` is an array of rows per owner and every row
+    is only spread over the slots of its own owner (slots grouped by owner).
+    """
+    quota = np.zeros(len(capacity), dtype=np.int64)
+    if owners is None:
+        pending = np.zeros(0, dtype=np.int64)
+        remaining = int(num_rows)
+    else:
+        pending = np.repeat(np.arange(len(num_rows)), num_rows)
+        remaining = len(pending)
+
+    while remaining:
+        open_slots = np.flatnonzero(quota < capacity)
+        if owners is None:
+            chosen = open_slots[rng.integers(0, len(open_slots), remaining)]
+        else:
+            # Pick uniformly among the owner's slots that still have room
+            open_owners = owners[open_slots]
+            open_counts = np.bincount(open_owners, minlength=len(num_rows))
+            open_offsets = np.cumsum(open_counts) - open_counts
+            picks = (rng.random(len(pending)) * open_counts[pending]).astype(np.int64)
+            chosen = open_slots[open_offsets[pending] + picks]
+
+        quota += np.bincount(chosen, minlength=len(capacity))
+        overflow = np.maximum(quota - capacity, 0)
+        quota -= overflow
+        remaining = int(overflow.sum())
+        if owners is not None:
+            pending = np.repeat(owners, overflow)
+    return quota
+
+
+def _ranks(keys, placed_counts):
+    """Position of each key among the rows already placed plus the earlier rows with the same key."""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    group_sizes = np.diff(np.r_[starts, len(keys)])
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys)) - np.repeat(starts, group_sizes)
+    return ranks + np.array([placed_counts[key] for key in keys.tolist()], dtype=np.int64)
+
+
+def _spread_days(rng, cards, num_dates):
+    """
+    Days of a customer's rows that keep every day and every card-day within the limits.
+
+    The rows, grouped by card, are dealt to the days in turn from a random starting day, so a
+    day gets at most ceil(rows / num_dates) of them and a card at most ceil(card rows /
+    num_dates) a day; both are within the limits whenever the card and customer quotas are.
+    The days are then shuffled.
+    """
+    order = np.argsort(cards, kind="stable")
+    turns = (rng.integers(0, num_dates) + np.arange(len(cards))) % num_dates
+    days = np.empty(len(cards), dtype=np.int64)
+    days[order] = rng.permutation(num_dates)[turns]
+    return days
+
+
+def _time_in_day(rng, start, end, first_day, day):
+    """Uniform date-time on a day of the period, clipped to the period's start and end."""
+    day_start = max(start, first_day + np.timedelta64(day, "D"))
+    day_end = min(end, first_day + np.timedelta64(day + 1, "D") - np.timedelta64(1, "us"))
+    return day_start + np.timedelta64(int(rng.integers(0, int((day_end - day_start).astype(np.int64)) + 1)), "us")
+
+
+def plan_capacity(card_counts, num_dates, max_transactions_per_card,
+                  max_transactions_per_card_per_day, max_transactions_per_customer_per_day):
+    """
+    Maximum number of transactions each card and customer can take over the period.
+
+    Returns:
+        tuple: (per-card capacity, per-customer capacity) arrays.
+    """
+    card_counts = np.asarray(card_counts, dtype=np.int64)
+    owners = np.repeat(np.arange(len(card_counts)), card_counts)
+    card_capacity = np.full(len(owners), min(max_transactions_per_card, num_dates * max_transactions_per_card_per_day),
+                            dtype=np.int64)
+    customer_capacity = np.minimum(
+        np.bincount(owners, weights=card_capacity, minlength=len(card_counts)).astype(np.int64),
+        num_dates * max_transactions_per_customer_per_day
+    )
+    return card_capacity, customer_capacity
+
+
+def _num_dates(start_date, end_date):
+    """Number of calendar dates touched by the period."""
+    return int((np.datetime64(end_date, "D") - np.datetime64(start_date, "D")).astype(np.int64)) + 1
+
+
+def plan_customer_quotas(n, card_counts, start_date, end_date, max_transactions_per_card,
+                         max_transactions_per_card_per_day, max_transactions_per_customer_per_day, rng):
+    """
+    Check that n transactions fit within the limits and fix each customer's quota.
+
+    Returns:
+        tuple: (transactions per customer, per-card capacity) arrays.
+    """
+    card_counts = np.asarray(card_counts, dtype=np.int64)
+    num_dates = _num_dates(start_date, end_date)
+    card_capacity, customer_capacity = plan_capacity(
+        card_counts, num_dates, max_transactions_per_card,
+        max_transactions_per_card_per_day, max_transactions_per_customer_per_day
+    )
+    if n > customer_capacity.sum():
+        raise ValueError(
+            f"Cannot generate {n} transactions: the configured limits allow at most {customer_capacity.sum()}"
+        )
+    return _fill(rng, n, customer_capacity), card_capacity
+
+
+def plan_customer_block(customer_quota, card_counts, card_capacity, start_date, end_date,
+                        max_transactions_per_card_per_day, max_transactions_per_customer_per_day, rng,
+                        profiler=NULL_PROFILER):
+    """
+    Spread the quotas of a block of customers over their cards and over the days of the period.
+
+    Date-times redrawn because a day was full are counted in the profiler under
+    rejected.<limit>, and rows placed directly after the redraw rounds under placed_directly.
+    A customer whose remaining rows no longer fit on the days left open is planned again with
+    its rows dealt evenly over the days (counted under replanned_customers), so every quota
+    that plan_customer_quotas accepts is placed.
+
+    Returns:
+        tuple: (customer indices, card indices, datetime64[us] date-times) local to the block.
+    """
+    card_counts = np.asarray(card_counts, dtype=np.int64)
+    owners = np.repeat(np.arange(len(card_counts)), card_counts)
+    first_day = np.datetime64(start_date, "D")
+    num_dates = _num_dates(start_date, end_date)
+    n = int(customer_quota.sum())
+
+    card_quota = _fill(rng, customer_quota, card_capacity, owners=owners)
+    card_idx = rng.permutation(np.repeat(np.arange(len(owners)), card_quota))
+    customer_idx = owners[card_idx]
+
+    # Date-times uniform over the period; rows landing on a full card or customer day are redrawn
+    start = np.datetime64(start_date, "us")
+    span_us = int((np.datetime64(end_date, "us") - start).astype(np.int64))
+    date_times = np.empty(n, dtype="datetime64[us]")
+    card_days = Counter()
+    customer_days = Counter()
+    pending = np.arange(n)
+    for _ in range(MAX_DATE_ROUNDS):
+        if len(pending) == 0:
+            break
+        candidates = start + rng.integers(0, span_us + 1, len(pending)).astype("timedelta64[us]")
+        days = (candidates.astype("datetime64[D]") - first_day).astype(np.int64)
+        card_keys = card_idx[pending] * num_dates + days
+        customer_keys = customer_idx[pending] * num_dates + days
+        card_open = _ranks(card_keys, card_days) < max_transactions_per_card_per_day
+        customer_open = _ranks(customer_keys, customer_days) < max_transactions_per_customer_per_day
+        placed = card_open & customer_open
+        profiler.count("rejected.max_transactions_per_card_per_day", int(np.count_nonzero(~card_open)))
+        profiler.count("rejected.max_transactions_per_customer_per_day", int(np.count_nonzero(card_open & ~customer_open)))
+        date_times[pending[placed]] = candidates[placed]
+        card_days.update(card_keys[placed].tolist())
+        customer_days.update(customer_keys[placed].tolist())
+        pending = pending[~placed]
+
+    # Place the few remaining rows directly on a day that still has room
+    end = start + np.timedelta64(span_us, "us")
+    replanned = set()
+    profiler.count("placed_directly", len(pending))
+    for row in pending.tolist():
+        card, customer = int(card_idx[row]), int(customer_idx[row])
+        if customer in replanned:
+            continue
+        open_days = [
+            day for day in range(num_dates)
+            if card_days[card * num_dates + day] < max_transactions_per_card_per_day
+            and customer_days[customer * num_dates + day] < max_transactions_per_customer_per_day
+        ]
+        if not open_days:
+            # The days left open do not suit this card; the customer's rows are planned again
+            replanned.add(customer)
+            continue
+        day = open_days[rng.integers(0, len(open_days))]
+        date_times[row] = _time_in_day(rng, start, end, first_day, day)
+        card_days[card * num_dates + day] += 1
+        customer_days[customer * num_dates + day] += 1
+
+    # Cards belong to one customer, so replanning a customer leaves every other day count as is
+    profiler.count("replanned_customers", len(replanned))
+    for customer in sorted(replanned):
+        rows = np.flatnonzero(customer_idx == customer)
+        days = _spread_days(rng, card_idx[rows], num_dates)
+        for row, day in zip(rows.tolist(), days.tolist()):
+            date_times[row] = _time_in_day(rng, start, end, first_day, day)
+
+    return customer_idx, card_idx, date_times
+
+
+def plan_transactions(n, card_counts, start_date, end_date, max_transactions_per_card,
+                      max_transactions_per_card_per_day, max_transactions_per_customer_per_day, rng=None,
+                      profiler=NULL_PROFILER):
+    """
+    Allocate n transactions to customers, cards and date-times within every configured limit.
+
+    Customers are picked uniformly and cards uniformly within the customer, as in the row
+    generators, with each card's quota fixed up front. Date-times are uniform over the
+    period, redrawn when a card or customer day is already full.
+
+    Args:
+        n (int): Number of transactions to plan.
+        card_counts (array-like): Number of cards of each customer; cards are numbered
+            consecutively customer by customer.
+        start_date (datetime): Start of the transaction period.
+        end_date (datetime): End of the transaction period.
+        max_transactions_per_card (int): Cap on transactions per card over the period.
+        max_transactions_per_card_per_day (int): Cap on transactions per card per calendar day.
+        max_transactions_per_customer_per_day (int): Cap on transactions per customer per calendar day.
+        rng (np.random.Generator, optional): Source of randomness.
+        profiler (profiling.Profiler, optional): Counts the rejected date-times; see plan_customer_block.
+
+    Returns:
+        tuple: (customer indices, card indices, datetime64[us] date-times), one entry per transaction
+            in random order.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    card_counts = np.asarray(card_counts, dtype=np.int64)
+    customer_quota, card_capacity = plan_customer_quotas(
+        n, card_counts, start_date, end_date, max_transactions_per_card,
+        max_transactions_per_card_per_day, max_transactions_per_customer_per_day, rng
+    )
+    return plan_customer_block(
+        customer_quota, card_counts, card_capacity, start_date, end_date,
+        max_transactions_per_card_per_day, max_transactions_per_customer_per_day, rng, profiler
+    )
+
+
+def iter_plan_chunks(n, card_counts, start_date, end_date, max_transactions_per_card,
+                     max_transactions_per_card_per_day, max_transactions_per_customer_per_day,
+                     chunk_size, rng=None, profiler=NULL_PROFILER):
+    """
+    Plan n transactions like plan_transactions, one block of customers at a time.
+
+    Every limit is per card or per customer, so planning consecutive customers separately
+    keeps them exact while only one block of about chunk_size rows is held at a time.
+
+    Yields:
+        tuple: (customer indices, card indices, datetime64[us] date-times) for each block,
+            with indices into the full customer and card numbering.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    card_counts = np.asarray(card_counts, dtype=np.int64)
+    customer_quota, card_capacity = plan_customer_quotas(
+        n, card_counts, start_date, end_date, max_transactions_per_card,
+        max_transactions_per_card_per_day, max_transactions_per_customer_per_day, rng
+    )
+    card_offsets = np.cumsum(card_counts) - card_counts
+
+    # Cut the customers into consecutive blocks of roughly chunk_size planned rows
+    block_ends = np.searchsorted(np.cumsum(customer_quota), np.arange(chunk_size, n, chunk_size), side="left") + 1
+    block_bounds = np.unique(np.concatenate([[0], block_ends, [len(card_counts)]]))
+    for first, last in zip(block_bounds[:-1].tolist(), block_bounds[1:].tolist()):
+        first_card = card_offsets[first]
+        last_card = card_offsets[last - 1] + card_counts[last - 1]
+        customer_idx, card_idx, date_times = plan_customer_block(
+            customer_quota[first:last], card_counts[first:last], card_capacity[first_card:last_card],
+            start_date, end_date, max_transactions_per_card_per_day, max_transactions_per_customer_per_day, rng,
+            profiler
+        )
+        if len(card_idx):
+            yield customer_idx + first, card_idx + first_card, date_times
@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+
+# 16-byte UUID columns need pyarrow, which is optional: without it they are kept as Python bytes
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Compact in-memory representation of the card transaction schema of generate_transactions.py
+# and In_out_generator.py.
+#
+# The row builders produce one Python object per cell: repeated strings (channels, currencies,
+# issuers, names, ids of the population), UUID strings and small dicts for the locations, which
+# comes to several KB per row. The compact form dictionary-encodes the strings as pandas
+# Categoricals, stores the per-row UUIDs as 16 bytes, flattens the location dicts into one
+# column per field and downcasts the small integers. Flattened location columns are named as
+# the alert scripts expect them (latitude, longitude, merchant_country), so a compact frame
+# can be passed straight to alert_engine, whose customer/card grouping then works on the
+# category codes.
+
+# Per-row identifiers, stored as 16-byte binary
+UUID_COLUMNS = ["transaction_id", "device_id", "session_id"]
+
+# Digit strings without leading zeros, stored as integers
+INTEGER_CODE_COLUMNS = ["authorization_code"]
+
+# Nested location dicts and the flat column of each of their fields
+LOCATION_COLUMNS = {
+    "merchant_location": {"city": "merchant_city", "state": "merchant_state", "country": "merchant_country"},
+    "geolocation": {"latitude": "latitude", "longitude": "longitude"},
+    "sender_location": {"city": "sender_city", "state": "sender_state", "country": "sender_country"},
+}
+
+
+# ASCII hex digits, and the position of each of the 32 digits in a canonical UUID string
+HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+UUID_HEX_POSITIONS = np.array([i for i in range(36) if i not in (8, 13, 18, 23)])
+
+
+def uuid_bytes(values):
+    """
+    Pack canonical UUID strings into a (n, 16) uint8 array.
+
+    Returns:
+        tuple: (raw bytes, validity mask); missing values are packed as zeros.
+    """
+    values = np.asarray(values, dtype=object)
+    valid = pd.notna(values)
+    raw = np.zeros((len(values), 16), dtype=np.uint8)
+    if valid.any():
+        packed = bytes.fromhex("".join(values[valid].tolist()).replace("-", ""))
+        raw[valid] = np.frombuffer(packed, dtype=np.uint8).reshape(-1, 16)
+    return raw, valid
+
+
+def uuid_strings(raw, valid=None):
+    """Format a (n, 16) uint8 array as canonical UUID strings, None where not valid."""
+    # All ids are written as ASCII into one buffer, space-separated, and split in a single call
+    chars = np.full((len(raw), 37), ord("-"), dtype=np.uint8)
+    chars[:, 36] = ord(" ")
+    chars[:, UUID_HEX_POSITIONS[0::2]] = HEX_DIGITS[raw >> 4]
+    chars[:, UUID_HEX_POSITIONS[1::2]] = HEX_DIGITS[raw & 0x0F]
+    strings = np.empty(len(raw), dtype=object)
+    strings[:] = chars.tobytes().decode("ascii").split()
+    if valid is not None:
+        strings[~valid] = None
+    return strings
+
+
+def binary_column(raw, valid, index=None):
+    """Series of 16-byte values, Arrow fixed-size binary when pyarrow is available."""
+    if pa is None:
+        values = np.full(len(raw), None, dtype=object)
+        values[valid] = [row.tobytes() for row in raw[valid]]
+        return pd.Series(values, index=index)
+    validity = None if valid.all() else pa.array(valid).buffers()[1]
+    array = pa.FixedSizeBinaryArray.from_buffers(
+        pa.binary(16), len(raw), [validity, pa.py_buffer(raw.tobytes())], null_count=int((~valid).sum())
+    )
+    return pd.Series(pd.arrays.ArrowExtensionArray(array), index=index)
+
+
+def _binary_values(column):
+    """(n, 16) raw bytes and validity mask of a column built by binary_column."""
+    if pa is not None and isinstance(column.dtype, pd.ArrowDtype):
+        array = column.array.__arrow_array__().combine_chunks()
+        data = np.frombuffer(array.buffers()[1], dtype=np.uint8)
+        raw = data[array.offset * 16:(array.offset + len(array)) * 16].reshape(-1, 16)
+        return raw, ~array.is_null().to_numpy(zero_copy_only=False)
+    valid = column.notna().to_numpy()
+    raw = np.zeros((len(column), 16), dtype=np.uint8)
+    if valid.any():
+        raw[valid] = np.frombuffer(b"".join(column[valid].tolist()), dtype=np.uint8).reshape(-1, 16)
+    return raw, valid
+
+
+def _object_values(column):
+    """Values of a compact column as an object array with None for missing values."""
+    values = column.to_numpy(dtype=object)
+    values[pd.isna(values)] = None
+    return values
+
+
+def compact_transactions(transactions):
+    """
+    Convert transactions in the row builders' layout to the compact columnar form.
+
+    Args:
+        transactions (pd.DataFrame): Transactions as built by generate_transactions,
+            In_out_generator or batch_generator.
+
+    Returns:
+        pd.DataFrame: The same transactions with categorical strings, 16-byte UUIDs, flattened
+            locations and downcast integers, in the original column order.
+    """
+    columns = {}
+    for name, column in transactions.items():
+        if name in LOCATION_COLUMNS:
+            locations = column.tolist()
+            for field, flat_name in LOCATION_COLUMNS[name].items():
+                values = pd.Series(
+                    [location[field] if isinstance(location, dict) else None for location in locations],
+                    index=transactions.index
+                )
+                columns[flat_name] = pd.to_numeric(values) if field in ("latitude", "longitude") \
+                    else values.astype("category")
+        elif name in UUID_COLUMNS:
+            columns[name] = binary_column(*uuid_bytes(column.to_numpy(dtype=object)), transactions.index)
+        elif name in INTEGER_CODE_COLUMNS:
+            columns[name] = pd.to_numeric(column).astype("UInt32")
+        elif pd.api.types.is_integer_dtype(column.dtype):
+            columns[name] = pd.to_numeric(column, downcast="integer")
+        elif column.dtype == object or isinstance(column.dtype, pd.StringDtype):
+            columns[name] = column.astype("category")
+        else:
+            columns[name] = column
+    return pd.DataFrame(columns, index=transactions.index)
+
+
+def expand_transactions(compact):
+    """
+    Convert compact transactions back to the row builders' layout (strings, location dicts).
+
+    Location dicts are rebuilt for the rows where any of their fields is set, and None elsewhere.
+    """
+    flat_names = {
+        flat_name: name for name, fields in LOCATION_COLUMNS.items() for flat_name in fields.values()
+    }
+    columns = {}
+    for name, column in compact.items():
+        if name in flat_names:
+            location_name = flat_names[name]
+            if location_name in columns:
+                continue
+            fields = {field: _object_values(compact[flat_name]) for field, flat_name in
+                      LOCATION_COLUMNS[location_name].items() if flat_name in compact}
+            present = np.zeros(len(compact), dtype=bool)
+            for values in fields.values():
+                present |= pd.notna(values)
+            locations = np.full(len(compact), None, dtype=object)
+            locations[present] = [
+                dict(zip(fields, row)) for row in zip(*(values[present].tolist() for values in fields.values()))
+            ]
+            columns[location_name] = locations
+        elif name in UUID_COLUMNS:
+            columns[name] = uuid_strings(*_binary_values(column))
+        elif name in INTEGER_CODE_COLUMNS:
+            values = column.astype(object)
+            columns[name] = np.array([None if pd.isna(v) else str(v) for v in values.tolist()], dtype=object)
+        elif isinstance(column.dtype, pd.CategoricalDtype):
+            columns[name] = _object_values(column)
+        elif pd.api.types.is_integer_dtype(column.dtype):
+            columns[name] = column.astype(np.int64)
+        else:
+            columns[name] = column
+    return pd.DataFrame(columns, index=compact.index)
+
+
+def concat_compact(frames):
+    """
+    Concatenate compact transaction frames, merging the categories of every categorical column
+    instead of falling back to object columns as pd.concat does for differing categories.
+    """
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame()
+    columns = {}
+    for name, column in frames[0].items():
+        parts = [frame[name] for frame in frames]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            columns[name] = pd.api.types.union_categoricals(parts, ignore_order=True)
+        else:
+            columns[name] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
@@ -0,0 +1,225 @@
+import heapq
+import math
+import random
+from datetime import datetime, timedelta
+from profiling import NULL_PROFILER
+
+# Time-ordered transaction streams for replaying into real-time monitoring.
+#
+# Every customer is driven by its own arrival process: a Poisson process, or a Hawkes process
+# in which each transaction raises the customer's intensity for a while, giving the bursts of
+# activity real card usage has. A heap holds the next arrival of every customer, so each event
+# costs O(log customers) and the events come out in global timestamp order without sorting.
+#
+# The daily limits of transaction_parameters.json hold as in the planned modes: an arrival on a
+# day where the customer (or all of its cards) already reached the limit is moved to the next
+# day, and a card that reached max_transactions_per_card is not used again. Daily counts are
+# dropped when the stream moves to the next day, so memory only depends on the number of
+# customers and cards.
+
+PROCESSES = ("poisson", "hawkes")
+
+DAY_SECONDS = 86_400
+
+# Default Hawkes parameters: the share of transactions triggered by an earlier one, and how
+# fast the extra intensity of a transaction decays
+DEFAULT_BRANCHING_RATIO = 0.5
+DEFAULT_DECAY_PER_HOUR = 2.0
+
+# Shape of the gamma distribution of customer activity (mean 1); lower is more uneven
+DEFAULT_ACTIVITY_SHAPE = 2.0
+
+# Rows per DataFrame of the streaming mode
+DEFAULT_STREAM_CHUNK_SIZE = 1_000
+
+
+class PoissonArrivals:
+    """
+    Independent Poisson arrivals per customer.
+
+    Args:
+        rates (list): Arrival rate of each customer, in events per second.
+        rng (random.Random): Source of the inter-arrival times.
+    """
+
+    def __init__(self, rates, rng):
+        self.rates = rates
+        self.rng = rng
+
+    def next_arrival(self, customer, t):
+        """Time of the customer's first arrival after t (seconds)."""
+        return t + self.rng.expovariate(self.rates[customer])
+
+    def observe(self, customer, t):
+        """Record that the customer transacted at t."""
+
+
+class HawkesArrivals:
+    """
+    Self-exciting (Hawkes) arrivals per customer, with an exponential kernel.
+
+    The intensity of a customer is base + sum(alpha * exp(-decay * (t - t_i))) over its past
+    transactions t_i, with alpha = branching_ratio * decay; arrivals are drawn by thinning. The long-run rate of every customer is the
+    rate it is given, of which branching_ratio comes from excitation.
+
+    Args:
+        rates (list): Long-run arrival rate of each customer, in events per second.
+        rng (random.Random): Source of the draws.
+        branching_ratio (float): Expected number of transactions triggered by each transaction, below 1.
+        decay (float): Decay rate of the excitation, per second.
+    """
+
+    def __init__(self, rates, rng, branching_ratio=DEFAULT_BRANCHING_RATIO,
+                 decay=DEFAULT_DECAY_PER_HOUR / 3600):
+        if not 0 <= branching_ratio < 1:
+            raise ValueError(f"branching_ratio must be in [0, 1), not {branching_ratio!r}")
+        self.base = [rate * (1 - branching_ratio) for rate in rates]
+        self.jump = branching_ratio * decay
+        self.decay = decay
+        self.rng = rng
+        self.excitation = [0.0] * len(rates)
+        self.last = [0.0] * len(rates)
+
+    def next_arrival(self, customer, t):
+        base = self.base[customer]
+        excitation = self.excitation[customer] * math.exp(-self.decay * (t - self.last[customer]))
+        expovariate, uniform = self.rng.expovariate, self.rng.random
+        while True:
+            # The intensity only decays until the next arrival, so its current value bounds it
+            bound = base + excitation
+            wait = expovariate(bound)
+            t += wait
+            excitation *= math.exp(-self.decay * wait)
+            if uniform() * bound <= base + excitation:
+                break
+        self.excitation[customer] = excitation
+        self.last[customer] = t
+        return t
+
+    def observe(self, customer, t):
+        self.excitation[customer] += self.jump
+
+
+def customer_rates(num_customers, num_transactions, period_days, rng, activity_shape=DEFAULT_ACTIVITY_SHAPE):
+    """
+    Arrival rate of every customer, in events per second, so the population makes about
+    num_transactions transactions over the period; activity varies between customers.
+    """
+    mean_rate = num_transactions / (max(num_customers, 1) * period_days * DAY_SECONDS)
+    return [mean_rate * rng.gammavariate(activity_shape, 1 / activity_shape) for _ in range(num_customers)]
+
+
+def make_arrivals(process, rates, rng, config=None):
+    """Arrival process of the given type, with Hawkes parameters from config["arrival_process"]."""
+    if process not in PROCESSES:
+        raise ValueError(f"arrival process must be one of {PROCESSES}, not {process!r}")
+    if process == "poisson":
+        return PoissonArrivals(rates, rng)
+    params = (config or {}).get("arrival_process", {})
+    return HawkesArrivals(
+        rates, rng, params.get("branching_ratio", DEFAULT_BRANCHING_RATIO),
+        params.get("decay_per_hour", DEFAULT_DECAY_PER_HOUR) / 3600
+    )
+
+
+def iter_event_slots(customers, customer_cards, config, n=None, process=None, seed=None,
+                     start_date=None, end_date=None, profiler=NULL_PROFILER):
+    """
+    Generate (customer, card, date-time) slots in global time order.
+
+    Args:
+        customers (list): Customer ids.
+        customer_cards (dict): Card ids of each customer.
+        config (dict): Transaction parameters; num_transactions (or n) sets the overall rate, and
+            "arrival_process": {"type", "branching_ratio", "decay_per_hour"} the arrival process.
+        n (int, optional): Number of slots. The rates are set for n slots over the period and
+            the stream runs on past end_date until there are n; by default the stream stops at
+            end_date.
+        process (str, optional): "poisson" or "hawkes", config["arrival_process"]["type"] or
+            Poisson by default.
+        seed (int, optional): Seed of the rates, arrivals and card choices.
+        start_date, end_date (datetime, optional): Period of the stream; by default the
+            transaction_period_days up to now.
+        profiler (profiling.Profiler, optional): Counts the arrivals dropped or moved to the next
+            day under rejected.<limit>.
+
+    Yields:
+        tuple: (customer id, card id, datetime) in non-decreasing time order.
+    """
+    rng = random.Random(seed)
+    period = timedelta(days=config["transaction_period_days"])
+    if end_date is None:
+        end_date = datetime.now() if start_date is None else start_date + period
+    if start_date is None:
+        start_date = end_date - period
+    horizon = (end_date - start_date).total_seconds()
+    process = process or config.get("arrival_process", {}).get("type", "poisson")
+
+    cards = []
+    customer_card_idx = []
+    for customer in customers:
+        customer_card_idx.append(list(range(len(cards), len(cards) + len(customer_cards[customer]))))
+        cards.extend(customer_cards[customer])
+    max_per_card = config["max_transactions_per_card"]
+    max_per_card_day = config["max_transactions_per_card_per_day"]
+    max_per_customer_day = config["max_transactions_per_customer_per_day"]
+
+    num_transactions = config["num_transactions"] if n is None else n
+    rates = customer_rates(len(customers), num_transactions, horizon / DAY_SECONDS or 1, rng)
+    arrivals = make_arrivals(process, rates, rng, config)
+    heap = [
+        (arrivals.next_arrival(customer, 0.0), customer)
+        for customer in range(len(customers)) if rates[customer] > 0 and customer_card_idx[customer]
+    ]
+    heapq.heapify(heap)
+
+    # Calendar days are counted from midnight of the start date
+    midnight_offset = (start_date - start_date.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+    day = 0
+    customer_day_counts = {}
+    card_day_counts = {}
+    card_totals = [0] * len(cards)
+    emitted = 0
+    while heap and (n is None or emitted < n):
+        t, customer = heap[0]
+        if n is None and t > horizon:
+            break
+        event_day = int((t + midnight_offset) // DAY_SECONDS)
+        if event_day != day:
+            day = event_day
+            customer_day_counts.clear()
+            card_day_counts.clear()
+
+        usable = [card for card in customer_card_idx[customer] if card_totals[card] < max_per_card]
+        if not usable:
+            profiler.count("rejected.max_transactions_per_card")
+            heapq.heappop(heap)
+            continue
+        available = [card for card in usable if card_day_counts.get(card, 0) < max_per_card_day]
+        if not available or customer_day_counts.get(customer, 0) >= max_per_customer_day:
+            profiler.count("rejected.max_transactions_per_card_per_day" if not available
+                           else "rejected.max_transactions_per_customer_per_day")
+            next_day = (day + 1) * DAY_SECONDS - midnight_offset
+            heapq.heapreplace(heap, (arrivals.next_arrival(customer, next_day), customer))
+            continue
+
+        card = available[0] if len(available) == 1 else rng.choice(available)
+        card_totals[card] += 1
+        card_day_counts[card] = card_day_counts.get(card, 0) + 1
+        customer_day_counts[customer] = customer_day_counts.get(customer, 0) + 1
+        arrivals.observe(customer, t)
+        heapq.heapreplace(heap, (arrivals.next_arrival(customer, t), customer))
+        emitted += 1
+        yield customers[customer], cards[card], start_date + timedelta(seconds=t)
+
+
+def iter_event_slot_chunks(customers, customer_cards, config, chunk_size=DEFAULT_STREAM_CHUNK_SIZE, **kwargs):
+    """Slots of iter_event_slots in lists of chunk_size, for building rows a chunk at a time."""
+    chunk = []
+    for slot in iter_event_slots(customers, customer_cards, config, **kwargs):
+        chunk.append(slot)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
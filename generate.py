@@ -1,18 +1,158 @@
 import pandas as pd
-import random
 from faker import Faker
 from datetime import datetime, timedelta
 import json
 import numpy as np
+import population_store
+from sinks import DEFAULT_CHUNK_SIZE
 
-# Initialize Faker
-fake = Faker()
+# Module attributes served lazily by the default generator (see __getattr__ at the end of the module)
+LAZY_ATTRIBUTES = {"config", "fake"}
 
-# Load configuration from config.json
-with open("config.json", "r") as f:
-    config = json.load(f)
+# Transaction keys are the account key followed by a 6-digit suffix
+KEY_SUFFIX_MIN = 10**5
+KEY_SUFFIX_COUNT = 10**6 - 10**5
 
-def generate_numbers(num_type='integer', num_digits=10, unique_count=100, secondary_digits=None):
+# Accounts per party in the party/account populations
+MIN_ACCOUNTS_PER_PARTY = 1
+MAX_ACCOUNTS_PER_PARTY = 5
+
+def sample_unique_numbers(num_type, num_digits, count, rng):
+    """
+    Draw count distinct numbers of num_digits digits, without replacement.
+
+    Integers are drawn from the 9 * 10**(num_digits - 1) values of that length; floats from the
+    values with two decimals between the smallest and largest num_digits-digit integer. numpy
+    samples a small count out of a large range with a hash set, so the cost depends on count
+    and not on the size of the key space.
+    """
+    lower_bound = 10**(num_digits - 1)
+    upper_bound = (10**num_digits) - 1
+    if num_type == 'integer':
+        space, scale = upper_bound - lower_bound + 1, 1
+    elif num_type == 'float':
+        space, scale = (upper_bound - lower_bound) * 100 + 1, 100
+    else:
+        raise ValueError("num_type must be 'integer' or 'float'")
+    if count > space:
+        raise ValueError(f"cannot draw {count} unique {num_digits}-digit numbers, there are only {space}")
+
+    offsets = rng.choice(space, size=count, replace=False)
+    if scale == 1:
+        return offsets.astype(np.int64) + lower_bound
+    return np.round(lower_bound + offsets / scale, 2)
+
+
+# Multiplier of the Feistel round function (the 64-bit golden ratio)
+FEISTEL_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+FEISTEL_ROUNDS = 4
+
+def keyed_permutation(numbers, space, key):
+    """
+    Map numbers in 0..space-1 to distinct numbers in 0..space-1, as a permutation keyed by key.
+
+    A Feistel network over the smallest even number of bits covering space is a bijection;
+    results that fall outside the space are passed through it again until they are inside
+    (cycle walking), which keeps it a bijection of 0..space-1. Number i is always mapped to the
+    same value, so keys can be generated in blocks without tracking the ones already used.
+    """
+    half_bits = np.uint64((max(int(space - 1).bit_length(), 2) + 1) // 2)
+    mask = np.uint64((1 << int(half_bits)) - 1)
+    round_keys = np.random.default_rng(key).integers(0, 2**63, size=FEISTEL_ROUNDS, dtype=np.uint64)
+
+    values = np.asarray(numbers, dtype=np.uint64).copy()
+    pending = np.arange(len(values))
+    while len(pending):
+        left, right = values[pending] >> half_bits, values[pending] & mask
+        for round_key in round_keys:
+            mixed = (right ^ round_key) * FEISTEL_MULTIPLIER
+            mixed ^= mixed >> np.uint64(29)
+            left, right = right, left ^ (mixed & mask)
+        values[pending] = (left << half_bits) | right
+        pending = pending[values[pending] >= space]
+    return values.astype(np.int64)
+
+def keyed_unique_numbers(numbers, num_digits, key):
+    """num_digits-digit integers for numbers 0, 1, ..., distinct for distinct numbers; see keyed_permutation."""
+    lower_bound = 10**(num_digits - 1)
+    return keyed_permutation(numbers, 10**num_digits - lower_bound, key) + lower_bound
+
+
+class PartyPopulation:
+    """
+    Parties and their accounts held as compact arrays.
+
+    Party i has key party_keys[i] and owns account_keys[account_offsets[i]:account_offsets[i + 1]].
+    items() yields (party key, list of account keys) like the dict of generate_numbers, so a
+    population can be passed to iter_party_record_chunks directly. Populations loaded from a
+    population_store also carry each party's name, dob and address in details.
+    """
+
+    def __init__(self, party_keys, account_offsets, account_keys, details=None):
+        self.party_keys = party_keys
+        self.account_offsets = account_offsets
+        self.account_keys = account_keys
+        self.details = details
+
+    def __len__(self):
+        return len(self.party_keys)
+
+    @property
+    def account_counts(self):
+        """Number of accounts of each party."""
+        return np.diff(self.account_offsets)
+
+    @property
+    def account_parties(self):
+        """Party key of each account, aligned with account_keys."""
+        return np.repeat(self.party_keys, self.account_counts)
+
+    def items(self):
+        """Yield (party key, list of account keys) pairs in party order."""
+        offsets = self.account_offsets.tolist()
+        for i, party_key in enumerate(self.party_keys.tolist()):
+            yield party_key, self.account_keys[offsets[i]:offsets[i + 1]].tolist()
+
+    def to_dict(self):
+        """Parties as a dict of party key to list of account keys."""
+        return dict(self.items())
+
+    def party_details(self, i):
+        """(name, dob, address) of party i, or None when the population has no details."""
+        if self.details is None:
+            return None
+        return self.details["name"][i], self.details["dob"][i].item(), self.details["address"][i]
+
+
+def build_party_population(num_parties, party_digits=10, account_digits=14, num_type='integer',
+                           min_accounts=MIN_ACCOUNTS_PER_PARTY, max_accounts=MAX_ACCOUNTS_PER_PARTY, seed=None):
+    """
+    Build num_parties parties with min_accounts to max_accounts accounts each.
+
+    Party keys and account keys are drawn without replacement, so no two parties and no two
+    accounts (across all parties) share a key, and each party's account count is drawn in
+    the same vectorized pass.
+
+    Args:
+        num_parties (int): Number of parties.
+        party_digits (int): Number of digits of the party keys.
+        account_digits (int): Number of digits of the account keys.
+        num_type (str): Type of the keys ('integer' or 'float').
+        min_accounts, max_accounts (int): Range of the number of accounts per party.
+        seed (int, optional): Seed of the key and count draws.
+
+    Returns:
+        PartyPopulation: The parties and their accounts.
+    """
+    rng = np.random.default_rng(seed)
+    party_keys = sample_unique_numbers(num_type, party_digits, num_parties, rng)
+    counts = rng.integers(min_accounts, max_accounts + 1, size=num_parties)
+    account_offsets = np.zeros(num_parties + 1, dtype=np.int64)
+    np.cumsum(counts, out=account_offsets[1:])
+    account_keys = sample_unique_numbers(num_type, account_digits, int(account_offsets[-1]), rng)
+    return PartyPopulation(party_keys, account_offsets, account_keys)
+
+def generate_numbers(num_type='integer', num_digits=10, unique_count=100, secondary_digits=None, seed=None):
     """
     Generate unique numbers based on the specified type, number of digits, and volume.
     Optionally, generate a random number of secondary unique numbers (1 to 5) for each primary number.
@@ -22,139 +162,204 @@ def generate_numbers(num_type='integer', num_digits=10, unique_count=100, second
         num_digits (int): Number of digits for the primary number.
         unique_count (int): Number of unique primary values to generate.
         secondary_digits (int, optional): Number of digits for each secondary number if needed.
+        seed (int, optional): Seed of the draws.
 
     Returns:
         dict: A dictionary of primary numbers with lists of secondary numbers (if specified),
               or a list of unique primary numbers if no secondary count is given.
+              Secondary numbers are unique across all primary numbers.
     """
-    numbers = set()
-    lower_bound = 10**(num_digits - 1)
-    upper_bound = (10**num_digits) - 1
-    
-    # Generate primary unique numbers
-    while len(numbers) < unique_count:
-        if num_type == 'integer':
-            num = random.randint(lower_bound, upper_bound)
-        elif num_type == 'float':
-            num = round(random.uniform(lower_bound, upper_bound), 2)
-        else:
-            raise ValueError("num_type must be 'integer' or 'float'")
-        
-        numbers.add(num)
-
-    primary_numbers = list(numbers)
-    
-    # Generate a random number (between 1 and 5) of secondary numbers for each primary number
-    secondary_data = {}
-    for primary in primary_numbers:
-        # Randomly decide how many secondary numbers (1 to 5) to generate for each primary number
-        secondary_unique_count = random.randint(1, 5)
-        secondary_data[primary] = [
-            generate_secondary_number(num_type, secondary_digits) for _ in range(secondary_unique_count)
-        ]
-    
-    return secondary_data
-
-def generate_secondary_number(num_type, num_digits):
-    """Helper function to generate a single number with specified type and digits."""
-    lower_bound = 10**(num_digits - 1)
-    upper_bound = (10**num_digits) - 1
-    
-    if num_type == 'integer':
-        return random.randint(lower_bound, upper_bound)
-    elif num_type == 'float':
-        return round(random.uniform(lower_bound, upper_bound), 2)
-    else:
-        raise ValueError("num_type must be 'integer' or 'float'")
+    if secondary_digits is None:
+        return sample_unique_numbers(num_type, num_digits, unique_count, np.random.default_rng(seed)).tolist()
+    return build_party_population(
+        unique_count, party_digits=num_digits, account_digits=secondary_digits, num_type=num_type, seed=seed
+    ).to_dict()
+
+class PartyGenerator:
+    """
+    Generator of party/account transaction records.
+
+    The config is read from config_path on first use, so importing the module and creating
+    generators is cheap.
+
+    Args:
+        config (dict, optional): Transaction groups, alert ids and rule ids; read from config_path
+            on first use if not given.
+        config_path (str): Path of the config JSON file.
+    """
+
+    def __init__(self, config=None, config_path="config.json"):
+        self._config = config
+        self.config_path = config_path
+        self._rng = None
+        self.fake = Faker()
+
+    @property
+    def config(self):
+        """Configuration loaded from config.json on first use."""
+        if self._config is None:
+            with open(self.config_path, "r") as f:
+                self._config = json.load(f)
+        return self._config
+
+    @property
+    def rng(self):
+        """numpy Generator the transaction fields are drawn from; set "seed" in the config to repeat a run."""
+        if self._rng is None:
+            self._rng = np.random.default_rng(self.config.get("seed"))
+        return self._rng
+
+    def generate_transaction_columns(self, account_key, max_transactions_per_day=200, num_days=1, alpha=1.2, beta=200, round_percentage=0.1):
+        """
+        Generate one account's transactions as a dict of column lists.
+
+        The number of transactions of each day is drawn once, between 1 and max_transactions_per_day,
+        and the day's 6-digit key suffixes are sampled without replacement, so keys are unique
+        within a day without retries. Every other field is drawn for all transactions at once.
+        """
+        config = self.config
+        rng = self.rng
+        start_date = datetime.now() - timedelta(days=num_days)
+        dates = [(start_date + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(num_days)]
+
+        counts = rng.integers(1, max_transactions_per_day + 1, size=num_days)
+        n = int(counts.sum())
+        suffixes = [rng.choice(KEY_SUFFIX_COUNT, size=count, replace=False) for count in counts.tolist()]
+        suffixes = np.concatenate(suffixes) + KEY_SUFFIX_MIN if suffixes else np.zeros(0, dtype=np.int64)
+
+        # Generate transaction amounts using gamma distribution; round_percentage of them are rounded
+        amounts = rng.gamma(alpha, beta, size=n)
+        amounts = np.round(np.where(rng.random(n) < round_percentage, np.round(amounts), amounts), 2)
 
-def generate_transaction_keys(account_key, max_transactions_per_day=200, num_days=1, alpha=1.2, beta=200, round_percentage=0.1):
-    """Generate up to max_transactions_per_day unique 20-digit transaction keys per day with additional fields."""
-    transactions = []
-    start_date = datetime.now() - timedelta(days=num_days)
-    
-    for day in range(num_days):
-        date = (start_date + timedelta(days=day)).strftime("%Y-%m-%d")
-        
-        transaction_keys = set()
-        while len(transaction_keys) < random.randint(1, max_transactions_per_day):
-            transaction_key = f"{account_key}{random.randint(10**5, 10**6 - 1)}"  # Ensures 20-digit uniqueness
-            transaction_keys.add(transaction_key)
-        
-        for txn_key in transaction_keys:
-            transaction_group = random.choice(config["transaction_groups"])  # Sample group from config
-            
-            # Generate transaction amount using gamma distribution
-            amount = np.random.gamma(alpha, beta)
-            if random.random() < round_percentage:  # 10% of the amounts are rounded
-                amount = round(amount)
-            amount = round(amount, 2)
-            
-            # Determine debit_credit_flag based on transaction_group
-            debit_credit_flag = "DEB" if transaction_group.endswith("OUT") else "CRE"
-            
-            # Randomly sample channel_cd and dom_int_indicator
-            channel_cd = random.choice(["UNK", "ITL", "NET"])
-            dom_int_indicator = random.choice(["BEU", "UNK", "BIN"])
-            
-            # Weighted sampling for currency_type
-            currency_type = random.choices(
-                ["DOM", "UNK", "SGB"],
-                weights=[0.9, 0.05, 0.05],
-                k=1
-            )[0]
-            
-            # Sample alert_id and rule_id, get look_back period
-            alert_id_rep = random.choice(config["alert_ids"])
-            rule_id = random.choice(list(config["rule_ids"].keys()))
-            look_back_period = config["rule_ids"][rule_id]
-            
-            transactions.append({
-                'account_key': account_key,
-                'transaction_key': txn_key,
-                'transaction_date': date,
-                'transaction_group': transaction_group,
-                'transaction_amount': amount,
-                'debit_credit_flag': debit_credit_flag,
-                'channel_cd': channel_cd,
-                'dom_int_indicator': dom_int_indicator,
-                'currency_type': currency_type,
-                'alert_id_rep': alert_id_rep,
-                'rule_id': rule_id,
-                'look_back_period': look_back_period
-            })
-    
-    return transactions
-
-# Generate data: 2 unique party keys, each with a random number (1 to 5) of account keys
-party_keys_with_accounts = generate_numbers(
-    num_type='integer', num_digits=10, unique_count=2, secondary_digits=14
-)
-
-# Convert the generated data to a pandas DataFrame and add fake details for each party key and account transactions
-data = []
-for party_key, account_keys in party_keys_with_accounts.items():
-    # Generate fake details only once per party_key
-    party_name = fake.name()
-    party_dob = fake.date_of_birth(minimum_age=18, maximum_age=90)
-    party_address = fake.address()
-    
-    for account_key in account_keys:
-        # Add party details with each account
-        account_info = {
-            'party_key': party_key,
-            'account_key': account_key,
-            'name': party_name,
-            'dob': party_dob,
-            'address': party_address
+        groups = np.asarray(config["transaction_groups"])
+        transaction_groups = groups[rng.integers(len(groups), size=n)]
+        rule_ids = list(config["rule_ids"])
+        rule_idx = rng.integers(len(rule_ids), size=n)
+        alert_ids = np.asarray(config["alert_ids"])
+
+        return {
+            'account_key': [account_key] * n,
+            'transaction_key': np.char.add(str(account_key), suffixes.astype(str)).tolist(),
+            'transaction_date': np.repeat(dates, counts).tolist(),
+            'transaction_group': transaction_groups.tolist(),
+            'transaction_amount': amounts.tolist(),
+            # debit_credit_flag follows the transaction_group
+            'debit_credit_flag': np.where(np.char.endswith(transaction_groups, "OUT"), "DEB", "CRE").tolist(),
+            'channel_cd': rng.choice(["UNK", "ITL", "NET"], size=n).tolist(),
+            'dom_int_indicator': rng.choice(["BEU", "UNK", "BIN"], size=n).tolist(),
+            'currency_type': rng.choice(["DOM", "UNK", "SGB"], size=n, p=[0.9, 0.05, 0.05]).tolist(),
+            'alert_id_rep': alert_ids[rng.integers(len(alert_ids), size=n)].tolist(),
+            'rule_id': [rule_ids[i] for i in rule_idx.tolist()],
+            'look_back_period': [config["rule_ids"][rule_ids[i]] for i in rule_idx.tolist()],
         }
-        
-        # Generate transactions for each account_key
-        transactions = generate_transaction_keys(account_key, max_transactions_per_day=200, num_days=1)
-        
-        # Append each transaction with account and party details
-        for transaction in transactions:
-            record = {**account_info, **transaction}
-            data.append(record)
-
-df = pd.DataFrame(data)
-print(df)
+
+    def generate_transaction_keys(self, account_key, **kwargs):
+        """Generate up to max_transactions_per_day unique 20-digit transaction keys per day with additional fields."""
+        columns = self.generate_transaction_columns(account_key, **kwargs)
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def party_population(self, num_parties, seed=None):
+        """
+        Build num_parties parties with their accounts.
+
+        With "population_store" and "seed" set in the config, the parties and their details are
+        loaded from (and added to) the population store instead; see population_store.
+        """
+        directory = population_store.store_dir(self.config)
+        if directory is None:
+            return build_party_population(num_parties, seed=seed)
+        return population_store.PopulationStore(directory).party_population(num_parties, self.config["seed"])
+
+    def generate_party_columns(self, party_key, account_keys, max_transactions_per_day=200, num_days=1, details=None):
+        """
+        Generate the transactions of one party's accounts as column lists, each row carrying the party's details.
+
+        details is the party's (name, dob, address); fake ones are generated when it is not given.
+        """
+        if details is None:
+            # Generate fake details only once per party_key
+            details = self.fake.name(), self.fake.date_of_birth(minimum_age=18, maximum_age=90), self.fake.address()
+        party_name, party_dob, party_address = details
+
+        columns = {'party_key': [], 'account_key': [], 'name': [], 'dob': [], 'address': []}
+        for account_key in account_keys:
+            transactions = self.generate_transaction_columns(account_key, max_transactions_per_day=max_transactions_per_day, num_days=num_days)
+            n = len(transactions['transaction_key'])
+            columns['party_key'] += [party_key] * n
+            columns['name'] += [party_name] * n
+            columns['dob'] += [party_dob] * n
+            columns['address'] += [party_address] * n
+            for name, values in transactions.items():
+                columns.setdefault(name, []).extend(values)
+        return columns
+
+    def generate_party_records(self, party_key, account_keys, max_transactions_per_day=200, num_days=1):
+        """Generate the transaction records of one party's accounts, each carrying the party's fake details."""
+        columns = self.generate_party_columns(party_key, account_keys, max_transactions_per_day=max_transactions_per_day, num_days=num_days)
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def iter_party_record_chunks(self, party_keys_with_accounts, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+        """
+        Generate party/account transaction records as DataFrame chunks of at least chunk_size rows.
+
+        Only the current chunk is held in memory, so large populations can be streamed to a sink.
+        The last chunk may be smaller. The party details of a PartyPopulation that has them are
+        used instead of fake ones. Extra keyword arguments go to generate_party_columns.
+        """
+        party_details = getattr(party_keys_with_accounts, "party_details", lambda i: None)
+        columns = {}
+        for i, (party_key, account_keys) in enumerate(party_keys_with_accounts.items()):
+            party_columns = self.generate_party_columns(party_key, account_keys, details=party_details(i), **kwargs)
+            for name, values in party_columns.items():
+                columns.setdefault(name, []).extend(values)
+            if len(columns.get('party_key', [])) >= chunk_size:
+                yield pd.DataFrame(columns)
+                columns = {}
+        if columns.get('party_key'):
+            yield pd.DataFrame(columns)
+
+
+_default_generator = None
+
+def default_generator():
+    """PartyGenerator behind the module-level functions, reading config.json from the working directory on first use."""
+    global _default_generator
+    if _default_generator is None:
+        _default_generator = PartyGenerator()
+    return _default_generator
+
+def generate_transaction_keys(account_key, **kwargs):
+    """Generate transaction keys for an account with the default generator; see PartyGenerator.generate_transaction_keys."""
+    return default_generator().generate_transaction_keys(account_key, **kwargs)
+
+def generate_transaction_columns(account_key, **kwargs):
+    """Generate an account's transactions as column lists with the default generator; see PartyGenerator.generate_transaction_columns."""
+    return default_generator().generate_transaction_columns(account_key, **kwargs)
+
+def generate_party_records(party_key, account_keys, **kwargs):
+    """Generate one party's records with the default generator; see PartyGenerator.generate_party_records."""
+    return default_generator().generate_party_records(party_key, account_keys, **kwargs)
+
+def iter_party_record_chunks(party_keys_with_accounts, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """Generate record chunks with the default generator; see PartyGenerator.iter_party_record_chunks."""
+    return default_generator().iter_party_record_chunks(party_keys_with_accounts, chunk_size=chunk_size, **kwargs)
+
+def __getattr__(name):
+    # config and fake are read from the default generator when first accessed
+    if name in LAZY_ATTRIBUTES:
+        return getattr(default_generator(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == "__main__":
+    # Generate data: 2 unique party keys, each with a random number (1 to 5) of account keys
+    party_keys_with_accounts = generate_numbers(
+        num_type='integer', num_digits=10, unique_count=2, secondary_digits=14
+    )
+
+    # Convert the generated data to a pandas DataFrame and add fake details for each party key and account transactions
+    data = []
+    for party_key, account_keys in party_keys_with_accounts.items():
+        data.extend(generate_party_records(party_key, account_keys, max_transactions_per_day=200, num_days=1))
+
+    df = pd.DataFrame(data)
+    print(df)
@@ -1,199 +1,397 @@
 import pandas as pd
 import random
-import uuid
 from faker import Faker
 from datetime import datetime, timedelta
 import numpy as np
 import json
-from collections import defaultdict
-
-# Load transaction parameters from config file
-with open("transaction_parameters.json", "r") as f:
-    config = json.load(f)
-
-# Initialize Faker
-fake = Faker()
-
-# Extract parameters from config
-num_transactions = config["num_transactions"]
-num_customers = config["num_customers"]
-max_transactions_per_card = config["max_transactions_per_card"]
-max_cards_per_customer = config["max_cards_per_customer"]
-transaction_period_days = config["transaction_period_days"]
-alpha = config["transaction_amount_distribution"]["alpha"]
-beta = config["transaction_amount_distribution"]["beta"]
-max_transactions_per_card_per_day = config["max_transactions_per_card_per_day"]
-max_transactions_per_customer_per_day = config["max_transactions_per_customer_per_day"]
-max_merchants = config["max_merchants"]
-domestic_percentage = config["domestic_percentage"]
-
-# Generate Customers, Cards, Customer Names, and Card Issuers
-customers = [str(uuid.uuid4()) for _ in range(num_customers)]
-customer_cards = {customer: [str(uuid.uuid4()) for _ in range(random.randint(1, max_cards_per_customer))] for customer in customers}
-
-# Map each customer ID to a unique name
-customer_names = {customer: fake.name() for customer in customers}
-
-# Map each card ID to a unique issuer
-possible_issuers = ["Bank of America", "Chase", "Wells Fargo", "CitiBank"]
-card_issuers = {card: random.choice(possible_issuers) for cards in customer_cards.values() for card in cards}
-
-# Pre-generate a limited number of unique merchants
-merchants = {}
-for _ in range(max_merchants):
-    merchant_id = str(uuid.uuid4())
-    merchants[merchant_id] = {
-        "merchant_name": fake.company(),
-        "merchant_location": {
-            "city": fake.city(),
-            "state": fake.state_abbr(),
-            "country": "UK"  # Default to UK for domestic transactions
-        },
-        "merchant_terminal_id": "T" + str(random.randint(1000, 9999))
-    }
-
-# Dictionary to track the number of transactions per card and per customer per day
-transactions_per_card_per_day = defaultdict(lambda: defaultdict(int))
-transactions_per_customer_per_day = defaultdict(lambda: defaultdict(int))
-
-# Generate transaction datetime within a specified period
-def generate_transaction_datetime():
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=transaction_period_days)
-    return fake.date_time_between(start_date=start_date, end_date=end_date)
+import capacity_planner
+import population_builder
+import population_store
+from sinks import DEFAULT_CHUNK_SIZE
+import value_pools
+import batch_generator
+import columnar
+import identifiers
+import event_stream
+import profiling
 
-# Generate transaction amount following a gamma distribution
-def generate_transaction_amount():
-    return round(np.random.gamma(alpha, beta), 2)
+# Module attributes served lazily by the default generator, for code written against the
+# former module-level globals (see __getattr__ at the end of the module)
+LAZY_ATTRIBUTES = {"config", "fake", "pools", "customers", "customer_cards", "customer_names", "card_issuers", "merchants"}
 
-# Generate a DataFrame of transactions
-def generate_transactions(n):
-    data = []
-    for _ in range(n):
-        customer = random.choice(customers)
-        card = random.choice(customer_cards[customer])
-        
-        # Generate a transaction date
-        transaction_date = generate_transaction_datetime()
-        transaction_date_str = transaction_date.strftime("%Y-%m-%d")
-        
-        # Check daily limits for the card and customer
-        if transactions_per_card_per_day[card][transaction_date_str] >= max_transactions_per_card_per_day:
-            continue
-        if transactions_per_customer_per_day[customer][transaction_date_str] >= max_transactions_per_customer_per_day:
-            continue
-        
-        # Ensure the max transactions per card limit is respected
-        card_transaction_count = len([t for t in data if t["card_id"] == card])
-        if card_transaction_count >= max_transactions_per_card:
-            continue
-
-        # Randomly select an existing merchant from the pre-generated merchants
-        merchant_id = random.choice(list(merchants.keys()))
-        merchant_details = merchants[merchant_id]
-        
-        # Determine account type and corresponding card type
-        account_type = random.choice(["debit", "credit", "saving"])
-        if account_type == "debit":
-            card_type = "Visa"
-        elif account_type == "credit":
-            card_type = random.choice(["Visa", "MasterCard"])
-        elif account_type == "saving":
-            card_type = "Visa"
+possible_issuers = population_builder.POSSIBLE_ISSUERS
+
+
+class TransactionGenerator:
+    """
+    Card transaction generator.
+
+    Nothing is done on construction: the config is read and the customers, cards and merchants
+    are built on first use, so importing the module and creating generators is cheap.
+
+    Args:
+        config (dict, optional): Transaction parameters; read from config_path on first use if not given.
+        config_path (str): Path of the transaction parameters JSON file.
+        population (dict, optional): Customers, cards and merchants to use instead of building them,
+            as returned by population_builder.build_population.
+        profiler (profiling.Profiler, optional): Records the time of each phase and the draws
+            rejected by the limits; set up from the "profile" config section by default.
+    """
+
+    # Whether the columnar batch engine of batch_generator produces this generator's schema
+    has_batch_engine = True
+
+    def __init__(self, config=None, config_path="transaction_parameters.json", population=None, profiler=None):
+        self._config = config
+        self.config_path = config_path
+        self._population = population
+        self._profiler = profiler
+        self._pools = None
+        self._ids = None
+        self.fake = Faker()
+
+    # Load transaction parameters from config file
+    @property
+    def config(self):
+        if self._config is None:
+            with open(self.config_path, "r") as f:
+                self._config = json.load(f)
+        return self._config
+
+    # Phase timers and counters, see profiling.py; a no-op unless "profile" is set in the config
+    @property
+    def profiler(self):
+        if self._profiler is None:
+            self._profiler = profiling.Profiler.from_config(self.config)
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
+
+    # Pre-sampled Faker values drawn from on the per-row path
+    @property
+    def pools(self):
+        if self._pools is None:
+            self._pools = value_pools.PoolCache(seed=self.config.get("seed"))
+        return self._pools
+
+    # Seeded UUIDs for the transaction, device and session ids; set "id_version": 7 in the config
+    # for transaction ids that sort by transaction time
+    @property
+    def ids(self):
+        if self._ids is None:
+            self._ids = identifiers.IdFactory(seed=self.config.get("seed"), version=self.config.get("id_version", 4))
+        return self._ids
+
+    # Customers, Cards, Customer Names, Card Issuers and Merchants; set "seed" in the config
+    # to get the same population on every run, and "population_store" (a directory, or true
+    # for the default one) to load it from disk instead of rebuilding it with Faker
+    @property
+    def population(self):
+        if self._population is None:
+            directory = population_store.store_dir(self.config)
+            with self.profiler.phase("population"):
+                if directory is None:
+                    self._population = population_builder.build_population(self.config, seed=self.config.get("seed"))
+                else:
+                    self._population = population_store.PopulationStore(directory).card_population(
+                        self.config, self.config["seed"]
+                    )
+        return self._population
+
+    @population.setter
+    def population(self, population):
+        self._population = population
+
+    @property
+    def customers(self):
+        return self.population["customers"]
+
+    @property
+    def customer_cards(self):
+        return self.population["customer_cards"]
+
+    @property
+    def customer_names(self):
+        return self.population["customer_names"]
+
+    @property
+    def card_issuers(self):
+        return self.population["card_issuers"]
+
+    @property
+    def merchants(self):
+        return self.population["merchants"]
+
+    # Generate transaction datetime within a specified period
+    def generate_transaction_datetime(self):
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=self.config["transaction_period_days"])
+        return self.fake.date_time_between(start_date=start_date, end_date=end_date)
+
+    # Plan the customer, card and date-time of every transaction up front, so that the
+    # daily and per-card limits hold without skipping draws
+    def plan_transaction_slots(self, n):
+        return next(self.plan_transaction_slot_chunks(n, chunk_size=max(n, 1)), [])
+
+    # Same plan, produced one block of customers at a time for the chunked mode
+    def plan_transaction_slot_chunks(self, n, chunk_size):
+        config = self.config
+        customers = self.customers
+        customer_cards = self.customer_cards
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=config["transaction_period_days"])
+        card_counts = [len(customer_cards[customer]) for customer in customers]
+        cards = [card for customer in customers for card in customer_cards[customer]]
+        profiler = self.profiler
+        plan = capacity_planner.iter_plan_chunks(
+            n, card_counts, start_date, end_date, config["max_transactions_per_card"],
+            config["max_transactions_per_card_per_day"], config["max_transactions_per_customer_per_day"], chunk_size,
+            profiler=profiler
+        )
+        while True:
+            with profiler.phase("plan"):
+                block = next(plan, None)
+                if block is None:
+                    return
+                customer_idx, card_idx, transaction_dates = block
+                slots = [
+                    (customers[customer], cards[card], transaction_date)
+                    for customer, card, transaction_date in zip(customer_idx.tolist(), card_idx.tolist(), transaction_dates.tolist())
+                ]
+            yield slots
+
+    # Generate transaction amount following a gamma distribution
+    def generate_transaction_amount(self):
+        distribution = self.config["transaction_amount_distribution"]
+        return round(np.random.gamma(distribution["alpha"], distribution["beta"]), 2)
+
+    # Build a DataFrame of transactions for planned (customer, card, date) slots
+    def build_transactions(self, slots):
+        profiler = self.profiler
+        merchants, card_issuers, customer_names = self.merchants, self.card_issuers, self.customer_names
+        pools, ids = profiler.timed(self.pools, "build.faker_pools"), profiler.timed(self.ids, "build.uuid")
+        domestic_percentage = self.config["domestic_percentage"]
+        data = []
+        with profiler.phase("build.rows"):
+            for customer, card, transaction_date in slots:
+                # Randomly select an existing merchant from the pre-generated merchants
+                merchant_id = random.choice(list(merchants.keys()))
+                merchant_details = merchants[merchant_id]
         
-        # Determine the payment channel
-        payment_channel = random.choice(["POS", "online", "mobile_app"])
-
-        # Set payment method based on payment channel
-        if payment_channel == "POS":
-            payment_method = random.choice(["swipe", "NFC", "chip"])
-        else:
-            payment_method = "CNP"
-
-        # Only populate 3D Secure status for online transactions
-        if payment_channel == "online":
-            three_d_secure_status = random.choice(["Passed", "Failed"])
-        else:
-            three_d_secure_status = None
-
-        # Populate device ID and IP address for online and mobile app transactions
-        if payment_channel in ["online", "mobile_app"]:
-            device_id = str(uuid.uuid4())
-            ip_address = fake.ipv4()
-        else:
-            device_id = None
-            ip_address = None
-
-        # Populate user agent only for online transactions
-        if payment_channel == "online":
-            user_agent = fake.user_agent()
-        else:
-            user_agent = None
-
-        # Determine if the transaction is domestic or international
-        is_domestic = random.choices([True, False], weights=[domestic_percentage, 100 - domestic_percentage])[0]
-        if is_domestic:
-            country = "UK"
-            currency = "GBP"
-        else:
-            country = fake.country_code()
-            currency = random.choice(["USD", "EUR", "CAD", "JPY", "AUD"])  # Random foreign currency
+                # Determine account type and corresponding card type
+                account_type = random.choice(["debit", "credit", "saving"])
+                if account_type == "debit":
+                    card_type = "Visa"
+                elif account_type == "credit":
+                    card_type = random.choice(["Visa", "MasterCard"])
+                elif account_type == "saving":
+                    card_type = "Visa"
         
-        transaction = {
-            "transaction_id": str(uuid.uuid4()),
-            "customer_id": customer,
-            "card_id": card,
-            "transaction_type": payment_channel,
-            "transaction_date_time": transaction_date,
-            "transaction_amount": generate_transaction_amount(),
-            "currency": currency,
-            "mcc": random.choice(["5411", "5812", "5921", "5999", "5735"]),
-            "description": random.choice(["Grocery", "Restaurant", "Electronics", "Clothing", "Gas"]),
-            "account_type": account_type,  # Set account type
-            "account_balance": round(random.uniform(100.0, 10000.0), 2),
-            "card_type": card_type,  # Set card type based on account type
-            "card_number_masked": "**** **** **** " + str(random.randint(1000, 9999)),
-            "card_expiration_date": fake.credit_card_expire(),
-            "card_issuer": card_issuers[card],  # Use the pre-generated card issuer
-            "cardholder_name": customer_names[customer],  # Use the pre-generated customer name
-            "merchant_id": merchant_id,
-            "merchant_name": merchant_details["merchant_name"],
-            "merchant_location": {
-                "city": merchant_details["merchant_location"]["city"] if is_domestic else fake.city(),
-                "state": merchant_details["merchant_location"]["state"] if is_domestic else fake.state_abbr(),
-                "country": country
-            },
-            "merchant_terminal_id": merchant_details["merchant_terminal_id"],
-            "payment_method": payment_method,
-            "payment_channel": payment_channel,
-            "geolocation": {
-                "latitude": fake.latitude(),
-                "longitude": fake.longitude()
-            },
-            "authorization_code": str(random.randint(100000, 999999)),
-            "authentication_method": random.choice(["PIN", "biometric", "password"]),
-            "3d_secure_status": three_d_secure_status,
-            "fraud_risk_score": random.randint(0, 100),
-            "transaction_status": random.choice(["approved", "pending", "failed"]),
-            "failure_reason": random.choice(["insufficient funds", "fraud detected", "technical error", None]),
-            "exchange_rate": round(random.uniform(0.5, 1.5), 2) if not is_domestic else None,
-            "rewards_earned": random.randint(0, 10),
-            "ip_address": ip_address,
-            "device_id": device_id,
-            "user_agent": user_agent,
-            "session_id": str(uuid.uuid4()),
-            "referral_source": random.choice(["email", "social media", "direct", "referral"])
-        }
+                # Determine the payment channel
+                payment_channel = random.choice(["POS", "online", "mobile_app"])
+
+                # Set payment method based on payment channel
+                if payment_channel == "POS":
+                    payment_method = random.choice(["swipe", "NFC", "chip"])
+                else:
+                    payment_method = "CNP"
+
+                # Only populate 3D Secure status for online transactions
+                if payment_channel == "online":
+                    three_d_secure_status = random.choice(["Passed", "Failed"])
+                else:
+                    three_d_secure_status = None
+
+                # Populate device ID and IP address for online and mobile app transactions
+                if payment_channel in ["online", "mobile_app"]:
+                    device_id = ids.next_id()
+                    ip_address = pools["ipv4"].sample()
+                else:
+                    device_id = None
+                    ip_address = None
+
+                # Populate user agent only for online transactions
+                if payment_channel == "online":
+                    user_agent = pools["user_agent"].sample()
+                else:
+                    user_agent = None
+
+                # Determine if the transaction is domestic or international
+                is_domestic = random.choices([True, False], weights=[domestic_percentage, 100 - domestic_percentage])[0]
+                if is_domestic:
+                    country = "UK"
+                    currency = "GBP"
+                else:
+                    country = pools["country_code"].sample()
+                    currency = random.choice(["USD", "EUR", "CAD", "JPY", "AUD"])  # Random foreign currency
         
-        # Update daily transaction counts
-        transactions_per_card_per_day[card][transaction_date_str] += 1
-        transactions_per_customer_per_day[customer][transaction_date_str] += 1
+                transaction = {
+                    "transaction_id": ids.next_id(transaction_date),
+                    "customer_id": customer,
+                    "card_id": card,
+                    "transaction_type": payment_channel,
+                    "transaction_date_time": transaction_date,
+                    "transaction_amount": self.generate_transaction_amount(),
+                    "currency": currency,
+                    "mcc": random.choice(["5411", "5812", "5921", "5999", "5735"]),
+                    "description": random.choice(["Grocery", "Restaurant", "Electronics", "Clothing", "Gas"]),
+                    "account_type": account_type,  # Set account type
+                    "account_balance": round(random.uniform(100.0, 10000.0), 2),
+                    "card_type": card_type,  # Set card type based on account type
+                    "card_number_masked": "**** **** **** " + str(random.randint(1000, 9999)),
+                    "card_expiration_date": pools["credit_card_expire"].sample(),
+                    "card_issuer": card_issuers[card],  # Use the pre-generated card issuer
+                    "cardholder_name": customer_names[customer],  # Use the pre-generated customer name
+                    "merchant_id": merchant_id,
+                    "merchant_name": merchant_details["merchant_name"],
+                    "merchant_location": {
+                        "city": merchant_details["merchant_location"]["city"] if is_domestic else pools["city"].sample(),
+                        "state": merchant_details["merchant_location"]["state"] if is_domestic else pools["state_abbr"].sample(),
+                        "country": country
+                    },
+                    "merchant_terminal_id": merchant_details["merchant_terminal_id"],
+                    "payment_method": payment_method,
+                    "payment_channel": payment_channel,
+                    "geolocation": {
+                        "latitude": pools["latitude"].sample(),
+                        "longitude": pools["longitude"].sample()
+                    },
+                    "authorization_code": str(random.randint(100000, 999999)),
+                    "authentication_method": random.choice(["PIN", "biometric", "password"]),
+                    "3d_secure_status": three_d_secure_status,
+                    "fraud_risk_score": random.randint(0, 100),
+                    "transaction_status": random.choice(["approved", "pending", "failed"]),
+                    "failure_reason": random.choice(["insufficient funds", "fraud detected", "technical error", None]),
+                    "exchange_rate": round(random.uniform(0.5, 1.5), 2) if not is_domestic else None,
+                    "rewards_earned": random.randint(0, 10),
+                    "ip_address": ip_address,
+                    "device_id": device_id,
+                    "user_agent": user_agent,
+                    "session_id": ids.next_id(),
+                    "referral_source": random.choice(["email", "social media", "direct", "referral"])
+                }
         
-        data.append(transaction)
-    
-    df = pd.DataFrame(data)
-    return df
-
-# Generate the transactions DataFrame
-df = generate_transactions(num_transactions)
-df.head()
+                data.append(transaction)
+
+        with profiler.phase("build.dataframe"):
+            df = pd.DataFrame(data)
+        profiler.count("rows", len(df))
+        return df
+
+    # Generate a DataFrame of transactions
+    def generate_transactions(self, n):
+        # Customer, card and date come from the capacity plan, which already respects the
+        # daily limits for the card and customer and the max transactions per card
+        return self.build_transactions(self.plan_transaction_slots(n))
+
+    # Generate the transactions in DataFrame chunks of about chunk_size rows, so large
+    # datasets can be streamed to a sink in bounded memory
+    def iter_transaction_chunks(self, n, chunk_size=DEFAULT_CHUNK_SIZE):
+        for slots in self.plan_transaction_slot_chunks(n, chunk_size):
+            yield self.build_transactions(slots)
+
+    # Generate the transactions in global time order, in DataFrame chunks of chunk_size rows, with
+    # every customer driven by a Poisson or Hawkes arrival process (see event_stream); runs to
+    # the end of the period unless n is given, so it can feed a real-time replay
+    def iter_transaction_stream(self, n=None, chunk_size=event_stream.DEFAULT_STREAM_CHUNK_SIZE, process=None,
+                                seed=None, start_date=None, end_date=None):
+        for slots in event_stream.iter_event_slot_chunks(
+            self.customers, self.customer_cards, self.config, chunk_size, n=n, process=process, seed=seed,
+            start_date=start_date, end_date=end_date, profiler=self.profiler
+        ):
+            yield self.build_transactions(slots)
+
+    # Subclasses whose schema the batch engine does not produce (has_batch_engine = False)
+    # cannot use the batch methods below
+    def _require_batch_engine(self):
+        if not self.has_batch_engine:
+            raise ValueError(f"{type(self).__name__} has no batch engine")
+
+    # Generate a DataFrame of transactions column by column from a seeded numpy Generator,
+    # for volumes where the per-row loop above is too slow. The period ends at end_date, now by
+    # default; fix it to repeat a seeded run exactly
+    def generate_transactions_batch(self, n, seed=None, end_date=None):
+        self._require_batch_engine()
+        end_date = datetime.now() if end_date is None else end_date
+        return batch_generator.generate_transactions_batch(n, self.population, self.config, end_date, seed=seed)
+
+    # Batch mode in DataFrame chunks of about chunk_size rows
+    def iter_transaction_batches(self, n, chunk_size=DEFAULT_CHUNK_SIZE, seed=None, end_date=None):
+        self._require_batch_engine()
+        end_date = datetime.now() if end_date is None else end_date
+        return batch_generator.iter_transaction_batches(n, self.population, self.config, chunk_size, end_date, seed=seed)
+
+    # Generate the transactions in the compact columnar form of columnar.py (categorical strings,
+    # 16-byte UUIDs, flat locations), compacting every chunk as soon as it is built so the row
+    # layout is never held for more than chunk_size rows
+    def generate_compact_transactions(self, n, chunk_size=DEFAULT_CHUNK_SIZE, batch=False, seed=None, end_date=None):
+        chunks = self.iter_transaction_batches(n, chunk_size, seed=seed, end_date=end_date) if batch \
+            else self.iter_transaction_chunks(n, chunk_size)
+        return columnar.concat_compact(columnar.compact_transactions(chunk) for chunk in chunks)
+
+
+_default_generator = None
+
+# Generator behind the module-level functions, reading transaction_parameters.json from the
+# working directory on first use
+def default_generator():
+    global _default_generator
+    if _default_generator is None:
+        _default_generator = TransactionGenerator()
+    return _default_generator
+
+# Module-level API, kept for scripts and notebooks
+def generate_transaction_datetime():
+    return default_generator().generate_transaction_datetime()
+
+def plan_transaction_slots(n):
+    return default_generator().plan_transaction_slots(n)
+
+def plan_transaction_slot_chunks(n, chunk_size):
+    return default_generator().plan_transaction_slot_chunks(n, chunk_size)
+
+def generate_transaction_amount():
+    return default_generator().generate_transaction_amount()
+
+def build_transactions(slots):
+    return default_generator().build_transactions(slots)
+
+def generate_transactions(n):
+    return default_generator().generate_transactions(n)
+
+def iter_transaction_chunks(n, chunk_size=DEFAULT_CHUNK_SIZE):
+    return default_generator().iter_transaction_chunks(n, chunk_size)
+
+def iter_transaction_stream(n=None, chunk_size=event_stream.DEFAULT_STREAM_CHUNK_SIZE, **kwargs):
+    return default_generator().iter_transaction_stream(n, chunk_size, **kwargs)
+
+# Customers, cards and merchants in the form expected by batch_generator
+def population():
+    return default_generator().population
+
+def generate_transactions_batch(n, seed=None, end_date=None):
+    return default_generator().generate_transactions_batch(n, seed=seed, end_date=end_date)
+
+def iter_transaction_batches(n, chunk_size=DEFAULT_CHUNK_SIZE, seed=None, end_date=None):
+    return default_generator().iter_transaction_batches(n, chunk_size, seed=seed, end_date=end_date)
+
+def generate_compact_transactions(n, chunk_size=DEFAULT_CHUNK_SIZE, batch=False, seed=None, end_date=None):
+    return default_generator().generate_compact_transactions(n, chunk_size, batch=batch, seed=seed, end_date=end_date)
+
+# config, customers, merchants, ... are read from the default generator when first accessed
+def __getattr__(name):
+    if name in LAZY_ATTRIBUTES:
+        return getattr(default_generator(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    # Generate the transactions DataFrame
+    generator = default_generator()
+    with generator.profiler:
+        df = generator.generate_transactions(generator.config["num_transactions"])
+    print(df.head())
+    if generator.profiler.enabled:
+        generator.profiler.write()
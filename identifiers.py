@@ -0,0 +1,153 @@
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import columnar
+
+# Seeded UUID generation in bulk.
+#
+# Identifiers are drawn as raw bytes from a numpy Generator, many at a time, and the version
+# and variant bits are set on the whole buffer. Version 4 ids are fully random; version 7 ids
+# start with a 48-bit Unix millisecond timestamp, so ids given the transaction times sort in
+# time order, which keeps Parquet row groups sorted and compressing well.
+#
+# The ids can be taken as a 16-byte binary column, as a UuidArray that only formats the ids
+# that are read, or one string at a time from a pre-drawn block for the per-row builders.
+
+DEFAULT_BLOCK_SIZE = 4096
+VERSIONS = (4, 7)
+UNIX_EPOCH = datetime(1970, 1, 1)
+
+
+def _timestamp_bytes(timestamps, n):
+    """Big-endian 48-bit Unix milliseconds of each id, from datetimes (or now when None)."""
+    if timestamps is None:
+        ms = np.full(n, time.time_ns() // 1_000_000, dtype=np.int64)
+    else:
+        times = pd.DatetimeIndex(np.atleast_1d(timestamps))
+        if times.tz is not None:
+            times = times.tz_convert("UTC").tz_localize(None)
+        ms = times.as_unit("ms").asi8.copy()
+        ms[times.isna()] = time.time_ns() // 1_000_000
+        ms = np.broadcast_to(ms, (n,))
+    return ms.astype(">u8").view(np.uint8).reshape(-1, 8)[:, 2:]
+
+
+def _unix_ms(timestamp):
+    """Unix milliseconds of one datetime (or now when None)."""
+    if timestamp is not None and not isinstance(timestamp, datetime):
+        timestamp = pd.Timestamp(timestamp)
+    if timestamp is None or timestamp is pd.NaT:
+        return time.time_ns() // 1_000_000
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return (timestamp - UNIX_EPOCH) // timedelta(milliseconds=1)
+
+
+def random_uuids(rng, n, version=4, timestamps=None):
+    """
+    Draw n UUIDs as a (n, 16) uint8 array.
+
+    Args:
+        rng (np.random.Generator): Source of the random bits.
+        n (int): Number of ids.
+        version (int): 4 for random ids, 7 for time-ordered ids.
+        timestamps (optional): Datetime (or array of n datetimes) of version 7 ids, now by default.
+    """
+    if version not in VERSIONS:
+        raise ValueError(f"UUID version must be one of {VERSIONS}, not {version!r}")
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    if version == 7:
+        raw[:, :6] = _timestamp_bytes(timestamps, n)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | (version << 4)
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    return raw
+
+
+class UuidArray:
+    """
+    UUIDs held as raw bytes and only formatted as strings when they are read.
+
+    Indexing with an integer returns one string (None for a missing id); indexing with a
+    slice, mask or index array returns another UuidArray.
+    """
+
+    def __init__(self, raw, valid=None):
+        self.raw = raw
+        self.valid = np.ones(len(raw), dtype=bool) if valid is None else valid
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __getitem__(self, index):
+        if np.ndim(index) == 0 and not isinstance(index, slice):
+            return columnar.uuid_strings(self.raw[[index]], self.valid[[index]])[0]
+        return UuidArray(self.raw[index], self.valid[index])
+
+    def __iter__(self):
+        for start in range(0, len(self), DEFAULT_BLOCK_SIZE):
+            yield from self[start:start + DEFAULT_BLOCK_SIZE].to_strings().tolist()
+
+    def to_strings(self):
+        """All ids as an object array of canonical strings."""
+        return columnar.uuid_strings(self.raw, self.valid)
+
+    def to_binary(self, index=None):
+        """All ids as a 16-byte binary Series, as stored by columnar.compact_transactions."""
+        return columnar.binary_column(self.raw, self.valid, index)
+
+
+class IdFactory:
+    """
+    Seeded, reproducible source of UUIDs.
+
+    Args:
+        seed (int or np.random.SeedSequence, optional): Seed of the ids; the same seed always
+            gives the same ids (for version 7, given the same timestamps).
+        version (int): 4 for random ids, 7 for time-ordered ids.
+        block_size (int): Number of ids drawn at a time for next_id.
+    """
+
+    def __init__(self, seed=None, version=4, block_size=DEFAULT_BLOCK_SIZE):
+        if version not in VERSIONS:
+            raise ValueError(f"UUID version must be one of {VERSIONS}, not {version!r}")
+        self.version = version
+        self.block_size = block_size
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        """Restart the ids from a new seed, dropping the ids drawn ahead for next_id."""
+        self.rng = np.random.default_rng(seed)
+        self._block = []
+        self._next = 0
+
+    def raw(self, n, timestamps=None):
+        """n ids as a (n, 16) uint8 array."""
+        return random_uuids(self.rng, n, self.version, timestamps)
+
+    def strings(self, n, timestamps=None):
+        """n ids as an object array of strings, formatted in one pass."""
+        return columnar.uuid_strings(self.raw(n, timestamps))
+
+    def lazy(self, n, timestamps=None):
+        """n ids as a UuidArray, formatted only when read."""
+        return UuidArray(self.raw(n, timestamps))
+
+    def binary(self, n, timestamps=None, index=None):
+        """n ids as a 16-byte binary Series."""
+        return columnar.binary_column(self.raw(n, timestamps), np.ones(n, dtype=bool), index)
+
+    def next_id(self, timestamp=None):
+        """
+        One id as a string, for per-row builders. Ids are drawn and formatted a block at a time;
+        a version 7 id gets the given timestamp (now by default) written over its first 48 bits.
+        """
+        if self._next == len(self._block):
+            self._block = columnar.uuid_strings(random_uuids(self.rng, self.block_size, 4)).tolist()
+            self._next = 0
+        value = self._block[self._next]
+        self._next += 1
+        if self.version == 4:
+            return value
+        prefix = f"{_unix_ms(timestamp):012x}"
+        return f"{prefix[:8]}-{prefix[8:]}-7{value[15:]}"
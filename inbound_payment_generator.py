@@ -1,77 +1,88 @@
 import pandas as pd
 import random
-import uuid
 from faker import Faker
 from datetime import datetime, timedelta
 import numpy as np
+from sinks import DEFAULT_CHUNK_SIZE
+import identifiers
+import value_pools
 
-# Initialize Faker
+# Initialize Faker, the pre-sampled Faker values drawn from for each payment, and the UUID factory
 fake = Faker()
+pools = value_pools.PoolCache()
+ids = identifiers.IdFactory()
 
 # Set the number of inbound payments to generate
 num_payments = 1000
 
-# Function to simulate inbound payments
-def generate_inbound_payments(n):
-    data = []
-    for _ in range(n):
-        # Randomly select sender and receiver countries
-        sender_country = fake.country_code()
-        receiver_country = "UK" if random.random() < 0.9 else fake.country_code()
-        
-        # Generate exchange rate if payment is international
-        exchange_rate = round(random.uniform(0.5, 1.5), 4) if sender_country != receiver_country else None
+# Function to simulate a single inbound payment
+def generate_inbound_payment():
+    # Randomly select sender and receiver countries
+    sender_country = pools["country_code"].sample()
+    receiver_country = "UK" if random.random() < 0.9 else pools["country_code"].sample()
+    
+    # Generate exchange rate if payment is international
+    exchange_rate = round(random.uniform(0.5, 1.5), 4) if sender_country != receiver_country else None
 
-        payment = {
-            "transaction_id": str(uuid.uuid4()),
-            "timestamp": fake.date_time_between(start_date="-1y", end_date="now"),
-            "amount": round(random.uniform(10, 100000), 2),
-            "currency": random.choice(["USD", "EUR", "GBP", "JPY", "CAD"]),
-            "exchange_rate": exchange_rate,
-            
-            # Sender Information
-            "sender_account_id": str(uuid.uuid4()),
-            "sender_name": fake.name(),
-            "sender_country": sender_country,
-            "sender_bank": fake.company() + " Bank",
-            "sender_bank_swift": fake.swift(),
-            "sender_account_type": random.choice(["personal", "business"]),
-            
-            # Receiver Information
-            "receiver_account_id": str(uuid.uuid4()),
-            "receiver_name": fake.name(),
-            "receiver_country": receiver_country,
-            "receiver_bank": "UK Bank" if receiver_country == "UK" else fake.company() + " Bank",
-            "receiver_bank_swift": fake.swift(),
-            "receiver_account_type": random.choice(["personal", "business"]),
-            
-            # Payment Details
-            "payment_channel": random.choice(["SWIFT", "ACH", "domestic_transfer", "mobile_app"]),
-            "payment_method": random.choice(["wire_transfer", "mobile_payment", "credit_transfer"]),
-            "purpose": random.choice(["salary", "gift", "investment", "loan repayment", "invoice payment"]),
-            "memo": fake.sentence(nb_words=6),
-            
-            # Compliance and Screening Fields
-            "aml_risk_score": random.randint(1, 100),
-            "fraud_check_status": random.choice(["Cleared", "Flagged"]),
-            "sanctions_check": random.choice(["Cleared", "Flagged"]),
-            "pep_check": random.choice(["Cleared", "Flagged"]),
-            
-            # Additional Metadata
-            "device_id": str(uuid.uuid4()) if random.random() < 0.3 else None,
-            "ip_address": fake.ipv4() if random.random() < 0.3 else None,
-            "user_agent": fake.user_agent() if random.random() < 0.3 else None,
-            "session_id": str(uuid.uuid4()) if random.random() < 0.3 else None
-        }
+    return {
+        "transaction_id": ids.next_id(),
+        "timestamp": fake.date_time_between(start_date="-1y", end_date="now"),
+        "amount": round(random.uniform(10, 100000), 2),
+        "currency": random.choice(["USD", "EUR", "GBP", "JPY", "CAD"]),
+        "exchange_rate": exchange_rate,
+        
+        # Sender Information
+        "sender_account_id": ids.next_id(),
+        "sender_name": pools["name"].sample(),
+        "sender_country": sender_country,
+        "sender_bank": pools["company"].sample() + " Bank",
+        "sender_bank_swift": pools["swift"].sample(),
+        "sender_account_type": random.choice(["personal", "business"]),
+        
+        # Receiver Information
+        "receiver_account_id": ids.next_id(),
+        "receiver_name": pools["name"].sample(),
+        "receiver_country": receiver_country,
+        "receiver_bank": "UK Bank" if receiver_country == "UK" else pools["company"].sample() + " Bank",
+        "receiver_bank_swift": pools["swift"].sample(),
+        "receiver_account_type": random.choice(["personal", "business"]),
         
-        data.append(payment)
+        # Payment Details
+        "payment_channel": random.choice(["SWIFT", "ACH", "domestic_transfer", "mobile_app"]),
+        "payment_method": random.choice(["wire_transfer", "mobile_payment", "credit_transfer"]),
+        "purpose": random.choice(["salary", "gift", "investment", "loan repayment", "invoice payment"]),
+        "memo": pools["sentence"].sample(),
+        
+        # Compliance and Screening Fields
+        "aml_risk_score": random.randint(1, 100),
+        "fraud_check_status": random.choice(["Cleared", "Flagged"]),
+        "sanctions_check": random.choice(["Cleared", "Flagged"]),
+        "pep_check": random.choice(["Cleared", "Flagged"]),
+        
+        # Additional Metadata
+        "device_id": ids.next_id() if random.random() < 0.3 else None,
+        "ip_address": pools["ipv4"].sample() if random.random() < 0.3 else None,
+        "user_agent": pools["user_agent"].sample() if random.random() < 0.3 else None,
+        "session_id": ids.next_id() if random.random() < 0.3 else None
+    }
+
+# Function to simulate inbound payments
+def generate_inbound_payments(n):
+    data = [generate_inbound_payment() for _ in range(n)]
     
     # Create DataFrame
     df = pd.DataFrame(data)
     return df
 
-# Generate the inbound payments DataFrame
-df_inbound_payments = generate_inbound_payments(num_payments)
+# Function to simulate inbound payments in DataFrame chunks of about chunk_size rows,
+# so large datasets can be streamed to a sink in bounded memory
+def iter_inbound_payment_chunks(n, chunk_size=DEFAULT_CHUNK_SIZE):
+    for start in range(0, n, chunk_size):
+        yield pd.DataFrame([generate_inbound_payment() for _ in range(min(chunk_size, n - start))])
+
+if __name__ == "__main__":
+    # Generate the inbound payments DataFrame
+    df_inbound_payments = generate_inbound_payments(num_payments)
 
-# Display the first few rows
-df_inbound_payments.head()
+    # Display the first few rows
+    print(df_inbound_payments.head())
@@ -0,0 +1,148 @@
+import pandas as pd
+
+# The Arrow readers need pyarrow, which is optional: without it CSV files are read with pandas
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Typed loading of transaction files for the alert scripts.
+#
+# Transactions are read with an explicit schema instead of per-column type inference: the
+# identifier and country/currency columns are dictionary-encoded into pandas Categoricals, the
+# coordinates and amounts are float64 and the transaction time is parsed with a single format
+# while the file is read. Only the columns the enabled scenarios use are read.
+#
+# CSV, Parquet and Arrow IPC (Feather) files are supported. With pyarrow, CSV files are parsed
+# by Arrow's multi-threaded reader and uncompressed files are memory-mapped, and Parquet and
+# IPC files are read column by column straight into the schema's types.
+
+# Column types of the transactions read by the alert scripts
+TRANSACTION_SCHEMA = {
+    "customer_id": "category",
+    "card_id": "category",
+    "transaction_date_time": "datetime",
+    "transaction_amount": "float64",
+    "payment_channel": "category",
+    "currency": "category",
+    "latitude": "float64",
+    "longitude": "float64",
+    "merchant_country": "category",
+}
+
+# Columns every alert run needs: grouping, time windows and the geolocation filter
+BASE_COLUMNS = ["customer_id", "card_id", "transaction_date_time", "latitude", "longitude"]
+
+# Further columns read for each scenario of alert_scenarios.json when it is enabled
+SCENARIO_COLUMNS = {
+    "high_transaction_volume": [],
+    "high_transaction_amount": ["transaction_amount", "currency"],
+    "unusual_transaction_patterns": ["merchant_country"],
+    "frequent_international_transactions": ["merchant_country"],
+    "rapid_consecutive_transactions": [],
+    "location_mismatch": [],
+}
+
+# Format of transaction_date_time; ISO 8601 accepts the "YYYY-MM-DD HH:MM:SS[.ffffff]" values
+# pandas writes, with or without fractional seconds
+DATE_FORMAT = "ISO8601"
+
+# File suffixes read as Arrow IPC; as with sinks.open_sink, .csv/.csv.gz paths are read as CSV
+# and anything else as a Parquet file or dataset
+IPC_SUFFIXES = (".arrow", ".feather", ".ipc")
+
+
+def required_columns(config):
+    """Columns the enabled scenarios of an alert_scenarios.json config read, in schema order."""
+    columns = set(BASE_COLUMNS)
+    for key, scenario_columns in SCENARIO_COLUMNS.items():
+        if config.get(key, {}).get('enabled'):
+            columns.update(scenario_columns)
+    # Custom rules (see alert_rules) may refer to any column
+    if any(isinstance(scenario, dict) and scenario.get('enabled') and "rule" in scenario for scenario in config.values()):
+        columns.update(TRANSACTION_SCHEMA)
+    return [column for column in TRANSACTION_SCHEMA if column in columns]
+
+
+def _arrow_type(kind):
+    if kind == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    if kind == "datetime":
+        return pa.timestamp("us")
+    return pa.from_numpy_dtype(kind)
+
+
+def _apply_schema(transactions, date_format):
+    """Cast the schema columns that the reader did not already load with their type."""
+    for name, kind in TRANSACTION_SCHEMA.items():
+        if name not in transactions:
+            continue
+        column = transactions[name]
+        if kind == "category" and not isinstance(column.dtype, pd.CategoricalDtype):
+            transactions[name] = column.astype("category")
+        elif kind == "datetime" and not pd.api.types.is_datetime64_any_dtype(column.dtype):
+            transactions[name] = pd.to_datetime(column, format=date_format)
+        elif kind == "float64" and column.dtype != "float64":
+            transactions[name] = pd.to_numeric(column).astype("float64")
+    return transactions
+
+
+def _read_csv_arrow(path, columns, date_format, skip_rows, memory_map):
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=columns,
+        strings_can_be_null=True,
+        column_types={name: _arrow_type(kind) for name, kind in TRANSACTION_SCHEMA.items()},
+        timestamp_parsers=None if date_format == DATE_FORMAT else [date_format],
+    )
+    read_options = pa_csv.ReadOptions(skip_rows_after_names=skip_rows)
+    source = pa.memory_map(path) if memory_map and not path.endswith(".gz") else path
+    return pa_csv.read_csv(source, read_options=read_options, convert_options=convert_options)
+
+
+def _read_csv_pandas(path, columns, date_format, skip_rows):
+    transactions = pd.read_csv(
+        path, usecols=columns, skiprows=range(1, skip_rows + 1), float_precision="round_trip",
+        dtype={name: kind for name, kind in TRANSACTION_SCHEMA.items() if kind != "datetime"},
+    )
+    if "transaction_date_time" in transactions:
+        transactions["transaction_date_time"] = pd.to_datetime(
+            transactions["transaction_date_time"], format=date_format
+        )
+    return transactions
+
+
+def read_transactions(path, columns=None, date_format=DATE_FORMAT, skip_rows=0, memory_map=True):
+    """
+    Read transactions from a CSV, Parquet or Arrow IPC file with the types of TRANSACTION_SCHEMA.
+
+    Args:
+        path (str): Transactions file, e.g. synthetic_transactions.csv; Parquet may be a dataset directory.
+        columns (list, optional): Columns to read, all of them by default; see required_columns.
+        date_format (str): strftime format of transaction_date_time in CSV files, ISO 8601 by default.
+        skip_rows (int): Number of data rows to skip, e.g. the rows an incremental run has already seen.
+        memory_map (bool): Memory-map uncompressed files instead of reading them into memory first.
+
+    Returns:
+        pd.DataFrame: The transactions, ids as Categoricals and transaction_date_time as datetime.
+    """
+    is_csv = path.endswith(".csv") or path.endswith(".csv.gz")
+    if pa is None:
+        if not is_csv:
+            raise ImportError("Parquet and Arrow input require pyarrow: pip install pyarrow")
+        return _apply_schema(_read_csv_pandas(path, columns, date_format, skip_rows), date_format)
+
+    if is_csv:
+        table = _read_csv_arrow(path, columns, date_format, skip_rows, memory_map)
+    else:
+        if path.endswith(IPC_SUFFIXES):
+            table = feather.read_table(path, columns=columns, memory_map=memory_map)
+        else:
+            table = pq.read_table(path, columns=columns, memory_map=memory_map)
+        table = table.slice(skip_rows)
+    categories = [name for name, kind in TRANSACTION_SCHEMA.items() if kind == "category"]
+    transactions = table.to_pandas(categories=[name for name in categories if name in table.column_names])
+    return _apply_schema(transactions, date_format)
+
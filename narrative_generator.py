@@ -1,169 +1,193 @@
+import string
 import pandas as pd
 import numpy as np
-from math import radians, sin, cos, sqrt, atan2
-from datetime import timedelta
-import json
-
-# Load TM alert scenarios from config file
-with open("alert_scenarios.json", "r") as f:
-    alert_config = json.load(f)
-
-# Load transaction data from synthetic_transactions.csv
-df_transactions = pd.read_csv("synthetic_transactions.csv")
-
-# Convert transaction date-time to pandas datetime for easy manipulation
-df_transactions['transaction_date_time'] = pd.to_datetime(df_transactions['transaction_date_time'])
-
-# Haversine function to calculate distance in kilometers between two latitude/longitude points
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in kilometers
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
+import alert_engine
+import sinks
+import alert_generator
+from alert_generator import AlertEngine, haversine
+
+# Incremental and parallel runs are set with alert_generator.alert_state_path and
+# alert_generator.alert_workers
 
 # Narrative templates
 narrative_templates = {
     "High Transaction Volume": "Customer {customer_id} conducted {transaction_count} transactions on {date}, which exceeds the typical volume threshold. This activity could indicate structuring to avoid detection.",
     "High Transaction Amount": "A single transaction of {transaction_amount} {currency} was flagged for Customer {customer_id} on {date}. This amount exceeds the high-value threshold and warrants further investigation.",
+    "Unusual Transaction Patterns": "Customer {customer_id} conducted {international_count} international transactions within {time_interval} days up to {date}. A burst of cross-border activity in a short period may indicate layering of illicit funds.",
     "Frequent International Transactions": "Customer {customer_id} conducted {international_count} international transactions to {receiver_country} within a short period. This frequent cross-border activity may indicate potential involvement in money laundering or evasion of currency controls.",
     "Rapid Consecutive Transactions": "Customer {customer_id} initiated {transaction_count} transactions within {time_interval} minutes on {date}. Rapid consecutive transactions may suggest structuring or smurfing activity.",
     "Location Mismatch": "Customer {customer_id} conducted transactions from different locations ({location_1} and {location_2}) within {time_interval} hours. This discrepancy may indicate possible account compromise or unauthorized access."
 }
 
+# Template of alert types without a narrative
+NO_NARRATIVE = "No narrative available for this alert type."
+
+# Template fields other than customer_id, in the order they are kept as columns of lazily
+# rendered alerts
+NARRATIVE_FIELDS = [
+    "transaction_count", "transaction_amount", "currency", "date", "international_count",
+    "receiver_country", "time_interval", "location_1", "location_2",
+]
+
 # Function to generate a narrative based on alert type and details
 def generate_narrative(alert_type, details):
-    template = narrative_templates.get(alert_type, "No narrative available for this alert type.")
+    template = narrative_templates.get(alert_type, NO_NARRATIVE)
     return template.format(**details)
 
+# Names of the fields a template refers to
+def template_fields(template):
+    return [field for _, field, _, _ in string.Formatter().parse(template) if field is not None]
+
+# Render a template for many alerts at once: fields maps each field to a Series of strings
+# (or one string shared by all alerts), and the literal parts and fields are joined with
+# vectorized string concatenation instead of one str.format call per alert
+def render_template(template, fields, index):
+    text = pd.Series("", index=index, dtype="str")
+    for literal, field, format_spec, conversion in string.Formatter().parse(template):
+        if literal:
+            text = text + literal
+        if field is None:
+            continue
+        values = fields[field]
+        if format_spec or conversion:
+            formatter = string.Formatter()
+            values = [formatter.format_field(formatter.convert_field(value, conversion), format_spec)
+                      for value in (values.tolist() if isinstance(values, pd.Series) else [values] * len(index))]
+            values = pd.Series(values, index=index, dtype="str")
+        text = text + values
+    return text
+
+# Values as str() formats them; pandas keeps missing values missing when casting to str, so
+# those are formatted one by one ("nan", "None")
+def _as_text(values):
+    text = values.astype(str)
+    missing = text.isna().to_numpy()
+    if missing.any():
+        filled = [str(value) for value in values[missing].tolist()]
+        text = text.where(~missing, pd.Series(filled, index=text.index[missing], dtype="str"))
+    return text
+
+# Dates of transaction times as str(date) formats them
+def _format_dates(times):
+    return pd.to_datetime(times).dt.strftime("%Y-%m-%d").fillna("NaT")
+
+# Coordinates as "latitude, longitude"
+def _format_locations(latitude, longitude):
+    return _as_text(pd.Series(latitude)) + ", " + _as_text(pd.Series(longitude))
+
+# Template fields of the alerts of one scenario, as Series of strings aligned with the rows
+# alert_engine found
+def narrative_fields(prepared, number, rows, values, config):
+    def column(name):
+        return _as_text(prepared[name].iloc[rows].reset_index(drop=True))
+
+    fields = {"customer_id": column("customer_id")}
+    if number in (1, 2, 3, 5):
+        fields["date"] = _format_dates(prepared["transaction_date_time"].iloc[rows].reset_index(drop=True))
+    if number in (1, 5):
+        fields["transaction_count"] = _as_text(pd.Series(values["transaction_count"]))
+    if number == 2:
+        fields["transaction_amount"] = column("transaction_amount")
+        fields["currency"] = column("currency")
+    if number == 3:
+        fields["international_count"] = _as_text(pd.Series(values["international_count"]))
+        fields["time_interval"] = str(config['unusual_transaction_patterns']['days_threshold'])
+    if number == 4:
+        fields["international_count"] = _as_text(pd.Series(values["international_count"]))
+        fields["receiver_country"] = column("merchant_country")
+    if number == 5:
+        fields["time_interval"] = str(config['rapid_consecutive_transactions']['time_interval_minutes'])
+    if number == 6:
+        latitude = prepared["latitude"]
+        longitude = prepared["longitude"]
+        matches = values["match"]
+        fields["location_1"] = _format_locations(latitude[rows], longitude[rows])
+        fields["location_2"] = _format_locations(latitude[matches], longitude[matches])
+        fields["time_interval"] = str(config['location_mismatch']['time_interval_hours'])
+    return fields
+
+# Assemble the alerts DataFrame with the narrative of every alert. With lazy=True the alerts
+# carry the template fields as columns (NARRATIVE_FIELDS) instead of the narrative, and the
+# narratives are only joined by render_narratives, e.g. chunk by chunk when they are exported
+def build_alerts_frame(prepared, results, config, lazy=False):
+    fields = {
+        number: narrative_fields(prepared, number, rows, values, config)
+        for number, (rows, _, values) in results.items()
+    }
+    if lazy:
+        extra_columns = {name: {} for name in NARRATIVE_FIELDS}
+        for number, (rows, _, _) in results.items():
+            for name in NARRATIVE_FIELDS:
+                value = fields[number].get(name)
+                extra_columns[name][number] = value.tolist() if isinstance(value, pd.Series) \
+                    else [value] * len(rows)
+    else:
+        extra_columns = {"narrative": {
+            number: render_template(
+                narrative_templates.get(alert_engine.alert_type(config, number), NO_NARRATIVE),
+                fields[number], pd.RangeIndex(len(rows))
+            ).tolist()
+            for number, (rows, _, _) in results.items()
+        }}
+    return alert_engine.build_alerts_frame(prepared, results, config, extra_columns=extra_columns)
+
+# Join the narratives of alerts built with lazy=True, one template at a time for all alerts of
+# its type; the template field columns are replaced by the narrative column
+def render_narratives(alerts):
+    if "narrative" in alerts or not set(NARRATIVE_FIELDS) <= set(alerts.columns):
+        return alerts
+    narratives = np.full(len(alerts), None, dtype=object)
+    alert_types = alerts["alert_type"].to_numpy(dtype=object)
+    for alert_type in pd.unique(alert_types):
+        mask = alert_types == alert_type
+        template = narrative_templates.get(alert_type, NO_NARRATIVE)
+        subset = alerts[mask]
+        fields = {field: _as_text(subset[field]) for field in template_fields(template)}
+        narratives[mask] = render_template(template, fields, subset.index).to_numpy(dtype=object)
+    rendered = alerts.drop(columns=NARRATIVE_FIELDS)
+    rendered.insert(rendered.columns.get_loc("details") + 1, "narrative", narratives.tolist())
+    return rendered
+
+# Rendered alerts in chunks of chunk_size rows, for writing through a sink (sinks.write_chunks)
+# without holding every narrative in memory
+def iter_rendered_chunks(alerts, chunk_size=sinks.DEFAULT_CHUNK_SIZE):
+    for start in range(0, len(alerts), chunk_size):
+        yield render_narratives(alerts.iloc[start:start + chunk_size])
+
+
+class NarrativeAlertEngine(AlertEngine):
+    """
+    AlertEngine that writes a narrative for every alert, from the counts and matches the
+    scenarios report. Custom rules without a template get NO_NARRATIVE.
+
+    Args:
+        config (dict, optional): Scenario configuration; read from config_path on first use if not given.
+        config_path (str): Path of the alert scenarios JSON file.
+        lazy (bool): Keep the template fields instead of the narratives; see render_narratives.
+    """
+
+    def __init__(self, config=None, config_path="alert_scenarios.json", lazy=False):
+        super().__init__(config, config_path)
+        self.lazy = lazy
+
+    def build_alerts_frame(self, prepared, results, config):
+        return build_alerts_frame(prepared, results, config, lazy=self.lazy)
+
+
 # Function to generate alerts based on scenarios
 def generate_alerts(transactions, config):
-    alerts = []
-    
-    for i, transaction in transactions.iterrows():
-        customer_id = transaction['customer_id']
-        card_id = transaction['card_id']
-        transaction_time = transaction['transaction_date_time']
-        transaction_amount = transaction['transaction_amount']
-        payment_channel = transaction['payment_channel']
-        currency = transaction['currency']
-        location = (transaction['latitude'], transaction['longitude'])
-        
-        # Skip transactions with missing geolocation data
-        if pd.isna(location[0]) or pd.isna(location[1]):
-            continue
+    # The scenarios are evaluated as one plan of grouped window computations by alert_rules, and the
+    # narratives are written from the counts and matches it reports
+    return NarrativeAlertEngine(config).generate_alerts(transactions)
+
+# Generate alerts for the rows appended to a transactions CSV since the last run only
+def generate_alerts_incremental(path, config, state_path):
+    return NarrativeAlertEngine(config).generate_alerts_incremental(path, state_path)
+
+# alert_config is read as in alert_generator when first accessed
+__getattr__ = alert_generator.__getattr__
+
 
-        # Filter transactions for the same customer and card
-        customer_transactions = transactions[transactions['customer_id'] == customer_id]
-        card_transactions = transactions[transactions['card_id'] == card_id]
-        
-        # Scenario 1: High Transaction Volume
-        if config['high_transaction_volume']['enabled']:
-            daily_transactions = card_transactions[card_transactions['transaction_date_time'].dt.date == transaction_time.date()]
-            if len(daily_transactions) > config['high_transaction_volume']['transactions_per_day_threshold']:
-                details = {
-                    "customer_id": customer_id,
-                    "transaction_count": len(daily_transactions),
-                    "date": transaction_time.date()
-                }
-                alerts.append({
-                    "alert_id": f"A1-{i}",
-                    "customer_id": customer_id,
-                    "card_id": card_id,
-                    "alert_type": "High Transaction Volume",
-                    "crime_type": config['high_transaction_volume']['crime_type'],
-                    "details": f"{len(daily_transactions)} transactions in a single day",
-                    "narrative": generate_narrative("High Transaction Volume", details)
-                })
-        
-        # Scenario 2: High Transaction Amount
-        if config['high_transaction_amount']['enabled'] and transaction_amount > config['high_transaction_amount']['amount_threshold']:
-            details = {
-                "customer_id": customer_id,
-                "transaction_amount": transaction_amount,
-                "currency": currency,
-                "date": transaction_time.date()
-            }
-            alerts.append({
-                "alert_id": f"A2-{i}",
-                "customer_id": customer_id,
-                "card_id": card_id,
-                "alert_type": "High Transaction Amount",
-                "crime_type": config['high_transaction_amount']['crime_type'],
-                "details": f"Transaction amount of {transaction_amount} {currency} exceeds threshold",
-                "narrative": generate_narrative("High Transaction Amount", details)
-            })
-        
-        # Scenario 3: Frequent International Transactions
-        if config['frequent_international_transactions']['enabled']:
-            domestic_count = len(customer_transactions[customer_transactions['merchant_country'] == 'UK'])
-            international_count = len(customer_transactions) - domestic_count
-            if domestic_count > 0 and international_count / domestic_count > config['frequent_international_transactions']['international_to_domestic_ratio']:
-                details = {
-                    "customer_id": customer_id,
-                    "international_count": international_count,
-                    "receiver_country": transaction['merchant_country']
-                }
-                alerts.append({
-                    "alert_id": f"A4-{i}",
-                    "customer_id": customer_id,
-                    "alert_type": "Frequent International Transactions",
-                    "crime_type": config['frequent_international_transactions']['crime_type'],
-                    "details": f"International to domestic transaction ratio is {international_count/domestic_count:.2f}",
-                    "narrative": generate_narrative("Frequent International Transactions", details)
-                })
-        
-        # Scenario 4: Rapid Consecutive Transactions
-        if config['rapid_consecutive_transactions']['enabled']:
-            close_transactions = customer_transactions[(customer_transactions['transaction_date_time'] >= transaction_time - timedelta(minutes=config['rapid_consecutive_transactions']['time_interval_minutes'])) &
-                                                       (customer_transactions['transaction_date_time'] <= transaction_time + timedelta(minutes=config['rapid_consecutive_transactions']['time_interval_minutes']))]
-            if len(close_transactions) > config['rapid_consecutive_transactions']['transaction_count_threshold']:
-                details = {
-                    "customer_id": customer_id,
-                    "transaction_count": len(close_transactions),
-                    "time_interval": config['rapid_consecutive_transactions']['time_interval_minutes'],
-                    "date": transaction_time.date()
-                }
-                alerts.append({
-                    "alert_id": f"A5-{i}",
-                    "customer_id": customer_id,
-                    "card_id": card_id,
-                    "alert_type": "Rapid Consecutive Transactions",
-                    "crime_type": config['rapid_consecutive_transactions']['crime_type'],
-                    "details": f"{len(close_transactions)} transactions within {config['rapid_consecutive_transactions']['time_interval_minutes']} minutes",
-                    "narrative": generate_narrative("Rapid Consecutive Transactions", details)
-                })
-        
-        # Scenario 6: Location Mismatch
-        if config['location_mismatch']['enabled']:
-            recent_transactions = customer_transactions[(customer_transactions['transaction_date_time'] >= transaction_time - timedelta(hours=config['location_mismatch']['time_interval_hours']))]
-            for _, recent_txn in recent_transactions.iterrows():
-                recent_location = (recent_txn['latitude'], recent_txn['longitude'])
-                distance_km = haversine(location[0], location[1], recent_location[0], recent_location[1])
-                if distance_km > config['location_mismatch']['distance_threshold_km']:
-                    details = {
-                        "customer_id": customer_id,
-                        "location_1": f"{location[0]}, {location[1]}",
-                        "location_2": f"{recent_location[0]}, {recent_location[1]}",
-                        "time_interval": config['location_mismatch']['time_interval_hours']
-                    }
-                    alerts.append({
-                        "alert_id": f"A6-{i}",
-                        "customer_id": customer_id,
-                        "card_id": card_id,
-                        "alert_type": "Location Mismatch",
-                        "crime_type": config['location_mismatch']['crime_type'],
-                        "details": f"Transaction locations {location} and {recent_location} are more than {config['location_mismatch']['distance_threshold_km']} km apart within {config['location_mismatch']['time_interval_hours']} hours",
-                        "narrative": generate_narrative("Location Mismatch", details)
-                    })
-                    break  # Avoid multiple alerts for the same transaction
-    
-    # Create a DataFrame for alerts
-    df_alerts = pd.DataFrame(alerts)
-    return df_alerts
-
-# Generate the alerts DataFrame
-df_alerts = generate_alerts(df_transactions, alert_config)
-df_alerts.head()
+if __name__ == "__main__":
+    # Generate the alerts DataFrame, with a narrative for every alert
+    alert_generator.main(NarrativeAlertEngine())
@@ -0,0 +1,228 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import alert_engine
+import ingestion
+
+# Multi-process alert evaluation, partitioned by customer.
+#
+# Every scenario compares a transaction only with transactions of the same customer, or of the
+# same card on the same day. The transactions are hash-partitioned by customer_id and a pool of
+# worker processes runs the engine's evaluate_scenarios and build_alerts_frame steps on one
+# partition at a time. The columns are copied once into a shared memory block, ordered by
+# partition, so a worker reads its partition from there instead of receiving a pickled copy.
+# Only the columns the enabled scenarios read (ingestion.required_columns) are shared, text
+# and other object columns as codes into their distinct values.
+#
+# Daily card counts are taken over the whole frame, so a card used by customers of different
+# partitions is counted as in a serial run. The alerts keep the ids of the row labels of the
+# whole frame and are merged back in row-loop order, so the output is the same as the
+# engine's generate_alerts whatever the number of workers or partitions.
+
+# Partitions per worker process, so that workers that finish early take on more of the work
+PARTITIONS_PER_WORKER = 4
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+
+def customer_partitions(customer_ids, num_partitions):
+    """Partition of each transaction: a hash of its customer_id, the same in every run."""
+    codes, uniques = pd.factorize(customer_ids, use_na_sentinel=False)
+    hashes = pd.util.hash_pandas_object(pd.Series(uniques), index=False).to_numpy()
+    return (hashes % np.uint64(num_partitions)).astype(np.int64)[codes]
+
+
+def _encode_column(values):
+    """A column as a fixed-width array plus what _decode_column needs to restore it."""
+    dtype = values.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return values.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy(), ("datetime", dtype)
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+        return values.to_numpy(), ("array", None)
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return codes, ("codes", (uniques, dtype))
+
+
+def _decode_column(array, encoding):
+    kind, meta = encoding
+    if kind == "datetime":
+        return pd.Series(array).dt.tz_localize("UTC").dt.tz_convert(meta.tz)
+    if kind == "codes":
+        uniques, dtype = meta
+        return pd.Series(uniques.take(array)).astype(dtype, copy=False)
+    return pd.Series(array)
+
+
+class SharedColumns:
+    """
+    Arrays copied into one shared memory block, in the given row order.
+
+    Args:
+        arrays (dict): Name -> 1-d numpy array, all of the same length.
+        order (np.ndarray): Row order of the shared copies.
+    """
+
+    def __init__(self, arrays, order):
+        layout = {}
+        size = 0
+        for name, array in arrays.items():
+            layout[name] = (array.dtype, size)
+            size += -(-array.nbytes // 8) * 8
+        self.length = len(order)
+        self.layout = layout
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, array in arrays.items():
+            np.take(array, order, out=self.view(name))
+
+    def view(self, name):
+        dtype, offset = self.layout[name]
+        return np.ndarray(self.length, dtype=dtype, buffer=self.memory.buf, offset=offset)
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+def _init_worker(memory_name, layout, length, encodings, index_encoding, engine):
+    """Attach a worker process to the shared columns and set up the engine once."""
+    memory = shared_memory.SharedMemory(name=memory_name)
+    _worker["memory"] = memory
+    _worker["arrays"] = {
+        name: np.ndarray(length, dtype=dtype, buffer=memory.buf, offset=offset)
+        for name, (dtype, offset) in layout.items()
+    }
+    _worker["encodings"] = encodings
+    _worker["index_encoding"] = index_encoding
+    _worker["engine"] = engine
+
+
+def _release_worker():
+    """Drop the views of the shared block before closing it."""
+    _worker.pop("arrays", None)
+    memory = _worker.pop("memory", None)
+    if memory is not None:
+        memory.close()
+    _worker.clear()
+
+
+def _evaluate_partition(bounds):
+    """
+    Raise the alerts of one partition.
+
+    Returns:
+        tuple: (alerts frame, position in the whole frame and scenario number of each alert).
+    """
+    start, stop = bounds
+    arrays = _worker["arrays"]
+    engine = _worker["engine"]
+    encodings = _worker["encodings"]
+    # Copied out of the shared block so that no frame keeps a view of it
+    transactions = pd.DataFrame(
+        {name: _decode_column(arrays[name][start:stop].copy(), encoding) for name, encoding in encodings.items()}
+    ).set_axis(_decode_column(arrays["index"][start:stop].copy(), _worker["index_encoding"]))
+    positions = arrays["position"][start:stop]
+
+    prepared = alert_engine.prepare_transactions(transactions)
+    # Daily counts of the cards in the rows of the other partitions, added like the counts of
+    # earlier batches in incremental mode
+    local_counts = alert_engine.join_aggregate(prepared, "card_day", "transaction_count", np.arange(stop - start))
+    prepared["card_day_base"] = arrays["card_day_count"][start:stop] - local_counts
+
+    results = engine.evaluate_scenarios(prepared, engine.config)
+    alerts = engine.build_alerts_frame(prepared, results, engine.config)
+    rows = np.concatenate([np.asarray(hit_rows, dtype=np.int64) for hit_rows, _, _ in results.values()] or [[]])
+    numbers = np.concatenate([np.full(len(hit_rows), number) for number, (hit_rows, _, _) in results.items()] or [[]])
+    order = np.lexsort((numbers, rows))
+    return alerts, positions[rows[order].astype(np.int64)], numbers[order].astype(np.int64)
+
+
+def _card_day_counts(transactions):
+    """Transactions of each row's card on the row's day in the whole frame, 0 without card or timestamp."""
+    _, date_ns, time_missing = alert_engine.transaction_times(transactions['transaction_date_time'])
+    card_codes, _ = pd.factorize(transactions['card_id'])
+    counted = (card_codes >= 0) & ~time_missing
+    counts = np.zeros(len(transactions), dtype=np.int64)
+    counts[counted] = pd.DataFrame({"card": card_codes[counted], "date": date_ns[counted]}).groupby(
+        ["card", "date"])["card"].transform("size").to_numpy()
+    return counts
+
+
+def _merge_alerts(parts, config):
+    """Concatenate the alerts of the partitions in row-loop order."""
+    parts = [part for part in parts if len(part[1])]
+    if not parts:
+        return pd.DataFrame([])
+    frames, positions, numbers = zip(*parts)
+    positions = np.concatenate(positions)
+    numbers = np.concatenate(numbers)
+    order = np.lexsort((numbers, positions))
+    numbers = numbers[order]
+    with_card = np.isin(numbers, alert_engine.card_scenarios(config, np.unique(numbers).tolist()))
+    extras = [column for column in frames[0].columns if column not in alert_engine.ALERT_COLUMNS]
+    columns = alert_engine.alert_columns(with_card, extras)
+
+    merged = {}
+    for column in columns:
+        parts = [frame[column] if column in frame else pd.Series(np.nan, index=frame.index) for frame in frames]
+        if len({part.dtype for part in parts}) == 1:
+            values = pd.concat(parts, ignore_index=True)
+        else:
+            # Rebuilt from the values, so the column gets the dtype of a serial run
+            values = pd.Series([value for part in parts for value in part.tolist()])
+        merged[column] = values.take(order).reset_index(drop=True)
+    return pd.DataFrame(merged)
+
+
+def generate_alerts(transactions, engine, num_workers=None, num_partitions=None):
+    """
+    Raise the alerts of the transactions with the steps of engine, evaluated per customer
+    partition across a process pool.
+
+    Args:
+        transactions (pd.DataFrame): Transactions as for engine.generate_alerts.
+        engine (AlertEngine): Engine whose evaluate_scenarios and build_alerts_frame steps are run
+            (alert_generator.AlertEngine, narrative_generator.NarrativeAlertEngine).
+        num_workers (int, optional): Worker processes, one per CPU by default; 1 runs in-process.
+        num_partitions (int, optional): Customer partitions, PARTITIONS_PER_WORKER per worker by default.
+
+    Returns:
+        pd.DataFrame: The alerts of engine.generate_alerts(transactions), in the same order.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    num_partitions = num_partitions or num_workers * PARTITIONS_PER_WORKER
+
+    partitions = customer_partitions(transactions['customer_id'], num_partitions)
+    order = np.argsort(partitions, kind="stable")
+    edges = np.concatenate([[0], np.cumsum(np.bincount(partitions, minlength=num_partitions))]).tolist()
+    tasks = [(start, stop) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+    # The engine is handed over with its config so that workers do not read the config file
+    config = engine.config
+    arrays = {}
+    encodings = {}
+    for name in ingestion.required_columns(config):
+        if name in transactions:
+            arrays[name], encodings[name] = _encode_column(transactions[name])
+    arrays["index"], index_encoding = _encode_column(transactions.index.to_series())
+    arrays["position"] = np.arange(len(transactions), dtype=np.int64)
+    arrays["card_day_count"] = _card_day_counts(transactions)
+    columns = SharedColumns(arrays, order)
+    del arrays
+
+    worker_args = (columns.memory.name, columns.layout, columns.length, encodings, index_encoding, engine)
+    try:
+        if num_workers == 1:
+            _init_worker(*worker_args)
+            try:
+                parts = list(map(_evaluate_partition, tasks))
+            finally:
+                _release_worker()
+        else:
+            with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=worker_args) as pool:
+                parts = pool.map(_evaluate_partition, tasks)
+    finally:
+        columns.close()
+    return _merge_alerts(parts, config)
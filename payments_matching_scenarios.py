@@ -1,144 +1,197 @@
 import pandas as pd
-import random
-import uuid
-from faker import Faker
-from datetime import datetime, timedelta
+from datetime import datetime
 import numpy as np
-
-# Initialize Faker
-fake = Faker()
+from sinks import DEFAULT_CHUNK_SIZE
+import identifiers
 
 # Set transaction parameters
 num_payments = 1000  # Total number of payments to generate
 high_transaction_threshold = 10000  # High amount threshold
 frequent_transaction_count = 10     # Number of frequent transactions for volume scenarios
-international_transaction_ratio = 0.2  # Ratio of international transactions for some customers
-
-# Function to simulate high transaction volume
-def generate_high_volume_transactions(customer_id, n, base_time):
-    payments = []
-    for _ in range(n):
-        payments.append({
-            "transaction_id": str(uuid.uuid4()),
-            "timestamp": base_time + timedelta(minutes=random.randint(0, 1440)),  # Same day
-            "amount": round(random.uniform(100, 5000), 2),  # Regular transaction amount
-            "currency": "USD",
-            "sender_account_id": customer_id,
-            "receiver_account_id": str(uuid.uuid4()),
-            "sender_country": "US",
-            "receiver_country": "US",
-            "payment_channel": random.choice(["ACH", "domestic_transfer"]),
-            "purpose": "Regular Payment"
-        })
-    return payments
-
-# Function to simulate high transaction amount
-def generate_high_amount_transaction(customer_id):
-    return {
-        "transaction_id": str(uuid.uuid4()),
-        "timestamp": fake.date_time_between(start_date="-1y", end_date="now"),
-        "amount": round(random.uniform(high_transaction_threshold, high_transaction_threshold * 2), 2),
-        "currency": "USD",
-        "sender_account_id": customer_id,
-        "receiver_account_id": str(uuid.uuid4()),
-        "sender_country": "US",
-        "receiver_country": "US",
-        "payment_channel": "wire_transfer",
-        "purpose": "High-Value Payment"
-    }
 
-# Function to simulate frequent international transactions
-def generate_international_transactions(customer_id, n):
-    payments = []
-    for _ in range(n):
-        payments.append({
-            "transaction_id": str(uuid.uuid4()),
-            "timestamp": fake.date_time_between(start_date="-1y", end_date="now"),
-            "amount": round(random.uniform(500, 5000), 2),
-            "currency": random.choice(["USD", "EUR", "GBP"]),
-            "sender_account_id": customer_id,
-            "receiver_account_id": str(uuid.uuid4()),
+# Columns of the payments DataFrame; latitude/longitude are only set for location mismatch
+payment_columns = [
+    "transaction_id", "timestamp", "amount", "currency", "sender_account_id", "receiver_account_id",
+    "sender_country", "receiver_country", "payment_channel", "purpose", "latitude", "longitude"
+]
+
+# Rows generated for each customer of a scenario
+scenario_block_rows = {
+    "high_volume": frequent_transaction_count,
+    "high_amount": 1,
+    "frequent_international": frequent_transaction_count,
+    "rapid_consecutive": frequent_transaction_count,
+    "location_mismatch": 2,
+}
+
+# Share of the rows of each scenario; by default every scenario gets the same number of customers
+default_scenario_mix = {
+    scenario: rows / sum(scenario_block_rows.values()) for scenario, rows in scenario_block_rows.items()
+}
+
+# Plan exactly how many rows each scenario contributes to num_payments rows, and split them
+# into per-customer blocks. Returns the scenario and row count of every customer, in a random
+# order; the last block of a scenario may be shorter than its block size
+def plan_scenario_blocks(num_payments, mix=None, rng=None):
+    mix = default_scenario_mix if mix is None else mix
+    rng = np.random.default_rng() if rng is None else rng
+    scenarios = [scenario for scenario in scenario_block_rows if mix.get(scenario, 0) > 0]
+    if num_payments > 0 and not scenarios:
+        raise ValueError("The scenario mix gives no scenario a positive share")
+    shares = np.array([mix[scenario] for scenario in scenarios], dtype=float)
+    shares /= shares.sum()
+
+    # Largest remainder apportionment, so the rows add up to num_payments exactly
+    quotas = shares * num_payments
+    rows = np.floor(quotas).astype(np.int64)
+    rows[np.argsort(rows - quotas, kind="stable")[:num_payments - rows.sum()]] += 1
+
+    block_scenarios = []
+    block_sizes = []
+    for code, (scenario, scenario_rows) in enumerate(zip(scenarios, rows.tolist())):
+        full, rest = divmod(scenario_rows, scenario_block_rows[scenario])
+        sizes = [scenario_block_rows[scenario]] * full + ([rest] if rest else [])
+        block_scenarios.append(np.full(len(sizes), code, dtype=np.int64))
+        block_sizes.append(np.array(sizes, dtype=np.int64))
+    order = rng.permutation(sum(len(sizes) for sizes in block_sizes))
+    scenario_codes = np.concatenate(block_scenarios)[order] if block_scenarios else np.zeros(0, dtype=np.int64)
+    sizes = np.concatenate(block_sizes)[order] if block_sizes else np.zeros(0, dtype=np.int64)
+    return np.array(scenarios, dtype=object)[scenario_codes], sizes
+
+# Columns of one scenario's payments that depend on the scenario, drawn for n rows; position is
+# the index of each row within its customer's block and start the random time of the block
+def scenario_columns(scenario, rng, n, position, start, now):
+    minute = np.timedelta64(60, "s")
+    if scenario == "high_volume":
+        # Same day
+        return {
+            "timestamp": now + rng.integers(0, 1441, n) * minute,
+            "amount": np.round(rng.uniform(100, 5000, n), 2),  # Regular transaction amount
+            "currency": "USD", "sender_country": "US", "receiver_country": "US",
+            "payment_channel": np.array(["ACH", "domestic_transfer"], dtype=object)[rng.integers(0, 2, n)],
+            "purpose": "Regular Payment",
+        }
+    if scenario == "high_amount":
+        return {
+            "timestamp": start,
+            "amount": np.round(rng.uniform(high_transaction_threshold, high_transaction_threshold * 2, n), 2),
+            "currency": "USD", "sender_country": "US", "receiver_country": "US",
+            "payment_channel": "wire_transfer",
+            "purpose": "High-Value Payment",
+        }
+    if scenario == "frequent_international":
+        return {
+            "timestamp": now - rng.integers(0, 365 * 86400 + 1, n) * np.timedelta64(1, "s"),
+            "amount": np.round(rng.uniform(500, 5000, n), 2),
+            "currency": np.array(["USD", "EUR", "GBP"], dtype=object)[rng.integers(0, 3, n)],
             "sender_country": "US",
-            "receiver_country": random.choice(["UK", "DE", "FR"]),
+            "receiver_country": np.array(["UK", "DE", "FR"], dtype=object)[rng.integers(0, 3, n)],
             "payment_channel": "SWIFT",
-            "purpose": "International Transfer"
-        })
-    return payments
-
-# Function to simulate rapid consecutive transactions
-def generate_rapid_consecutive_transactions(customer_id, n, base_time):
-    payments = []
-    for i in range(n):
-        payments.append({
-            "transaction_id": str(uuid.uuid4()),
-            "timestamp": base_time + timedelta(minutes=i),  # Every minute
-            "amount": round(random.uniform(100, 2000), 2),
+            "purpose": "International Transfer",
+        }
+    if scenario == "rapid_consecutive":
+        # Every minute
+        return {
+            "timestamp": now + position * minute,
+            "amount": np.round(rng.uniform(100, 2000, n), 2),
+            "currency": "USD", "sender_country": "US", "receiver_country": "US",
+            "payment_channel": np.array(["mobile_app", "ACH"], dtype=object)[rng.integers(0, 2, n)],
+            "purpose": "Consecutive Small Payment",
+        }
+    if scenario == "location_mismatch":
+        # The two payments of a customer are made from the US and the UK within hours
+        return {
+            "timestamp": start + rng.integers(1, 7, n) * 60 * minute,
+            "amount": np.round(rng.uniform(100, 2000, n), 2),
             "currency": "USD",
-            "sender_account_id": customer_id,
-            "receiver_account_id": str(uuid.uuid4()),
-            "sender_country": "US",
+            "sender_country": np.where(position % 2 == 0, "US", "UK").astype(object),
             "receiver_country": "US",
-            "payment_channel": random.choice(["mobile_app", "ACH"]),
-            "purpose": "Consecutive Small Payment"
-        })
-    return payments
-
-# Function to simulate location mismatch transactions
-def generate_location_mismatch_transactions(customer_id):
-    payments = []
-    base_time = fake.date_time_between(start_date="-1y", end_date="now")
-    locations = [("US", fake.latitude(), fake.longitude()), 
-                 ("UK", fake.latitude(), fake.longitude())]
-    for loc in locations:
-        payments.append({
-            "transaction_id": str(uuid.uuid4()),
-            "timestamp": base_time + timedelta(hours=random.randint(1, 6)),  # Within hours
-            "amount": round(random.uniform(100, 2000), 2),
-            "currency": "USD",
-            "sender_account_id": customer_id,
-            "receiver_account_id": str(uuid.uuid4()),
-            "sender_country": loc[0],
-            "receiver_country": "US",
-            "latitude": loc[1],
-            "longitude": loc[2],
+            "latitude": np.round(rng.uniform(-90, 90, n), 6),
+            "longitude": np.round(rng.uniform(-180, 180, n), 6),
             "payment_channel": "SWIFT",
-            "purpose": "Location Discrepancy Test"
-        })
-    return payments
-
-# Generate the transactions and match scenarios
-def generate_payments_with_scenarios(num_payments):
-    payments = []
-    for _ in range(num_payments):
-        customer_id = str(uuid.uuid4())
-        
-        # Select scenarios based on random sampling
-        scenario = random.choice(["high_volume", "high_amount", "frequent_international", "rapid_consecutive", "location_mismatch"])
-        
-        if scenario == "high_volume":
-            # High transaction volume scenario
-            payments.extend(generate_high_volume_transactions(customer_id, frequent_transaction_count, datetime.now()))
-        
-        elif scenario == "high_amount":
-            # High transaction amount scenario
-            payments.append(generate_high_amount_transaction(customer_id))
-        
-        elif scenario == "frequent_international":
-            # Frequent international transactions
-            payments.extend(generate_international_transactions(customer_id, int(num_payments * international_transaction_ratio)))
-        
-        elif scenario == "rapid_consecutive":
-            # Rapid consecutive transactions
-            payments.extend(generate_rapid_consecutive_transactions(customer_id, frequent_transaction_count, datetime.now()))
-        
-        elif scenario == "location_mismatch":
-            # Location mismatch transactions
-            payments.extend(generate_location_mismatch_transactions(customer_id))
-        
-    # Create DataFrame
-    df = pd.DataFrame(payments)
-    return df
-
-# Generate the payment DataFrame with scenarios
-df_payments = generate_payments_with_scenarios(num_payments)
-df_payments.head()
+            "purpose": "Location Discrepancy Test",
+        }
+    raise ValueError(f"Unknown payment scenario {scenario!r}")
+
+# Build the payments of consecutive planned customer blocks, one scenario at a time, in block order
+def build_scenario_payments(scenarios, sizes, rng, ids, now):
+    n = int(sizes.sum())
+    block_of_row = np.repeat(np.arange(len(sizes)), sizes)
+    position = np.arange(n) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    customer_ids = ids.strings(len(sizes))
+    starts = now - rng.integers(0, 365 * 86400 + 1, len(sizes)) * np.timedelta64(1, "s")
+
+    columns = {
+        "transaction_id": ids.strings(n),
+        "timestamp": np.empty(n, dtype="datetime64[us]"),
+        "amount": np.empty(n, dtype=float),
+        "currency": np.empty(n, dtype=object),
+        "sender_account_id": customer_ids[block_of_row],
+        "receiver_account_id": ids.strings(n),
+        "sender_country": np.empty(n, dtype=object),
+        "receiver_country": np.empty(n, dtype=object),
+        "payment_channel": np.empty(n, dtype=object),
+        "purpose": np.empty(n, dtype=object),
+        "latitude": np.full(n, np.nan),
+        "longitude": np.full(n, np.nan),
+    }
+    row_scenarios = scenarios[block_of_row]
+    for scenario in scenario_block_rows:
+        rows = np.flatnonzero(row_scenarios == scenario)
+        if len(rows):
+            values = scenario_columns(scenario, rng, len(rows), position[rows], starts[block_of_row[rows]], now)
+            for column, column_values in values.items():
+                columns[column][rows] = column_values
+    return pd.DataFrame(columns, columns=payment_columns)
+
+# Generate num_payments payments, made of blocks of the scenarios in mix (share of the rows of
+# each scenario, default_scenario_mix by default)
+def generate_payments_with_scenarios(num_payments, mix=None, seed=None):
+    return next(iter_payment_chunks_with_scenarios(num_payments, chunk_size=max(num_payments, 1), mix=mix, seed=seed))
+
+# Customer blocks per group; every group is built from its own seed, so the payments are the
+# same whatever the chunk size
+scenario_group_blocks = 1024
+
+# Generate the scenario payments in DataFrame chunks of about chunk_size rows (chunks end on
+# a customer boundary), so large datasets can be streamed to a sink in bounded memory. The
+# plan fixes the rows of every scenario up front, so the output has exactly num_payments rows.
+# At least one (possibly empty) chunk is yielded so sinks always see the schema
+def iter_payment_chunks_with_scenarios(num_payments, chunk_size=DEFAULT_CHUNK_SIZE, mix=None, seed=None):
+    plan_seed, group_seed = np.random.SeedSequence(seed).spawn(2)
+    now = np.datetime64(datetime.now(), "us")
+    scenarios, sizes = plan_scenario_blocks(num_payments, mix, np.random.default_rng(plan_seed))
+    group_seeds = group_seed.spawn(-(-len(sizes) // scenario_group_blocks))
+
+    def build_group(group):
+        rng_seed, id_seed = group_seeds[group].spawn(2)
+        blocks = slice(group * scenario_group_blocks, (group + 1) * scenario_group_blocks)
+        return build_scenario_payments(
+            scenarios[blocks], sizes[blocks], np.random.default_rng(rng_seed), identifiers.IdFactory(id_seed), now
+        )
+
+    # Cut the blocks into chunks at the first customer boundary past each chunk_size rows
+    ends = np.cumsum(sizes)
+    starts = np.concatenate([[0], ends]).tolist()
+    cuts = np.searchsorted(ends, np.arange(chunk_size, num_payments, chunk_size), side="left") + 1
+    bounds = [0, *np.unique(cuts[cuts < len(sizes)]).tolist(), len(sizes)]
+    # Only the last group built is kept, the next chunk starts in it or after it
+    built_group, built = -1, None
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        parts = []
+        for group in range(first // scenario_group_blocks, -(-last // scenario_group_blocks)):
+            if group != built_group:
+                built_group, built = group, build_group(group)
+            offset = starts[group * scenario_group_blocks]
+            group_first = max(first, group * scenario_group_blocks)
+            group_last = min(last, (group + 1) * scenario_group_blocks)
+            parts.append(built.iloc[starts[group_first] - offset:starts[group_last] - offset])
+        if not parts:
+            # No payments: an empty frame with the schema
+            parts.append(build_scenario_payments(scenarios, sizes, np.random.default_rng(), identifiers.IdFactory(), now))
+        yield pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+
+if __name__ == "__main__":
+    # Generate the payment DataFrame with scenarios
+    df_payments = generate_payments_with_scenarios(num_payments)
+    print(df_payments.head())
@@ -0,0 +1,69 @@
+import random
+import uuid
+from faker import Faker
+
+# Seedable construction of the customer/card/merchant population shared by
+# generate_transactions.py and In_out_generator.py.
+
+POSSIBLE_ISSUERS = ["Bank of America", "Chase", "Wells Fargo", "CitiBank"]
+
+
+def new_id(rng=random):
+    """Random version 4 UUID string drawn from a random.Random (the global one by default), so it can be seeded."""
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def build_population(params, seed=None):
+    """
+    Build the customers, their cards, names and card issuers, and the merchants.
+
+    Args:
+        params (dict): Transaction parameters loaded from transaction_parameters.json.
+        seed (int, optional): Seed for the identifiers, names and locations; the same seed
+            always gives the same population.
+
+    Returns:
+        dict: customers, customer_cards, customer_names, card_issuers and merchants.
+    """
+    rng = random.Random(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+
+    # Generate Customers, Cards, Customer Names, and Card Issuers
+    customers = [new_id(rng) for _ in range(params["num_customers"])]
+    customer_cards = {
+        customer: [new_id(rng) for _ in range(rng.randint(1, params["max_cards_per_customer"]))]
+        for customer in customers
+    }
+
+    # Map each customer ID to a unique name
+    customer_names = {customer: fake.name() for customer in customers}
+
+    # Map each card ID to a unique issuer
+    card_issuers = {
+        card: rng.choice(POSSIBLE_ISSUERS)
+        for cards in customer_cards.values()
+        for card in cards
+    }
+
+    # Pre-generate a limited number of unique merchants
+    merchants = {}
+    for _ in range(params["max_merchants"]):
+        merchant_id = new_id(rng)
+        merchants[merchant_id] = {
+            "merchant_name": fake.company(),
+            "merchant_location": {
+                "city": fake.city(),
+                "state": fake.state_abbr(),
+                "country": "UK"  # Default to UK for domestic transactions
+            },
+            "merchant_terminal_id": "T" + str(rng.randint(1000, 9999))
+        }
+
+    return {
+        "customers": customers,
+        "customer_cards": customer_cards,
+        "customer_names": customer_names,
+        "card_issuers": card_issuers,
+        "merchants": merchants,
+    }
@@ -0,0 +1,340 @@
+import hashlib
+import json
+import os
+import random
+import shutil
+import numpy as np
+from faker import Faker
+import generate
+import population_builder
+import value_pools
+
+# Populations persisted on disk, so repeated runs and worker processes load the same customers,
+# cards, merchants and parties instead of rebuilding them with Faker.
+#
+# A population is keyed by its seed and a hash of the config values that shape it, and built
+# in fixed-size blocks seeded from (seed, block number). A population of n entities is the
+# first n entities of its blocks, so it does not depend on how it was grown: asking for more
+# customers than stored only builds the missing blocks and appends them.
+#
+# As in value_pools, columns are .npy files (strings as one UTF-8 byte buffer plus offsets)
+# that are memory-mapped on load. Each size of a population is written to its own directory,
+# with a manifest written last, and replaces the smaller ones; readers only use directories
+# with a manifest, so concurrent runs never see a partly written population.
+
+DEFAULT_STORE_DIR = os.environ.get(
+    "POPULATION_STORE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "data_generator", "populations")
+)
+
+# Entities per block
+CUSTOMER_BLOCK = 1_000
+MERCHANT_BLOCK = 100
+PARTY_BLOCK = 1_000
+
+# Bump when the block builders change, so stored populations are rebuilt
+STORE_VERSION = 1
+
+MANIFEST = "manifest.json"
+
+
+def config_key(kind, seed, params):
+    """Directory name of a population: its kind, seed and a hash of the parameters it is built from."""
+    digest = hashlib.sha256(json.dumps([STORE_VERSION, params], sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{kind}-{seed}-{digest[:16]}"
+
+
+def store_dir(config):
+    """
+    Store directory set by "population_store" in a generator config: a path, or true for
+    DEFAULT_STORE_DIR. None when the store is not enabled or the config has no seed, since
+    an unseeded population is not meant to be reused.
+    """
+    directory = config.get("population_store")
+    if not directory or config.get("seed") is None:
+        return None
+    return DEFAULT_STORE_DIR if directory is True else os.path.expanduser(directory)
+
+
+def _block_seed(seed, kind, block):
+    return f"{seed}-{kind}-{block}"
+
+
+def _concat(parts):
+    """Concatenate block columns: arrays, or (data, offsets) pairs of strings."""
+    if not isinstance(parts[0], tuple):
+        return np.concatenate(parts)
+    data = np.concatenate([part[0] for part in parts])
+    offsets = [parts[0][1]]
+    for part in parts[1:]:
+        offsets.append(part[1][1:] + offsets[-1][-1])
+    return data, np.concatenate(offsets)
+
+
+def decode_strings(column, stop=None):
+    """The first stop values (all by default) of a (data, offsets) string column, as a list."""
+    data, offsets = column
+    stop = len(offsets) - 1 if stop is None else stop
+    buffer = data[:offsets[stop]].tobytes()
+    bounds = offsets[:stop + 1].tolist()
+    return [buffer[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+
+class _Table:
+    """Columns of a population: numeric arrays and (data, offsets) string columns, built in blocks."""
+
+    def __init__(self, directory, build_block):
+        self.directory = directory
+        self.build_block = build_block
+
+    def _versions(self):
+        """Stored sizes of the table, in blocks, that have a manifest."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(int(name) for name in names
+                      if name.isdigit() and os.path.exists(os.path.join(self.directory, name, MANIFEST)))
+
+    def _load(self, blocks):
+        path = os.path.join(self.directory, f"{blocks:08d}")
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        columns = {}
+        for name in manifest["columns"]:
+            columns[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in manifest["strings"]:
+            columns[name] = (np.load(os.path.join(path, f"{name}.data.npy"), mmap_mode="r"),
+                             np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r"))
+        return columns
+
+    def _save(self, blocks, columns):
+        path = os.path.join(self.directory, f"{blocks:08d}")
+        os.makedirs(path, exist_ok=True)
+        for name, column in columns.items():
+            if isinstance(column, tuple):
+                value_pools._save(os.path.join(path, f"{name}.data.npy"), column[0])
+                value_pools._save(os.path.join(path, f"{name}.offsets.npy"), column[1])
+            else:
+                value_pools._save(os.path.join(path, f"{name}.npy"), column)
+        manifest = {
+            "blocks": blocks,
+            "columns": [name for name, column in columns.items() if not isinstance(column, tuple)],
+            "strings": [name for name, column in columns.items() if isinstance(column, tuple)],
+        }
+        tmp_path = os.path.join(path, f"{MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(path, MANIFEST))
+
+    def _latest(self):
+        """
+        Stored versions and the columns of the newest one (None without any). Listed again when
+        another process prunes the version listed here before it is loaded.
+        """
+        while True:
+            versions = self._versions()
+            if not versions:
+                return versions, None
+            try:
+                return versions, self._load(versions[-1])
+            except FileNotFoundError:
+                continue
+
+    def get(self, blocks):
+        """Columns of at least the given number of blocks, building and storing missing blocks."""
+        # At least one block, so that callers slicing to no rows still get every column
+        blocks = max(blocks, 1)
+        versions, latest = self._latest()
+        stored = versions[-1] if versions else 0
+        if stored >= blocks:
+            return latest
+
+        parts = []
+        for block in range(stored, blocks):
+            block_columns = self.build_block(block)
+            parts.append({
+                name: value_pools._encode(column) if isinstance(column, list) else column
+                for name, column in block_columns.items()
+            })
+        if stored:
+            parts.insert(0, latest)
+        columns = {name: _concat([part[name] for part in parts]) for name in parts[0]}
+        self._save(blocks, columns)
+
+        # Smaller versions are superseded; readers that already mapped them keep their data, and
+        # readers that only listed them list again (see _latest)
+        for version in versions:
+            shutil.rmtree(os.path.join(self.directory, f"{version:08d}"), ignore_errors=True)
+        # A concurrent writer may have stored and pruned past this version in the meantime
+        return self._latest()[1]
+
+
+class PopulationStore:
+    """
+    Card and party populations stored under a directory.
+
+    Args:
+        directory (str): Directory of the stored populations.
+        locale (str): Faker locale of the names, companies and addresses.
+    """
+
+    def __init__(self, directory=DEFAULT_STORE_DIR, locale="en_US"):
+        self.directory = directory
+        self.locale = locale
+        self._fake = None
+
+    def _faker(self, seed):
+        """The store's Faker instance, reseeded for a block (creating one per block is slow)."""
+        if self._fake is None:
+            self._fake = Faker(self.locale)
+        self._fake.seed_instance(seed)
+        return self._fake
+
+    def _table(self, kind, seed, params, build_block):
+        key = config_key(kind, seed, dict(params, locale=self.locale))
+        return _Table(os.path.join(self.directory, key), build_block)
+
+    # Customers, their cards, names and card issuers of one block
+    def _customer_block(self, params, seed, block):
+        block_seed = _block_seed(seed, "customers", block)
+        rng = random.Random(block_seed)
+        fake = self._faker(block_seed)
+        customers = [population_builder.new_id(rng) for _ in range(CUSTOMER_BLOCK)]
+        card_counts = [rng.randint(1, params["max_cards_per_customer"]) for _ in customers]
+        num_cards = sum(card_counts)
+        return {
+            "customer_id": customers,
+            "customer_name": [fake.name() for _ in customers],
+            "card_count": np.array(card_counts, dtype=np.int64),
+            "card_id": [population_builder.new_id(rng) for _ in range(num_cards)],
+            "card_issuer": np.array([rng.randrange(len(population_builder.POSSIBLE_ISSUERS)) for _ in range(num_cards)],
+                                    dtype=np.int8),
+        }
+
+    # Merchants of one block; all of them are domestic (UK) as in population_builder
+    def _merchant_block(self, seed, block):
+        block_seed = _block_seed(seed, "merchants", block)
+        rng = random.Random(block_seed)
+        fake = self._faker(block_seed)
+        merchant_ids, names, cities, states = [], [], [], []
+        for _ in range(MERCHANT_BLOCK):
+            merchant_ids.append(population_builder.new_id(rng))
+            names.append(fake.company())
+            cities.append(fake.city())
+            states.append(fake.state_abbr())
+        return {
+            "merchant_id": merchant_ids,
+            "merchant_name": names,
+            "city": cities,
+            "state": states,
+            "terminal_id": np.array([rng.randint(1000, 9999) for _ in range(MERCHANT_BLOCK)], dtype=np.int16),
+        }
+
+    def card_population(self, params, seed):
+        """
+        Customers, cards and merchants for the generators of generate_transactions.py and
+        In_out_generator.py, loaded from the store and grown to the size params asks for.
+
+        Args:
+            params (dict): Transaction parameters: num_customers, max_cards_per_customer and max_merchants.
+            seed (int): Seed of the population.
+
+        Returns:
+            dict: customers, customer_cards, customer_names, card_issuers and merchants,
+            as returned by population_builder.build_population.
+        """
+        num_customers = params["num_customers"]
+        num_merchants = params["max_merchants"]
+        customer_table = self._table(
+            "customers", seed, {"max_cards_per_customer": params["max_cards_per_customer"]},
+            lambda block: self._customer_block(params, seed, block)
+        )
+        merchant_table = self._table("merchants", seed, {}, lambda block: self._merchant_block(seed, block))
+        columns = customer_table.get(-(-num_customers // CUSTOMER_BLOCK))
+        merchant_columns = merchant_table.get(-(-num_merchants // MERCHANT_BLOCK))
+
+        card_counts = np.asarray(columns["card_count"][:num_customers])
+        card_offsets = np.zeros(num_customers + 1, dtype=np.int64)
+        np.cumsum(card_counts, out=card_offsets[1:])
+        num_cards = int(card_offsets[-1])
+
+        customers = decode_strings(columns["customer_id"], num_customers)
+        cards = decode_strings(columns["card_id"], num_cards)
+        bounds = card_offsets.tolist()
+        issuers = population_builder.POSSIBLE_ISSUERS
+
+        merchant_ids = decode_strings(merchant_columns["merchant_id"], num_merchants)
+        merchant_fields = zip(
+            merchant_ids,
+            decode_strings(merchant_columns["merchant_name"], num_merchants),
+            decode_strings(merchant_columns["city"], num_merchants),
+            decode_strings(merchant_columns["state"], num_merchants),
+            merchant_columns["terminal_id"][:num_merchants].tolist(),
+        )
+        return {
+            "customers": customers,
+            "customer_cards": {customer: cards[bounds[i]:bounds[i + 1]] for i, customer in enumerate(customers)},
+            "customer_names": dict(zip(customers, decode_strings(columns["customer_name"], num_customers))),
+            "card_issuers": dict(zip(cards, [issuers[i] for i in columns["card_issuer"][:num_cards].tolist()])),
+            "merchants": {
+                merchant_id: {
+                    "merchant_name": name,
+                    "merchant_location": {"city": city, "state": state, "country": "UK"},
+                    "merchant_terminal_id": "T" + str(terminal_id),
+                }
+                for merchant_id, name, city, state, terminal_id in merchant_fields
+            },
+        }
+
+    # Parties of one block with their accounts and fake details. Keys are a keyed permutation
+    # of the global party and account numbers, so they are unique across blocks.
+    def _party_block(self, seed, block, party_digits, account_digits, first_account):
+        rng = np.random.default_rng([seed, block])
+        fake = self._faker(_block_seed(seed, "parties", block))
+        first_party = block * PARTY_BLOCK
+        account_counts = rng.integers(
+            generate.MIN_ACCOUNTS_PER_PARTY, generate.MAX_ACCOUNTS_PER_PARTY + 1, size=PARTY_BLOCK
+        )
+        account_numbers = np.arange(first_account, first_account + int(account_counts.sum()))
+        return {
+            "party_key": generate.keyed_unique_numbers(np.arange(first_party, first_party + PARTY_BLOCK), party_digits, [seed, 0]),
+            "account_count": account_counts.astype(np.int64),
+            "account_key": generate.keyed_unique_numbers(account_numbers, account_digits, [seed, 1]),
+            "name": [fake.name() for _ in range(PARTY_BLOCK)],
+            "dob": np.array([fake.date_of_birth(minimum_age=18, maximum_age=90) for _ in range(PARTY_BLOCK)],
+                            dtype="datetime64[D]"),
+            "address": [fake.address() for _ in range(PARTY_BLOCK)],
+        }
+
+    def party_population(self, num_parties, seed, party_digits=10, account_digits=14):
+        """
+        Parties of generate.py with their accounts and names, dates of birth and addresses,
+        loaded from the store and grown to num_parties.
+
+        Returns:
+            generate.PartyPopulation: Parties and accounts, with the party details.
+        """
+        accounts_seen = [0]
+
+        def build_block(block):
+            # Blocks are built in order, after the stored ones, so the account numbering continues
+            if block and not accounts_seen[0]:
+                accounts_seen[0] = int(np.sum(table._load(block)["account_count"]))
+            columns = self._party_block(seed, block, party_digits, account_digits, accounts_seen[0])
+            accounts_seen[0] += len(columns["account_key"])
+            return columns
+
+        table = self._table("parties", seed, {"party_digits": party_digits, "account_digits": account_digits}, build_block)
+        columns = table.get(-(-num_parties // PARTY_BLOCK))
+
+        account_offsets = np.zeros(num_parties + 1, dtype=np.int64)
+        np.cumsum(columns["account_count"][:num_parties], out=account_offsets[1:])
+        details = {
+            "name": value_pools.ValuePool(*columns["name"]),
+            "dob": columns["dob"],
+            "address": value_pools.ValuePool(*columns["address"]),
+        }
+        return generate.PartyPopulation(
+            np.asarray(columns["party_key"][:num_parties]), account_offsets,
+            columns["account_key"][:int(account_offsets[-1])], details=details
+        )
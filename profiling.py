@@ -0,0 +1,226 @@
+import cProfile
+import contextlib
+import json
+import pstats
+import time
+import tracemalloc
+
+# Instrumentation of the generators: named phase timers, counters and optional cProfile and
+# tracemalloc capture, reported as JSON so a production run can be tuned from its report.
+#
+# Generators hold a profiler and time their phases with profiler.phase(name), count events
+# such as draws rejected by a limit with profiler.count(name), and wrap the objects of their
+# hot path (the Faker pools, the UUID factory) with profiler.timed(obj, name) so every call
+# is timed under one phase. The default NULL_PROFILER does none of this: timed returns the
+# object itself, so an uninstrumented run pays nothing per row. Timing every call roughly
+# doubles the cost of the per-row builders, so compare the phases of a profiled run with each
+# other rather than with the time of an unprofiled one.
+#
+# Set "profile" in transaction_parameters.json to profile the scripts:
+#     "profile": {"report": "profile.json", "cprofile": true, "memory": true}
+
+# Functions listed in the cProfile and tracemalloc sections of the report
+DEFAULT_TOP = 25
+
+# Report written by the scripts when the "profile" config section gives no path
+DEFAULT_REPORT = "profile_report.json"
+
+
+class _Phase:
+    """Context manager adding the time spent in its block to a phase."""
+
+    __slots__ = ("phases", "name", "start")
+
+    def __init__(self, phases, name):
+        self.phases = phases
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        phase = self.phases.get(self.name)
+        if phase is None:
+            self.phases[self.name] = [elapsed, 1]
+        else:
+            phase[0] += elapsed
+            phase[1] += 1
+
+
+class _TimedCalls:
+    """
+    Proxy timing every method call of an object under one phase. Items of the object are
+    proxied as well, so profiler.timed(pools, "faker_pools")["name"].sample() is timed.
+    """
+
+    def __init__(self, target, profiler, name):
+        self._target = target
+        self._profiler = profiler
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(self._target, attr)
+        if not callable(value):
+            return value
+        phases, name = self._profiler.phases, self._name
+
+        def timed(*args, **kwargs):
+            with _Phase(phases, name):
+                return value(*args, **kwargs)
+        return timed
+
+    def __getitem__(self, key):
+        return _TimedCalls(self._target[key], self._profiler, self._name)
+
+
+class Profiler:
+    """
+    Phase timers and counters of a run, with optional cProfile and tracemalloc capture.
+
+    Use it as a context manager around the run to capture cProfile statistics and memory
+    allocations; phases and counters are recorded whether or not it is entered.
+
+    Args:
+        cprofile (bool): Run cProfile while the profiler is entered.
+        memory (bool): Trace allocations with tracemalloc while the profiler is entered.
+        report (str, optional): Default path of write().
+        top (int): Number of functions and allocation sites in the report.
+    """
+
+    enabled = True
+
+    def __init__(self, cprofile=False, memory=False, report=None, top=DEFAULT_TOP):
+        self.cprofile = cprofile
+        self.memory = memory
+        self.report_path = report
+        self.top = top
+        self.phases = {}
+        self.counters = {}
+        self._profile = None
+        self._snapshot = None
+        self._peak_bytes = None
+        self._started = None
+        self.wall_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        """Profiler set up by the "profile" section of a config, or NULL_PROFILER when there is none."""
+        options = config.get("profile")
+        if not options:
+            return NULL_PROFILER
+        options = {} if options is True else options
+        return cls(cprofile=options.get("cprofile", False), memory=options.get("memory", False),
+                   report=options.get("report", DEFAULT_REPORT), top=options.get("top", DEFAULT_TOP))
+
+    def phase(self, name):
+        """Context manager timing its block under name; time spent in repeated blocks adds up."""
+        return _Phase(self.phases, name)
+
+    def count(self, name, n=1):
+        """Add n to the counter name."""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timed(self, obj, name):
+        """obj with every method call timed under the phase name."""
+        return _TimedCalls(obj, self, name)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        if self.memory:
+            tracemalloc.start()
+        if self.cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._profile is not None:
+            self._profile.disable()
+        if self.memory:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.wall_seconds += time.perf_counter() - self._started
+
+    def _cprofile_report(self):
+        stats = pstats.Stats(self._profile)
+        rows = []
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({function})",
+                "calls": calls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            })
+        rows.sort(key=lambda row: row["tottime"], reverse=True)
+        return rows[:self.top]
+
+    def _memory_report(self):
+        statistics = self._snapshot.statistics("lineno")[:self.top]
+        return {
+            "peak_bytes": self._peak_bytes,
+            "top": [
+                {"location": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+                for stat in statistics
+            ],
+        }
+
+    def report(self):
+        """
+        The measurements as a JSON-serializable dict.
+
+        Returns:
+            dict: wall_seconds, phases ({name: {seconds, calls}}, slowest first) and counters,
+            plus cprofile (functions by own time) and memory (peak and top allocation sites)
+            when captured.
+        """
+        phases = sorted(self.phases.items(), key=lambda item: item[1][0], reverse=True)
+        report = {
+            "wall_seconds": self.wall_seconds,
+            "phases": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in phases},
+            "counters": dict(sorted(self.counters.items())),
+        }
+        if self._profile is not None:
+            report["cprofile"] = self._cprofile_report()
+        if self._snapshot is not None:
+            report["memory"] = self._memory_report()
+        return report
+
+    def write(self, path=None):
+        """Write the report as JSON to path, or to the report path the profiler was created with."""
+        path = path or self.report_path
+        if path is None:
+            raise ValueError("No report path given")
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+class NullProfiler:
+    """Profiler that records nothing, the default of the generators."""
+
+    enabled = False
+
+    def phase(self, name):
+        return contextlib.nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+    def timed(self, obj, name):
+        return obj
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def report(self):
+        return {}
+
+    def write(self, path=None):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,318 @@
+import numpy as np
+import pandas as pd
+import alert_engine
+import identifiers
+import value_pools
+from batch_generator import FOREIGN_CURRENCIES
+
+# Plants the alert patterns of alert_scenarios.json into background card transactions, such
+# as those of In_out_generator.generate_transactions, with ground-truth labels.
+#
+# Each pattern is planted into a share of the background customers. A planted pattern is a
+# block of rows copied from one of the customer's own card transactions (so card, issuer,
+# merchant and names stay consistent) with new ids and the times, amounts, countries or
+# locations that make the scenario fire under the configured thresholds. Blocks are built as
+# whole columns and appended with one concat, so planting stays cheap on large background
+# sets. Every row carries an injection_id (-1 for background rows) and the scenario key it
+# was planted for, which detection_recall matches against the alerts raised on the output.
+#
+# Both the row layout of the generators (merchant_location / geolocation dicts) and the flat
+# layout read by the alert scripts (merchant_country, latitude, longitude) are supported.
+
+# Share of the background customers each pattern is planted into by default
+DEFAULT_RATES = {key: 0.01 for key in alert_engine.SCENARIO_KEYS.values()}
+
+LABEL_COLUMNS = ["injection_id", "injected_scenario"]
+
+SCENARIO_NUMBERS = {key: number for number, key in alert_engine.SCENARIO_KEYS.items()}
+
+DAY_NS = pd.Timedelta(days=1).value
+
+
+def _has_location(frame):
+    if "geolocation" in frame:
+        return frame["geolocation"].notna().to_numpy()
+    return (frame["latitude"].notna() & frame["longitude"].notna()).to_numpy()
+
+
+def _merchant_countries(frame):
+    if "merchant_location" in frame:
+        return np.array([
+            location["country"] if isinstance(location, dict) else None
+            for location in frame["merchant_location"].tolist()
+        ], dtype=object)
+    return frame["merchant_country"].to_numpy(dtype=object)
+
+
+def _coordinates(frame):
+    if "geolocation" in frame:
+        locations = frame["geolocation"].tolist()
+        return (np.array([location["latitude"] for location in locations], dtype=float),
+                np.array([location["longitude"] for location in locations], dtype=float))
+    return frame["latitude"].to_numpy(dtype=float), frame["longitude"].to_numpy(dtype=float)
+
+
+# Move the merchant of every row of a block abroad, paid in a foreign currency
+def _set_international(block, rng, countries):
+    foreign = countries.draw(rng, len(block))
+    if "merchant_location" in block:
+        block["merchant_location"] = [
+            {**location, "country": country}
+            for location, country in zip(block["merchant_location"].tolist(), foreign.tolist())
+        ]
+    else:
+        block["merchant_country"] = foreign
+    block["currency"] = FOREIGN_CURRENCIES[rng.integers(0, len(FOREIGN_CURRENCIES), len(block))]
+    if "exchange_rate" in block:
+        block["exchange_rate"] = np.round(rng.uniform(0.5, 1.5, len(block)), 2)
+
+
+def _set_coordinates(block, latitude, longitude):
+    if "geolocation" in block:
+        block["geolocation"] = [
+            {"latitude": lat, "longitude": lon} for lat, lon in zip(latitude.tolist(), longitude.tolist())
+        ]
+    else:
+        block["latitude"] = latitude
+        block["longitude"] = longitude
+
+
+# Shared state of one inject_scenarios run: background arrays, randomness and id counters
+class _Planter:
+
+    def __init__(self, background, rng, ids, countries):
+        self.background = background
+        self.rng = rng
+        self.ids = ids
+        self.countries = countries
+        self.next_injection = 0
+
+        # Template rows: card transactions with a location, grouped by customer
+        eligible = np.flatnonzero(_has_location(background) & background["card_id"].notna().to_numpy())
+        codes, self.customers = pd.factorize(background["customer_id"].iloc[eligible])
+        order = np.argsort(codes, kind="stable")
+        self.eligible = eligible[order]
+        self.counts = np.bincount(codes, minlength=len(self.customers))
+        self.starts = np.cumsum(self.counts) - self.counts
+
+        # Planted rows fall within the background's time range
+        times = pd.to_datetime(background["transaction_date_time"])
+        self.time_dtype = times.dtype
+        self.first_ns = times.min().value
+        self.last_ns = times.max().value
+
+    # Customer codes to plant a pattern into, rate of the (eligible) customers, without repetition
+    def choose(self, rate, among=None):
+        among = np.arange(len(self.customers)) if among is None else among
+        k = min(len(among), int(round(rate * len(self.customers))))
+        return self.rng.choice(among, k, replace=False)
+
+    # One random card transaction (background position) of each customer
+    def templates(self, customers):
+        offsets = np.floor(self.rng.random(len(customers)) * self.counts[customers]).astype(np.int64)
+        return self.eligible[self.starts[customers] + offsets]
+
+    def base_times(self, n):
+        return self.rng.integers(self.first_ns, self.last_ns + 1, n)
+
+    # Copies of the template rows, sizes[i] rows for injection i, with new ids and the given
+    # times and their labels; scenario-specific columns are set by the caller
+    def block(self, scenario, templates, sizes, time_ns):
+        positions = np.repeat(templates, sizes)
+        block = self.background.iloc[positions].reset_index(drop=True)
+        n = len(block)
+        injection_ids = self.next_injection + np.repeat(np.arange(len(sizes)), sizes)
+        self.next_injection += len(sizes)
+
+        block["transaction_date_time"] = pd.to_datetime(time_ns, unit="ns").astype(self.time_dtype)
+        if "transaction_id" in block:
+            block["transaction_id"] = self.ids.strings(n)
+        if "session_id" in block:
+            block["session_id"] = self.ids.strings(n)
+        if "transaction_amount" in block:
+            block["transaction_amount"] = np.round(
+                block["transaction_amount"].to_numpy(dtype=float) * self.rng.uniform(0.5, 1.5, n), 2
+            )
+        block["injection_id"] = injection_ids
+        block["injected_scenario"] = scenario
+        return block
+
+
+# Times of each injection's rows, spread over [base, base + span)
+def _within(rng, base_ns, sizes, span_ns):
+    return np.repeat(base_ns, sizes) + rng.integers(0, max(int(span_ns), 1), int(sizes.sum()))
+
+
+def _plant_high_transaction_volume(planter, rate, config):
+    customers = planter.choose(rate)
+    sizes = np.full(len(customers), config['transactions_per_day_threshold'] + 1)
+    # Same card, same calendar day
+    days = planter.base_times(len(customers)) // DAY_NS * DAY_NS
+    return planter.block("high_transaction_volume", planter.templates(customers), sizes,
+                         _within(planter.rng, days, sizes, DAY_NS))
+
+
+def _plant_high_transaction_amount(planter, rate, config):
+    customers = planter.choose(rate)
+    sizes = np.ones(len(customers), dtype=np.int64)
+    block = planter.block("high_transaction_amount", planter.templates(customers), sizes,
+                          planter.base_times(len(customers)))
+    threshold = config['amount_threshold']
+    block["transaction_amount"] = np.round(planter.rng.uniform(threshold * 1.01, threshold * 2, len(block)), 2)
+    return block
+
+
+def _plant_unusual_transaction_patterns(planter, rate, config):
+    customers = planter.choose(rate)
+    sizes = np.full(len(customers), config['international_transaction_threshold'] + 1)
+    span_ns = pd.Timedelta(days=config['days_threshold']).value // 2
+    block = planter.block("unusual_transaction_patterns", planter.templates(customers), sizes,
+                          _within(planter.rng, planter.base_times(len(customers)), sizes, span_ns))
+    _set_international(block, planter.rng, planter.countries)
+    return block
+
+
+def _plant_rapid_consecutive_transactions(planter, rate, config):
+    customers = planter.choose(rate)
+    sizes = np.full(len(customers), config['transaction_count_threshold'] + 1)
+    span_ns = pd.Timedelta(minutes=config['time_interval_minutes']).value // 2
+    return planter.block("rapid_consecutive_transactions", planter.templates(customers), sizes,
+                         _within(planter.rng, planter.base_times(len(customers)), sizes, span_ns))
+
+
+def _plant_location_mismatch(planter, rate, config):
+    customers = planter.choose(rate)
+    sizes = np.full(len(customers), 2)
+    span_ns = pd.Timedelta(hours=config['time_interval_hours']).value // 2
+    base_ns = planter.base_times(len(customers))
+    time_ns = np.repeat(base_ns, 2)
+    time_ns[1::2] += planter.rng.integers(0, max(span_ns, 1), len(customers))
+    block = planter.block("location_mismatch", planter.templates(customers), sizes, time_ns)
+
+    # The second row of each pair is a quarter turn of longitude away, on the other side of the
+    # equator: between 10,000 and 15,000 km from the first, and never near its antipode where
+    # the haversine formula loses precision
+    latitude, longitude = _coordinates(block.iloc[::2])
+    pair_latitude = np.repeat(latitude, 2)
+    pair_longitude = np.repeat(longitude, 2)
+    pair_latitude[1::2] = np.round(-latitude / 2, 6)
+    pair_longitude[1::2] = np.where(longitude > 90, longitude - 270, longitude + 90)
+    _set_coordinates(block, pair_latitude, pair_longitude)
+    return block
+
+
+# Planted last: how many international rows a customer needs depends on all its other rows,
+# background and planted
+def _plant_frequent_international_transactions(planter, rate, config, frames):
+    background = planter.background
+    codes = pd.Index(planter.customers).get_indexer(background["customer_id"])
+    domestic = np.zeros(len(planter.customers), dtype=np.int64)
+    international = np.zeros(len(planter.customers), dtype=np.int64)
+    for frame, frame_codes in [(background, codes)] + [
+        (frame, pd.Index(planter.customers).get_indexer(frame["customer_id"])) for frame in frames
+    ]:
+        # Counted as in alert_engine: every row of the customer, rows without a UK merchant
+        # (inbound payments included) as international
+        known = frame_codes >= 0
+        is_domestic = _merchant_countries(frame) == "UK"
+        domestic += np.bincount(frame_codes[known & is_domestic], minlength=len(domestic))
+        international += np.bincount(frame_codes[known & ~is_domestic], minlength=len(international))
+
+    # Only customers with domestic activity have a ratio to raise
+    customers = planter.choose(rate, among=np.flatnonzero(domestic > 0))
+    needed = np.floor(config['international_to_domestic_ratio'] * domestic[customers]).astype(np.int64) + 1
+    sizes = np.maximum(needed - international[customers], 1)
+    time_ns = planter.rng.integers(planter.first_ns, planter.last_ns + 1, int(sizes.sum()))
+    block = planter.block("frequent_international_transactions", planter.templates(customers), sizes, time_ns)
+    _set_international(block, planter.rng, planter.countries)
+    return block
+
+
+PLANTERS = {
+    "high_transaction_volume": _plant_high_transaction_volume,
+    "high_transaction_amount": _plant_high_transaction_amount,
+    "unusual_transaction_patterns": _plant_unusual_transaction_patterns,
+    "rapid_consecutive_transactions": _plant_rapid_consecutive_transactions,
+    "location_mismatch": _plant_location_mismatch,
+}
+
+
+def inject_scenarios(background, config, rates=None, seed=None, sort=True):
+    """
+    Plant alert patterns into background transactions.
+
+    Args:
+        background (pd.DataFrame): Card transactions, e.g. from In_out_generator.generate_transactions.
+        config (dict): Scenario configuration loaded from alert_scenarios.json; the planted
+            patterns just exceed its thresholds.
+        rates (dict, optional): Scenario key -> share of the background customers to plant the
+            pattern into; DEFAULT_RATES for the scenarios not given. Disabled scenarios are skipped.
+        seed (int, optional): Seed of the choice of customers, times, amounts, countries and ids.
+        sort (bool): Sort the output by transaction time (background order is kept otherwise,
+            with the planted rows appended).
+
+    Returns:
+        pd.DataFrame: Background and planted transactions with a RangeIndex and the
+            LABEL_COLUMNS: injection_id (-1 for background rows) and injected_scenario (None
+            for background rows).
+    """
+    rates = {**DEFAULT_RATES, **(rates or {})}
+    seed_sequence = np.random.SeedSequence(seed)
+    rng_seed, id_seed, pool_seed = seed_sequence.spawn(3)
+    countries = value_pools.PoolCache(seed=int(pool_seed.generate_state(1)[0]))["country_code"]
+    planter = _Planter(background, np.random.default_rng(rng_seed), identifiers.IdFactory(id_seed), countries)
+
+    frames = []
+    for key, plant in PLANTERS.items():
+        if config[key]['enabled'] and rates.get(key, 0) > 0:
+            frames.append(plant(planter, rates[key], config[key]))
+    key = "frequent_international_transactions"
+    if config[key]['enabled'] and rates.get(key, 0) > 0:
+        frames.append(_plant_frequent_international_transactions(planter, rates[key], config[key], frames))
+
+    labelled = background.assign(injection_id=np.int64(-1), injected_scenario=None)
+    combined = pd.concat([labelled, *frames], ignore_index=True)
+    if sort:
+        order = np.argsort(combined["transaction_date_time"].to_numpy(), kind="stable")
+        combined = combined.take(order).reset_index(drop=True)
+    return combined
+
+
+def detection_recall(transactions, alerts):
+    """
+    Share of the planted patterns that raised the alert they were planted for.
+
+    A pattern counts as detected when an alert of its scenario is raised on any of its rows.
+
+    Args:
+        transactions (pd.DataFrame): Output of inject_scenarios, as passed to the alert generator.
+        alerts (pd.DataFrame): Alerts raised on those transactions.
+
+    Returns:
+        pd.DataFrame: planted, detected and recall per scenario key.
+    """
+    injection_ids = transactions["injection_id"].to_numpy()
+    scenarios = transactions["injected_scenario"].to_numpy(dtype=object)
+    planted_rows = injection_ids >= 0
+    planted = pd.Series(scenarios[planted_rows]).groupby(injection_ids[planted_rows]).first()
+
+    detected = set()
+    if len(alerts):
+        parts = alerts["alert_id"].str.extract(r"^A(\d+)-(.*)$")
+        positions = transactions.index.astype(str).get_indexer(parts[1])
+        numbers = parts[0].astype(int).to_numpy()
+        hit = positions >= 0
+        positions, numbers = positions[hit], numbers[hit]
+        row_scenarios = scenarios[positions]
+        matches = np.array([
+            scenario is not None and SCENARIO_NUMBERS[scenario] == number
+            for scenario, number in zip(row_scenarios.tolist(), numbers.tolist())
+        ], dtype=bool)
+        detected = set(injection_ids[positions[matches]].tolist())
+
+    summary = pd.DataFrame({
+        "planted": planted.value_counts(),
+        "detected": planted[planted.index.isin(list(detected))].value_counts(),
+    }).fillna(0).astype(np.int64)
+    summary["recall"] = summary["detected"] / summary["planted"]
+    return summary
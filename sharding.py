@@ -0,0 +1,173 @@
+import importlib
+import multiprocessing
+import random
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+import batch_generator
+import capacity_planner
+import population_store
+import value_pools
+
+# Sharded, multi-process generation of the card transaction datasets.
+#
+# The customer population of a TransactionGenerator (generate_transactions.py,
+# In_out_generator.py) is split into a fixed number of shards. Each shard gets its own seed
+# derived from the run seed (for the random module, the Faker instance, the id factory and a
+# numpy Generator), and shards are merged back in shard order. The output therefore only
+# depends on the seed and the number of shards, so it is byte-identical whatever the number
+# of worker processes.
+
+DEFAULT_NUM_SHARDS = 64
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+
+def shard_bounds(num_customers, num_shards):
+    """Split customers 0..num_customers-1 into at most num_shards consecutive, non-empty ranges."""
+    edges = np.linspace(0, num_customers, num_shards + 1).round().astype(np.int64)
+    return [(first, last) for first, last in zip(edges[:-1].tolist(), edges[1:].tolist()) if last > first]
+
+
+def shard_seed_sequences(seed, num_shards):
+    """
+    Derive independent seed sequences from the run seed.
+
+    Returns:
+        tuple: (seed sequence for the customer quotas, list of one seed sequence per shard).
+    """
+    children = np.random.SeedSequence(seed).spawn(num_shards + 1)
+    return children[0], children[1:]
+
+
+def _python_seed(seed_sequence):
+    """Integer seed for random.Random and Faker derived from a numpy SeedSequence."""
+    return int.from_bytes(seed_sequence.generate_state(4).tobytes(), "little")
+
+
+def _resolve_generator(generator):
+    """Generator instance for a module name ("generate_transactions", "In_out_generator") or an instance."""
+    if isinstance(generator, str):
+        return importlib.import_module(generator).default_generator()
+    return generator
+
+
+def _init_worker(generator_class, config, population, batch, seed):
+    """
+    Set up the generator of a worker process once, with the parent's config and population,
+    so workers neither re-read the config nor rebuild the customers.
+    """
+    generator = generator_class(config=config, population=population)
+    _worker["generator"] = generator
+    _worker["cards"] = [card for customer in generator.customers for card in generator.customer_cards[customer]]
+    _worker["arrays"] = batch_generator.population_arrays(generator.population) if batch else None
+    _worker["pools"] = batch_generator.faker_pools(value_pools.PoolCache(seed=seed)) if batch else None
+
+
+def _generate_rows(generator, slots, seed_sequence, id_seed):
+    """Run the generator's row builder with the random, numpy, Faker and id state seeded for the shard."""
+    saved = random.getstate(), np.random.get_state(), generator.fake.random.getstate()
+    python_seed = _python_seed(seed_sequence)
+    random.seed(python_seed)
+    np.random.seed(seed_sequence.generate_state(4))
+    generator.fake.seed_instance(python_seed)
+    generator.ids.reseed(id_seed)
+    try:
+        return generator.build_transactions(slots)
+    finally:
+        random.setstate(saved[0])
+        np.random.set_state(saved[1])
+        generator.fake.random.setstate(saved[2])
+
+
+def _generate_shard(task):
+    """Plan and generate the transactions of one shard of customers."""
+    (first, first_card, customer_quota, card_counts, card_capacity,
+     start_date, end_date, seed_sequence) = task
+    generator = _worker["generator"]
+    params = generator.config
+    plan_seed, id_seed = seed_sequence.spawn(2)
+    rng = np.random.default_rng(plan_seed)
+
+    customer_idx, card_idx, transaction_dates = capacity_planner.plan_customer_block(
+        customer_quota, card_counts, card_capacity, start_date, end_date,
+        params["max_transactions_per_card_per_day"], params["max_transactions_per_customer_per_day"], rng
+    )
+    customer_idx = customer_idx + first
+    card_idx = card_idx + first_card
+
+    if _worker["arrays"] is not None:
+        return batch_generator.build_batch(
+            rng, _worker["arrays"], _worker["pools"], params,
+            customer_idx, card_idx, transaction_dates, end_date
+        )
+
+    slots = [
+        (generator.customers[customer], _worker["cards"][card], transaction_date)
+        for customer, card, transaction_date in zip(customer_idx.tolist(), card_idx.tolist(), transaction_dates.tolist())
+    ]
+    return _generate_rows(generator, slots, seed_sequence, id_seed)
+
+
+def iter_sharded_transactions(n, generator="generate_transactions", batch=False, seed=0, num_workers=None,
+                              num_shards=DEFAULT_NUM_SHARDS, end_date=None):
+    """
+    Generate n transactions shard by shard across a process pool, yielding one DataFrame per shard.
+
+    Args:
+        n (int): Number of transactions to generate.
+        generator (str or TransactionGenerator): Generator instance, or the name of the module whose
+            default generator is used: "generate_transactions" or "In_out_generator".
+        batch (bool): Use the columnar batch engine (generate_transactions only) instead of the row builder.
+        seed (int): Run seed; the same seed and num_shards always give the same output.
+        num_workers (int, optional): Worker processes, one per CPU by default; 1 runs in-process.
+        num_shards (int): Number of customer shards.
+        end_date (datetime, optional): End of the transaction period, now by default. Fix it to
+            reproduce a dataset across runs.
+
+    Yields:
+        pd.DataFrame: Transactions of each shard, in shard order.
+    """
+    generator = _resolve_generator(generator)
+    if batch and not generator.has_batch_engine:
+        raise ValueError(f"{type(generator).__name__} has no batch engine")
+    params = generator.config
+
+    end_date = datetime.now() if end_date is None else end_date
+    start_date = end_date - timedelta(days=params["transaction_period_days"])
+    card_counts = np.array([len(generator.customer_cards[customer]) for customer in generator.customers], dtype=np.int64)
+    card_offsets = np.cumsum(card_counts) - card_counts
+
+    # Customer quotas are fixed once for the whole population, then each shard plans its own cards and days
+    quota_seed, shard_seeds = shard_seed_sequences(seed, num_shards)
+    customer_quota, card_capacity = capacity_planner.plan_customer_quotas(
+        n, card_counts, start_date, end_date, params["max_transactions_per_card"],
+        params["max_transactions_per_card_per_day"], params["max_transactions_per_customer_per_day"],
+        np.random.default_rng(quota_seed)
+    )
+
+    tasks = []
+    for (first, last), seed_sequence in zip(shard_bounds(len(card_counts), num_shards), shard_seeds):
+        first_card = card_offsets[first]
+        last_card = card_offsets[last - 1] + card_counts[last - 1]
+        tasks.append((
+            first, first_card, customer_quota[first:last], card_counts[first:last],
+            card_capacity[first_card:last_card], start_date, end_date, seed_sequence
+        ))
+
+    # Workers load a stored population themselves (the store is up to date once the parent has
+    # its population) instead of receiving a pickled copy
+    population = None if population_store.store_dir(params) else generator.population
+    worker_args = (type(generator), generator.config, population, batch, seed)
+    if num_workers == 1:
+        _init_worker(*worker_args)
+        yield from map(_generate_shard, tasks)
+        return
+    with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=worker_args) as pool:
+        yield from pool.imap(_generate_shard, tasks)
+
+
+def generate_sharded_transactions(n, **kwargs):
+    """Generate n transactions with iter_sharded_transactions and merge the shards into one DataFrame."""
+    return pd.concat(list(iter_sharded_transactions(n, **kwargs)), ignore_index=True)
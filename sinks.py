@@ -0,0 +1,130 @@
+import gzip
+import os
+import pandas as pd
+
+# Parquet output needs pyarrow, which is optional: CSV output works without it
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Default number of rows per chunk yielded by the generators' chunked modes
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+class CsvSink:
+    """Append DataFrame chunks to a single (optionally gzip-compressed) CSV file."""
+
+    def __init__(self, path, compress=None):
+        self.path = path
+        self.compress = path.endswith(".gz") if compress is None else compress
+        self.rows_written = 0
+        self._file = None
+
+    def write(self, chunk):
+        if self._file is None:
+            self._file = gzip.open(self.path, "wt", newline="") if self.compress else open(self.path, "w", newline="")
+            header = True
+        else:
+            header = False
+        chunk.to_csv(self._file, header=header, index=False)
+        self.rows_written += len(chunk)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ParquetSink:
+    """
+    Append DataFrame chunks to a partitioned Parquet dataset, one file per chunk and partition.
+
+    Args:
+        path (str): Root directory of the dataset.
+        partition_cols (list, optional): Columns to partition by, e.g. ["customer_id"].
+        date_column (str, optional): Datetime column from which a "date" partition column is derived.
+    """
+
+    def __init__(self, path, partition_cols=None, date_column=None):
+        if pq is None:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+        self.path = path
+        self.partition_cols = list(partition_cols or [])
+        self.date_column = date_column
+        if date_column is not None and "date" not in self.partition_cols:
+            self.partition_cols.insert(0, "date")
+        self.rows_written = 0
+        self.schema = None
+        self._chunks_written = 0
+
+    def _table(self, chunk):
+        """Convert a chunk to Arrow with the column types fixed by the first chunk written."""
+        if self.schema is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            self.schema = table.schema
+            return table
+
+        # Columns missing from this chunk, or without any value in it, are written as
+        # nulls of the dataset's type
+        empty = [
+            name for name in self.schema.names
+            if name not in chunk.columns or chunk[name].isna().all()
+        ]
+        if empty:
+            chunk = chunk.assign(**{name: pd.Series(None, index=chunk.index, dtype=object) for name in empty})
+        return pa.Table.from_pandas(chunk[self.schema.names], schema=self.schema, preserve_index=False)
+
+    def write(self, chunk):
+        if self.date_column is not None:
+            chunk = chunk.assign(date=pd.to_datetime(chunk[self.date_column]).dt.strftime("%Y-%m-%d"))
+        os.makedirs(self.path, exist_ok=True)
+        pq.write_to_dataset(
+            self._table(chunk),
+            root_path=self.path,
+            partition_cols=self.partition_cols or None,
+            basename_template=f"part-{self._chunks_written:05d}-{{i}}.parquet",
+        )
+        self._chunks_written += 1
+        self.rows_written += len(chunk)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_sink(path, **kwargs):
+    """Pick a CSV sink for .csv/.csv.gz paths and a Parquet dataset sink otherwise."""
+    if path.endswith(".csv") or path.endswith(".csv.gz"):
+        return CsvSink(path, **kwargs)
+    return ParquetSink(path, **kwargs)
+
+
+def write_chunks(chunks, sink):
+    """
+    Stream DataFrame chunks into a sink so only one chunk is held in memory at a time.
+
+    Args:
+        chunks (iterable): DataFrames, e.g. from a generator's iter_*_chunks function.
+        sink (CsvSink or ParquetSink): Destination of the rows.
+
+    Returns:
+        int: Number of rows written.
+    """
+    with sink:
+        for chunk in chunks:
+            sink.write(chunk)
+    return sink.rows_written
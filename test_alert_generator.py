@@ -0,0 +1,218 @@
+import copy
+import json
+import os
+from datetime import timedelta
+from math import radians, sin, cos, sqrt, atan2
+import numpy as np
+import pandas as pd
+import pytest
+import alert_generator
+import narrative_generator
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alert_scenarios.json"), "r") as f:
+    BASE_CONFIG = json.load(f)
+
+
+# Reference copy of the per-row haversine of the original alert loop
+def reference_haversine(lat1, lon1, lat2, lon2):
+    R = 6371
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return R * c
+
+
+# Reference copy of the original per-row alert loop of alert_generator. With narratives, the
+# loop of narrative_generator, which adds a narrative to every alert
+def reference_alerts(transactions, config, narratives=False):
+    alerts = []
+
+    def add(alert, details):
+        if narratives:
+            alert["narrative"] = narrative_generator.generate_narrative(alert["alert_type"], details)
+        alerts.append(alert)
+
+    for i, transaction in transactions.iterrows():
+        customer_id = transaction['customer_id']
+        card_id = transaction['card_id']
+        transaction_time = transaction['transaction_date_time']
+        transaction_amount = transaction['transaction_amount']
+        currency = transaction['currency']
+        location = (transaction['latitude'], transaction['longitude'])
+
+        if pd.isna(location[0]) or pd.isna(location[1]):
+            continue
+
+        customer_transactions = transactions[transactions['customer_id'] == customer_id]
+        card_transactions = transactions[transactions['card_id'] == card_id]
+
+        if config['high_transaction_volume']['enabled']:
+            daily_transactions = card_transactions[card_transactions['transaction_date_time'].dt.date == transaction_time.date()]
+            if len(daily_transactions) > config['high_transaction_volume']['transactions_per_day_threshold']:
+                add({
+                    "alert_id": f"A1-{i}",
+                    "customer_id": customer_id,
+                    "card_id": card_id,
+                    "alert_type": "High Transaction Volume",
+                    "crime_type": config['high_transaction_volume']['crime_type'],
+                    "details": f"{len(daily_transactions)} transactions in a single day"
+                }, {"customer_id": customer_id, "transaction_count": len(daily_transactions), "date": transaction_time.date()})
+
+        if config['high_transaction_amount']['enabled'] and transaction_amount > config['high_transaction_amount']['amount_threshold']:
+            add({
+                "alert_id": f"A2-{i}",
+                "customer_id": customer_id,
+                "card_id": card_id,
+                "alert_type": "High Transaction Amount",
+                "crime_type": config['high_transaction_amount']['crime_type'],
+                "details": f"Transaction amount of {transaction_amount} {currency} exceeds threshold"
+            }, {"customer_id": customer_id, "transaction_amount": transaction_amount, "currency": currency,
+                "date": transaction_time.date()})
+
+        if config['unusual_transaction_patterns']['enabled']:
+            recent_transactions = customer_transactions[(customer_transactions['transaction_date_time'] >= transaction_time - timedelta(days=config['unusual_transaction_patterns']['days_threshold']))]
+            international_transactions = recent_transactions[recent_transactions['merchant_country'] != 'UK']
+            if len(international_transactions) > config['unusual_transaction_patterns']['international_transaction_threshold']:
+                add({
+                    "alert_id": f"A3-{i}",
+                    "customer_id": customer_id,
+                    "alert_type": "Unusual Transaction Patterns",
+                    "crime_type": config['unusual_transaction_patterns']['crime_type'],
+                    "details": f"{len(international_transactions)} international transactions within {config['unusual_transaction_patterns']['days_threshold']} days"
+                }, {})
+
+        if config['frequent_international_transactions']['enabled']:
+            domestic_count = len(customer_transactions[customer_transactions['merchant_country'] == 'UK'])
+            international_count = len(customer_transactions) - domestic_count
+            if domestic_count > 0 and international_count / domestic_count > config['frequent_international_transactions']['international_to_domestic_ratio']:
+                add({
+                    "alert_id": f"A4-{i}",
+                    "customer_id": customer_id,
+                    "alert_type": "Frequent International Transactions",
+                    "crime_type": config['frequent_international_transactions']['crime_type'],
+                    "details": f"International to domestic transaction ratio is {international_count/domestic_count:.2f}"
+                }, {"customer_id": customer_id, "international_count": international_count,
+                    "receiver_country": transaction['merchant_country']})
+
+        if config['rapid_consecutive_transactions']['enabled']:
+            close_transactions = customer_transactions[(customer_transactions['transaction_date_time'] >= transaction_time - timedelta(minutes=config['rapid_consecutive_transactions']['time_interval_minutes'])) &
+                                                       (customer_transactions['transaction_date_time'] <= transaction_time + timedelta(minutes=config['rapid_consecutive_transactions']['time_interval_minutes']))]
+            if len(close_transactions) > config['rapid_consecutive_transactions']['transaction_count_threshold']:
+                add({
+                    "alert_id": f"A5-{i}",
+                    "customer_id": customer_id,
+                    "card_id": card_id,
+                    "alert_type": "Rapid Consecutive Transactions",
+                    "crime_type": config['rapid_consecutive_transactions']['crime_type'],
+                    "details": f"{len(close_transactions)} transactions within {config['rapid_consecutive_transactions']['time_interval_minutes']} minutes"
+                }, {"customer_id": customer_id, "transaction_count": len(close_transactions),
+                    "time_interval": config['rapid_consecutive_transactions']['time_interval_minutes'],
+                    "date": transaction_time.date()})
+
+        if config['location_mismatch']['enabled']:
+            recent_transactions = customer_transactions[(customer_transactions['transaction_date_time'] >= transaction_time - timedelta(hours=config['location_mismatch']['time_interval_hours']))]
+            for _, recent_txn in recent_transactions.iterrows():
+                recent_location = (recent_txn['latitude'], recent_txn['longitude'])
+                distance_km = reference_haversine(location[0], location[1], recent_location[0], recent_location[1])
+                if distance_km > config['location_mismatch']['distance_threshold_km']:
+                    add({
+                        "alert_id": f"A6-{i}",
+                        "customer_id": customer_id,
+                        "card_id": card_id,
+                        "alert_type": "Location Mismatch",
+                        "crime_type": config['location_mismatch']['crime_type'],
+                        "details": f"Transaction locations {location} and {recent_location} are more than {config['location_mismatch']['distance_threshold_km']} km apart within {config['location_mismatch']['time_interval_hours']} hours"
+                    }, {"customer_id": customer_id, "location_1": f"{location[0]}, {location[1]}",
+                        "location_2": f"{recent_location[0]}, {recent_location[1]}",
+                        "time_interval": config['location_mismatch']['time_interval_hours']})
+                    break
+
+    return pd.DataFrame(alerts)
+
+
+# Small random transactions of a few customers. Times are on a 15 minute grid, so rows often
+# fall exactly on the edges of the minute, hour and day windows; some locations, customers,
+# times and countries are missing, and half of the locations are close together
+def random_transactions(n, seed, num_customers=6):
+    rng = np.random.default_rng(seed)
+    customers = rng.integers(0, num_customers, n)
+    transactions = pd.DataFrame({
+        "customer_id": [f"C{customer}" for customer in customers],
+        "card_id": [f"K{customer}-{card}" for customer, card in zip(customers, rng.integers(0, 2, n))],
+        "transaction_date_time": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 3 * 96, n) * 15, unit="min"),
+        "transaction_amount": np.round(rng.gamma(1.2, 4000, n), 2),
+        "payment_channel": rng.choice(["POS", "online"], n),
+        "currency": rng.choice(["GBP", "USD"], n),
+        "latitude": np.round(rng.uniform(-60, 60, n), 4),
+        "longitude": np.round(rng.uniform(-120, 120, n), 4),
+        "merchant_country": rng.choice(["UK", "UK", "FR", None], n),
+    })
+    local = rng.random(n) < 0.5
+    transactions.loc[local, "latitude"] = 51.5 + rng.uniform(0, 0.5, local.sum())
+    transactions.loc[local, "longitude"] = 0.1
+    transactions.loc[rng.random(n) < 0.05, "latitude"] = np.nan
+    transactions.loc[rng.random(n) < 0.05, "longitude"] = np.nan
+    transactions.loc[rng.random(n) < 0.02, "customer_id"] = None
+    transactions.loc[rng.random(n) < 0.02, "transaction_date_time"] = pd.NaT
+    # Row labels that are not positions
+    if seed % 2:
+        transactions.index = transactions.index * 3 + 7
+    return transactions
+
+
+def _configs():
+    # Thresholds low enough for the small frames, with windows that match the 15 minute grid
+    low = copy.deepcopy(BASE_CONFIG)
+    low["high_transaction_volume"]["transactions_per_day_threshold"] = 3
+    low["unusual_transaction_patterns"]["international_transaction_threshold"] = 2
+    low["rapid_consecutive_transactions"]["time_interval_minutes"] = 30
+    low["rapid_consecutive_transactions"]["transaction_count_threshold"] = 2
+    low["location_mismatch"]["time_interval_hours"] = 1
+
+    partly_disabled = copy.deepcopy(low)
+    for key in ["high_transaction_volume", "high_transaction_amount", "unusual_transaction_patterns"]:
+        partly_disabled[key]["enabled"] = False
+
+    one_enabled = copy.deepcopy(low)
+    for key in one_enabled:
+        one_enabled[key]["enabled"] = key == "frequent_international_transactions"
+
+    none_enabled = copy.deepcopy(low)
+    for key in none_enabled:
+        none_enabled[key]["enabled"] = False
+    return {"base": BASE_CONFIG, "low": low, "partly_disabled": partly_disabled,
+            "one_enabled": one_enabled, "none_enabled": none_enabled}
+
+
+CONFIGS = _configs()
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=list(CONFIGS))
+@pytest.mark.parametrize("n", [0, 1, 40, 150])
+@pytest.mark.parametrize("seed", range(4))
+def test_generate_alerts_matches_row_loop(config, n, seed):
+    transactions = random_transactions(n, seed)
+    expected = reference_alerts(transactions, CONFIGS[config])
+    pd.testing.assert_frame_equal(alert_generator.generate_alerts(transactions, CONFIGS[config]), expected)
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=list(CONFIGS))
+@pytest.mark.parametrize("n", [0, 1, 40, 150])
+@pytest.mark.parametrize("seed", range(4))
+def test_narratives_match_row_loop(config, n, seed):
+    transactions = random_transactions(n, seed)
+    # The original narrative loop fails on transactions without a time
+    transactions = transactions[transactions["transaction_date_time"].notna()]
+
+    # The original narrative loop has no Unusual Transaction Patterns scenario
+    without_unusual = copy.deepcopy(CONFIGS[config])
+    without_unusual["unusual_transaction_patterns"]["enabled"] = False
+    expected = reference_alerts(transactions, without_unusual, narratives=True)
+    pd.testing.assert_frame_equal(narrative_generator.generate_alerts(transactions, without_unusual), expected)
+
+    # With it, the alerts are those of alert_generator
+    alerts = narrative_generator.generate_alerts(transactions, CONFIGS[config])
+    expected = reference_alerts(transactions, CONFIGS[config])
+    pd.testing.assert_frame_equal(alerts.drop(columns="narrative", errors="ignore"), expected)
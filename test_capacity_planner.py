@@ -0,0 +1,43 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+import capacity_planner
+
+START_DATE = datetime(2024, 1, 1, 13, 30)
+END_DATE = START_DATE + timedelta(days=30)
+MAX_PER_CARD = 1000
+MAX_PER_CARD_PER_DAY = 2
+MAX_PER_CUSTOMER_PER_DAY = 3
+
+
+# Plans close to the capacity the quota check reports must still be placed within every limit
+@pytest.mark.parametrize("fraction", [0.8, 0.9, 1.0])
+@pytest.mark.parametrize("seed", range(20))
+def test_plan_transactions_near_capacity(fraction, seed):
+    rng = np.random.default_rng(seed)
+    card_counts = rng.integers(1, 4, 20)
+    _, customer_capacity = capacity_planner.plan_capacity(
+        card_counts, capacity_planner._num_dates(START_DATE, END_DATE), MAX_PER_CARD,
+        MAX_PER_CARD_PER_DAY, MAX_PER_CUSTOMER_PER_DAY
+    )
+    n = int(customer_capacity.sum() * fraction)
+
+    customer_idx, card_idx, date_times = capacity_planner.plan_transactions(
+        n, card_counts, START_DATE, END_DATE, MAX_PER_CARD, MAX_PER_CARD_PER_DAY, MAX_PER_CUSTOMER_PER_DAY, rng
+    )
+
+    assert len(date_times) == n
+    assert (date_times >= np.datetime64(START_DATE)).all() and (date_times <= np.datetime64(END_DATE)).all()
+    days = date_times.astype("datetime64[D]").tolist()
+    assert max(Counter(zip(card_idx.tolist(), days)).values()) <= MAX_PER_CARD_PER_DAY
+    assert max(Counter(zip(customer_idx.tolist(), days)).values()) <= MAX_PER_CUSTOMER_PER_DAY
+
+
+def test_plan_transactions_over_capacity():
+    card_counts = np.ones(2, dtype=np.int64)
+    with pytest.raises(ValueError):
+        capacity_planner.plan_transactions(
+            1000, card_counts, START_DATE, END_DATE, MAX_PER_CARD, MAX_PER_CARD_PER_DAY, MAX_PER_CUSTOMER_PER_DAY,
+            np.random.default_rng(0)
+        )
@@ -0,0 +1,194 @@
+import os
+import random
+import numpy as np
+from faker import Faker
+
+# Pre-sampled Faker values, so generators can draw names, cities, user agents, ... by index
+# instead of calling Faker for every row.
+#
+# Each provider is sampled once per (locale, seed, pool size) and stored as .npy files in a
+# cache directory: strings as one UTF-8 byte buffer plus offsets, numbers as a float array.
+# Later runs memory-map those files instead of calling Faker again. The cache is kept under a
+# size budget by deleting the least recently used pools.
+
+DEFAULT_POOL_SIZE = 50_000
+DEFAULT_CACHE_DIR = os.environ.get(
+    "FAKER_POOL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "data_generator", "faker_pools")
+)
+DEFAULT_CACHE_BUDGET = 256 * 1024 * 1024  # bytes
+
+# Providers that can be pooled, with how a single value is sampled
+PROVIDERS = {
+    "name": lambda fake: fake.name(),
+    "company": lambda fake: fake.company(),
+    "city": lambda fake: fake.city(),
+    "state_abbr": lambda fake: fake.state_abbr(),
+    "country": lambda fake: fake.country(),
+    "country_code": lambda fake: fake.country_code(),
+    "ipv4": lambda fake: fake.ipv4(),
+    "user_agent": lambda fake: fake.user_agent(),
+    "swift": lambda fake: fake.swift(),
+    "sentence": lambda fake: fake.sentence(nb_words=6),
+    "credit_card_expire": lambda fake: fake.credit_card_expire(),
+    "latitude": lambda fake: float(fake.latitude()),
+    "longitude": lambda fake: float(fake.longitude()),
+}
+NUMERIC_PROVIDERS = {"latitude", "longitude"}
+
+
+class ValuePool:
+    """
+    Sampled values of one provider, backed by (memory-mapped) arrays.
+
+    Indexing with an integer returns one value; indexing with an integer array returns an
+    object array, so a pool can be used wherever batch_generator expects a value array.
+    """
+
+    def __init__(self, data, offsets=None):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.data) if self.offsets is None else len(self.offsets) - 1
+
+    def _value(self, i):
+        if self.offsets is None:
+            return float(self.data[i])
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __getitem__(self, index):
+        if np.ndim(index) == 0:
+            return self._value(index)
+        index = np.asarray(index)
+        if self.offsets is None:
+            return self.data[index].astype(object)
+        starts = self.offsets[index].tolist()
+        ends = self.offsets[index + 1].tolist()
+        return np.array([self.data[s:e].tobytes().decode("utf-8") for s, e in zip(starts, ends)], dtype=object)
+
+    def sample(self, rng=random):
+        """One value drawn with a random.Random (the global one by default, so seeding it seeds the draws)."""
+        return self._value(rng.randrange(len(self)))
+
+    def draw(self, rng, n):
+        """n values drawn with a numpy Generator."""
+        return self[rng.integers(0, len(self), n)]
+
+
+def _encode(values):
+    """Pack strings into one UTF-8 byte buffer and the offsets of each value in it."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _save(path, array):
+    """Write an .npy file atomically, so concurrent workers never read a partial pool."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class PoolCache:
+    """
+    Faker value pools for one locale and seed, cached on disk.
+
+    Args:
+        locale (str): Faker locale of the values.
+        seed (int, optional): Seed of the sampled values; the same seed always gives the same pools.
+        size (int): Number of values sampled per provider.
+        cache_dir (str, optional): Directory of the cached pools; None keeps the pools in memory only.
+        budget_bytes (int): Maximum size of the cache directory. Least recently used pools
+            are deleted when it is exceeded.
+    """
+
+    def __init__(self, locale="en_US", seed=None, size=DEFAULT_POOL_SIZE, cache_dir=DEFAULT_CACHE_DIR,
+                 budget_bytes=DEFAULT_CACHE_BUDGET):
+        self.locale = locale
+        self.seed = 0 if seed is None else seed
+        self.size = size
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self._pools = {}
+
+    def __getitem__(self, name):
+        pool = self._pools.get(name)
+        if pool is None:
+            if name not in PROVIDERS:
+                raise KeyError(f"No pooled Faker provider named {name!r}")
+            pool = self._load(name) if self.cache_dir is not None else None
+            built = pool is None
+            if built:
+                pool = self._build(name)
+            self._pools[name] = pool
+            if built and self.cache_dir is not None:
+                self.evict()
+        return pool
+
+    def _paths(self, name):
+        key = f"{self.locale}-{self.seed}-{self.size}-{name}"
+        return os.path.join(self.cache_dir, f"{key}.data.npy"), os.path.join(self.cache_dir, f"{key}.offsets.npy")
+
+    def _load(self, name):
+        data_path, offsets_path = self._paths(name)
+        numeric = name in NUMERIC_PROVIDERS
+        try:
+            data = np.load(data_path, mmap_mode="r")
+            offsets = None if numeric else np.load(offsets_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        # Touch the files so eviction sees them as recently used
+        for path in [data_path] if numeric else [data_path, offsets_path]:
+            os.utime(path)
+        return ValuePool(data, offsets)
+
+    def _build(self, name):
+        fake = Faker(self.locale)
+        fake.seed_instance(f"{self.seed}-{name}")
+        values = [PROVIDERS[name](fake) for _ in range(self.size)]
+        if name in NUMERIC_PROVIDERS:
+            data, offsets = np.array(values, dtype=np.float64), None
+        else:
+            data, offsets = _encode(values)
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            data_path, offsets_path = self._paths(name)
+            if offsets is not None:
+                _save(offsets_path, offsets)
+            _save(data_path, data)
+        return ValuePool(data, offsets)
+
+    def evict(self):
+        """Delete the least recently used cached pools until the cache fits the budget."""
+        in_use = {path for name in self._pools for path in self._paths(name)}
+        pools = {}
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                key = entry.name.rsplit(".", 2)[0]
+                stat = entry.stat()
+                last_used, size, paths = pools.get(key, (0.0, 0, []))
+                pools[key] = (max(last_used, stat.st_mtime), size + stat.st_size, paths + [entry.path])
+        total = sum(size for _, size, _ in pools.values())
+        for _, size, paths in sorted(pools.values()):
+            if total <= self.budget_bytes:
+                break
+            if in_use.intersection(paths):
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """Forget the loaded pools and delete this locale and seed's cached files."""
+        if self.cache_dir is not None:
+            for name in PROVIDERS:
+                for path in self._paths(name):
+                    if os.path.exists(path):
+                        os.remove(path)
+        self._pools = {}